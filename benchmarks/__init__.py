@@ -0,0 +1,108 @@
+"""
+Benchmarks for receipt_processor.
+
+Each module is runnable with `python -m benchmarks.<module>` from the repository root and
+prints its results as JSON. Benchmarks run against a throwaway SQLite database, never db.sqlite3.
+"""
+from pathlib import Path
+import json
+import logging
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def setup_django(settings_module='receipt_processor.settings'):
+    """
+    Configure Django for a standalone benchmark process.
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+    from django.test.utils import setup_test_environment
+    setup_test_environment()
+
+    # Failed requests are counted by the benchmarks, their tracebacks would only drown the results
+    logging.getLogger('django.request').setLevel(logging.CRITICAL)
+
+
+def create_database(alias='default'):
+    """
+    Create and migrate a file backed test database for `alias`, returning a callable that destroys it.
+
+    A file is used instead of SQLite's shared in-memory database so concurrent benchmarks exercise
+    the same locking as a real deployment.
+    """
+    from django.db import connections
+
+    connection = connections[alias]
+    directory = tempfile.mkdtemp(prefix='receipt-benchmark-')
+    connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(directory, f'{alias}.sqlite3')
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+
+    def destroy():
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        shutil.rmtree(directory, ignore_errors=True)  # also removes WAL and shared memory files
+
+    return destroy
+
+
+def percentile(values, pct):
+    """
+    Nearest-rank percentile of `values`.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[rank]
+
+
+def summarize(latencies, elapsed, errors=0):
+    """
+    Throughput and latency percentiles, in milliseconds, for a list of per-request latencies in seconds.
+    """
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'elapsed_seconds': round(elapsed, 4),
+        'requests_per_second': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3) if latencies else None,
+    }
+
+
+def revision():
+    """
+    The git commit being benchmarked, when it can be found.
+    """
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=Path(__file__).resolve().parent.parent,
+            check=True, capture_output=True, text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def emit(name, results, output=None):
+    """
+    Print benchmark results as a single JSON document, or write them to the file `output`.
+    """
+    document = json.dumps({
+        'benchmark': name,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'revision': revision(),
+        'python': sys.version.split()[0],
+        'results': results,
+    }, indent=2, default=str)
+    if output:
+        Path(output).write_text(document + '\n')
+    else:
+        sys.stdout.write(document + '\n')
@@ -0,0 +1,41 @@
+"""
+Run the scoring, persistence and HTTP load benchmarks and report them as one JSON document.
+
+    python -m benchmarks --output results.json
+
+Compare the documents of two releases to spot regressions.
+"""
+import argparse
+
+from benchmarks import create_database, emit, load, persistence, scoring, setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--quick', action='store_true', help='Smaller runs, for a fast sanity check')
+    parser.add_argument('--settings', default='receipt_processor.settings', help='Django settings module to load')
+    parser.add_argument('--output', help='Write the JSON results to this file instead of stdout')
+    args = parser.parse_args()
+
+    setup_django(args.settings)
+    destroy_database = create_database()
+    try:
+        if args.quick:
+            results = {
+                'scoring': scoring.run(receipts=1000, repeat=2),
+                'persistence': persistence.run(receipts=5, item_counts=(1, 10, 100)),
+                'load': load.run(clients=4, receipts=200, reads=2),
+            }
+        else:
+            results = {
+                'scoring': scoring.run(),
+                'persistence': persistence.run(),
+                'load': load.run(),
+            }
+    finally:
+        destroy_database()
+    emit('suite', {'parameters': vars(args), **results}, output=args.output)
+
+
+if __name__ == '__main__':
+    main()
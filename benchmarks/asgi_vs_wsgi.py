@@ -0,0 +1,101 @@
+"""
+Compare WSGI and ASGI serving of the receipt endpoints on the same machine.
+
+WSGI is modelled as a threaded server: `--threads` worker threads drive django.test.Client, so
+clients beyond that number queue for a thread. ASGI runs every client as a task on a single
+event loop through django.test.AsyncClient. Each client submits a receipt, reads its points,
+then waits `--client-delay` seconds before its next request, like a slow mobile client.
+
+    python -m benchmarks.asgi_vs_wsgi --clients 200 --requests 5
+"""
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks import create_database, emit, setup_django, summarize
+
+
+EXAMPLE_RECEIPT = (Path(__file__).resolve().parent.parent / 'examples' / 'morning-receipt.json').read_text()
+
+
+def run_wsgi(clients, requests, threads, client_delay):
+    from django.test import Client
+
+    def client_session(_):
+        client = Client()
+        latencies, errors = [], 0
+        for _ in range(requests):
+            started = time.perf_counter()
+            try:
+                response = client.post('/receipts/process', EXAMPLE_RECEIPT, content_type='application/json')
+                client.get(f'/receipts/{response.data["id"]}/points/')
+                latencies.append(time.perf_counter() - started)
+            except Exception:
+                errors += 1
+            time.sleep(client_delay)
+        return latencies, errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        sessions = list(executor.map(client_session, range(clients)))
+    return _summarize_sessions(sessions, time.perf_counter() - started)
+
+
+def run_asgi(clients, requests, client_delay, prefix):
+    from django.test import AsyncClient
+
+    async def client_session():
+        client = AsyncClient()
+        latencies, errors = [], 0
+        for _ in range(requests):
+            started = time.perf_counter()
+            try:
+                response = await client.post(f'{prefix}/receipts/process', EXAMPLE_RECEIPT, content_type='application/json')
+                await client.get(f'{prefix}/receipts/{json.loads(response.content)["id"]}/points/')
+                latencies.append(time.perf_counter() - started)
+            except Exception:
+                errors += 1
+            await asyncio.sleep(client_delay)
+        return latencies, errors
+
+    async def run_all():
+        return await asyncio.gather(*(client_session() for _ in range(clients)))
+
+    started = time.perf_counter()
+    sessions = asyncio.run(run_all())
+    return _summarize_sessions(sessions, time.perf_counter() - started)
+
+
+def _summarize_sessions(sessions, elapsed):
+    latencies = [latency for session_latencies, _ in sessions for latency in session_latencies]
+    return summarize(latencies, elapsed, errors=sum(errors for _, errors in sessions))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=100, help='Concurrent clients')
+    parser.add_argument('--requests', type=int, default=5, help='Requests per client')
+    parser.add_argument('--threads', type=int, default=8, help='WSGI worker threads')
+    parser.add_argument('--client-delay', type=float, default=0.05, help='Seconds each client waits between requests')
+    parser.add_argument('--output', help='Write the JSON results to this file instead of stdout')
+    args = parser.parse_args()
+
+    setup_django()
+    destroy_database = create_database()
+    try:
+        results = {
+            'wsgi_sync_views': run_wsgi(args.clients, args.requests, args.threads, args.client_delay),
+            'asgi_sync_views': run_asgi(args.clients, args.requests, args.client_delay, prefix=''),
+            'asgi_async_views': run_asgi(args.clients, args.requests, args.client_delay, prefix='/async'),
+        }
+    finally:
+        destroy_database()
+
+    emit('asgi_vs_wsgi', {'parameters': vars(args), **results}, output=args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+In-process HTTP load generator for POST /receipts/process and GET /receipts/{id}/points.
+
+Requests go through the full Django stack (middleware, URL routing, DRF) via django.test.Client,
+from `--clients` threads at once, without a network in between.
+
+    python -m benchmarks.load --clients 8 --receipts 2000 --reads 4
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import json
+import time
+
+from benchmarks import create_database, emit, setup_django, summarize
+from benchmarks.synthetic import synthetic_receipts
+
+
+def run_clients(clients, work, request):
+    """
+    Split `work` across `clients` threads, each calling `request(client, entry)` for its share.
+
+    Returns the summary of the per-request latencies and the request results.
+    """
+    from django.test import Client
+
+    def session(n):
+        client = Client()
+        latencies, results, errors = [], [], 0
+        for entry in work[n::clients]:
+            started = time.perf_counter()
+            try:
+                results.append(request(client, entry))
+                latencies.append(time.perf_counter() - started)
+            except Exception:
+                errors += 1
+        return latencies, results, errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        sessions = list(executor.map(session, range(clients)))
+    elapsed = time.perf_counter() - started
+
+    latencies = [latency for session_latencies, _, _ in sessions for latency in session_latencies]
+    results = [result for _, session_results, _ in sessions for result in session_results]
+    return summarize(latencies, elapsed, errors=sum(errors for _, _, errors in sessions)), results
+
+
+def run(clients=8, receipts=2000, reads=4):
+    payloads = [json.dumps(payload) for payload in synthetic_receipts(receipts)]
+
+    def process(client, payload):
+        response = client.post('/receipts/process', payload, content_type='application/json')
+        if response.status_code != 200:
+            raise ValueError(response.status_code)
+        return response.data['id']
+
+    def points(client, receipt_id):
+        response = client.get(f'/receipts/{receipt_id}/points/')
+        if response.status_code != 200:
+            raise ValueError(response.status_code)
+
+    process_summary, receipt_ids = run_clients(clients, payloads, process)
+    points_summary, _ = run_clients(clients, receipt_ids * reads, points)
+    return {
+        'process': process_summary,
+        'points': points_summary,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=8, help='Concurrent client threads')
+    parser.add_argument('--receipts', type=int, default=2000, help='Receipts submitted')
+    parser.add_argument('--reads', type=int, default=4, help='Points reads per submitted receipt')
+    parser.add_argument('--settings', default='receipt_processor.settings', help='Django settings module to load')
+    parser.add_argument('--output', help='Write the JSON results to this file instead of stdout')
+    args = parser.parse_args()
+
+    setup_django(args.settings)
+    destroy_database = create_database()
+    try:
+        results = run(args.clients, args.receipts, args.reads)
+    finally:
+        destroy_database()
+    emit('load', {'parameters': vars(args), **results}, output=args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+ORM-level benchmarks of storing receipts with 1, 10, 100 and 1000 items.
+
+Reports the time and the number of queries to store one receipt, and to store a batch of them
+in one transaction.
+
+    python -m benchmarks.persistence --receipts 50
+"""
+import argparse
+import time
+
+from benchmarks import create_database, emit, setup_django
+from benchmarks.synthetic import synthetic_receipts
+
+
+ITEM_COUNTS = (1, 10, 100, 1000)
+
+
+def run(receipts=50, item_counts=ITEM_COUNTS):
+    from django.db import connection
+    from django.test import override_settings
+    from django.test.utils import CaptureQueriesContext
+
+    from receipt_processor.ingest import parse_receipt, store_receipts
+
+    results = {}
+    for item_count in item_counts:
+        # Lift the request item limit, this measures the ORM and not validation
+        with override_settings(RECEIPT_MAX_ITEMS=item_count):
+            parsed_receipts = [parse_receipt(payload) for payload in synthetic_receipts(receipts * 2, item_count, seed=item_count)]
+        one_by_one, batched = parsed_receipts[:receipts], parsed_receipts[receipts:]
+
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for parsed in one_by_one:
+                store_receipts([parsed])
+            single_elapsed = time.perf_counter() - started
+        single_queries = len(queries)
+
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            store_receipts(batched)
+            batch_elapsed = time.perf_counter() - started
+
+        results[f'{item_count}_items'] = {
+            'single': {
+                'milliseconds_per_receipt': round(single_elapsed / receipts * 1000, 3),
+                'queries_per_receipt': round(single_queries / receipts, 2),
+            },
+            'batch': {
+                'receipts': receipts,
+                'milliseconds_per_receipt': round(batch_elapsed / receipts * 1000, 3),
+                'queries': len(queries),
+            },
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--receipts', type=int, default=50, help='Receipts stored per item count and mode')
+    parser.add_argument('--output', help='Write the JSON results to this file instead of stdout')
+    args = parser.parse_args()
+
+    setup_django()
+    destroy_database = create_database()
+    try:
+        results = run(args.receipts)
+    finally:
+        destroy_database()
+    emit('persistence', {'parameters': vars(args), **results}, output=args.output)
+
+
+if __name__ == '__main__':
+    main()
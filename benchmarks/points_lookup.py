@@ -0,0 +1,99 @@
+"""
+Micro-benchmark of GET /receipts/{id}/points: the DRF view against the lean view.
+
+Each view is called directly with a prepared request, without middleware, with the points cache
+disabled so every call reads the database, and with DEBUG off as in production. The bare points
+query on a reused DB-API cursor is timed as well, so the overhead each view adds on top of the
+database call can be read off.
+
+    python -m benchmarks.points_lookup --receipts 1000 --lookups 20000
+"""
+import argparse
+import random
+import time
+import uuid
+
+from benchmarks import create_database, emit, setup_django
+from benchmarks.synthetic import synthetic_receipts
+
+
+def time_calls(func, args, repeat):
+    """
+    Best mean time, in microseconds, of calling `func` once per entry of `args`, over `repeat` runs.
+    """
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for arg in args:
+            func(arg)
+        elapsed = (time.perf_counter() - started) / len(args) * 1e6
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(receipts=1000, lookups=20000, repeat=5):
+    from django.db import connection
+    from django.test import RequestFactory, override_settings
+
+    from receipt_processor.ingest import parse_receipt, store_receipts
+    from receipt_processor.lean_views import lean_points, points_statement
+    from receipt_processor.models import Receipt
+    from receipt_processor.views import ReceiptPointsView
+
+    stored = store_receipts([parse_receipt(payload) for payload in synthetic_receipts(receipts)])
+    receipt_ids = [str(receipt_id) for receipt_id, _ in stored]
+    sample = random.Random(0).choices(receipt_ids, k=lookups)
+    factory = RequestFactory()
+    requests = [(factory.get(f'/receipts/{receipt_id}/points/'), receipt_id) for receipt_id in sample]
+    drf_view = ReceiptPointsView.as_view()
+
+    def call_drf(request):
+        response = drf_view(request[0], receipt_id=request[1])
+        response.render()
+        return response
+
+    def call_lean(request):
+        return lean_points(request[0], receipt_id=request[1])
+
+    def call_malformed(request):
+        return lean_points(request[0], receipt_id='not-a-uuid')
+
+    db_ids = [Receipt._meta.pk.get_db_prep_value(uuid.UUID(receipt_id), connection) for receipt_id in sample]
+
+    results = {}
+    with override_settings(DEBUG=False, RECEIPT_POINTS_CACHE={'BACKEND': 'lru', 'MAX_SIZE': 0}):
+        for request in requests[:100]:  # warm up connections, cursors and statement caches
+            call_drf(request)
+            call_lean(request)
+        query = time_calls(points_statement(connection).fetch, db_ids, repeat)
+        results['points_query'] = {'microseconds_per_request': round(query, 3)}
+        for name, func in (('drf_view', call_drf), ('lean_view', call_lean)):
+            microseconds = time_calls(func, requests, repeat)
+            results[name] = {
+                'microseconds_per_request': round(microseconds, 3),
+                'overhead_microseconds': round(microseconds - query, 3),
+            }
+        results['lean_view_malformed_id'] = {'microseconds_per_request': round(time_calls(call_malformed, requests, repeat), 3)}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--receipts', type=int, default=1000, help='Receipts stored before the lookups')
+    parser.add_argument('--lookups', type=int, default=20000, help='Lookups per run')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs, the best one is reported')
+    parser.add_argument('--settings', default='receipt_processor.settings', help='Django settings module to load')
+    parser.add_argument('--output', help='Write the JSON results to this file instead of stdout')
+    args = parser.parse_args()
+
+    setup_django(args.settings)
+    destroy_database = create_database()
+    try:
+        results = run(args.receipts, args.lookups, args.repeat)
+    finally:
+        destroy_database()
+    emit('points_lookup', {'parameters': vars(args), **results}, output=args.output)
+
+
+if __name__ == '__main__':
+    main()
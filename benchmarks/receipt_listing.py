@@ -0,0 +1,92 @@
+"""
+Latency of GET /receipts pages at increasing depth: keyset (cursor) pagination against OFFSET.
+
+Receipts are stored, then the cursor of every page is collected by walking the listing once. For
+pages at the start, the middle and the end it times the page query with the cursor condition and
+with OFFSET instead, and the whole view (page query, items prefetch and rendering), with DEBUG off.
+
+    python -m benchmarks.receipt_listing --receipts 100000 --page-size 50
+"""
+import argparse
+import time
+
+from benchmarks import create_database, emit, setup_django
+from benchmarks.synthetic import synthetic_receipts
+
+
+def best_of(func, repeat):
+    """
+    Best time, in milliseconds, of calling `func` over `repeat` calls.
+    """
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(receipts=100000, page_size=50, repeat=20):
+    from django.test import RequestFactory, override_settings
+
+    from receipt_processor.ingest import parse_receipt, store_receipts
+    from receipt_processor.retrieval import list_receipts, page_queryset
+    from receipt_processor.views import ReceiptListView
+
+    payloads = synthetic_receipts(receipts)
+    for chunk_start in range(0, receipts, 5000):
+        store_receipts([parse_receipt(payload) for payload in payloads[chunk_start:chunk_start + 5000]])
+
+    cursors = [None]
+    while True:
+        _, cursor = list_receipts(cursor=cursors[-1], limit=page_size)
+        if cursor is None:
+            break
+        cursors.append(cursor)
+
+    factory = RequestFactory()
+    view = ReceiptListView.as_view()
+
+    def view_page(cursor):
+        request = factory.get('/receipts', {'limit': page_size, **({'cursor': cursor} if cursor else {})})
+        view(request).render()
+
+    def keyset_query(cursor):
+        return list(page_queryset(cursor=cursor)[:page_size + 1])
+
+    def offset_query(page_number):
+        return list(page_queryset()[page_number * page_size:(page_number + 1) * page_size + 1])
+
+    results = {}
+    with override_settings(DEBUG=False):
+        for depth, page_number in (('first', 0), ('middle', len(cursors) // 2), ('last', len(cursors) - 1)):
+            results[f'{depth}_page'] = {
+                'page': page_number,
+                'keyset_query_ms': round(best_of(lambda: keyset_query(cursors[page_number]), repeat), 3),
+                'offset_query_ms': round(best_of(lambda: offset_query(page_number), repeat), 3),
+                'view_ms': round(best_of(lambda: view_page(cursors[page_number]), repeat), 3),
+            }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--receipts', type=int, default=100000, help='Receipts stored before paging')
+    parser.add_argument('--page-size', type=int, default=50, help='Receipts per page')
+    parser.add_argument('--repeat', type=int, default=20, help='Fetches per page, the best one is reported')
+    parser.add_argument('--settings', default='receipt_processor.settings', help='Django settings module to load')
+    parser.add_argument('--output', help='Write the JSON results to this file instead of stdout')
+    args = parser.parse_args()
+
+    setup_django(args.settings)
+    destroy_database = create_database()
+    try:
+        results = run(args.receipts, args.page_size, args.repeat)
+    finally:
+        destroy_database()
+    emit('receipt_listing', {'parameters': vars(args), **results}, output=args.output)
+
+
+if __name__ == '__main__':
+    main()
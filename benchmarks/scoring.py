@@ -0,0 +1,126 @@
+"""
+Micro-benchmarks of point scoring, without any database or HTTP work.
+
+calculate_points is timed with the retailer points cache of scoring.py warm, as in a worker
+serving steady traffic, and with it bypassed (calculate_points_uncached). Use --items to score
+large receipts, where the per-item work dominates.
+
+compiled_rules scores with the rules compiled from their declarative form (rules.py), which is
+how receipts are scored in the service; it should be within a few percent of calculate_points.
+compiled_rules_with_variants adds promotional rules for --variants retailers that are not in the
+traffic, the cost of the extra dispatch.
+
+    python -m benchmarks.scoring --receipts 10000 --items 100
+"""
+from unittest import mock
+import argparse
+import time
+
+from benchmarks import emit, setup_django
+from benchmarks.synthetic import synthetic_receipts
+
+
+def best_of(repeat, func):
+    """
+    Best wall time, in seconds, of `repeat` calls to `func`.
+    """
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def run(receipts=10000, repeat=5, items=None, variants=50):
+    import numpy as np
+
+    from receipt_processor import scoring
+    from receipt_processor.ingest import parse_receipt
+    from receipt_processor.rules import compile_built_in, compile_rule_set, rule_set_definition
+    from receipt_processor.scoring import LATEST_RULES, calculate_points, calculate_points_batch, description_points_batch
+
+    payloads = synthetic_receipts(receipts, item_count=items)
+    parsed_receipts = [parse_receipt(payload) for payload in payloads]
+    scoring_args = [
+        (parsed.retailer, parsed.purchase_date, parsed.purchase_time, parsed.total_cents, parsed.items)
+        for parsed in parsed_receipts
+    ]
+
+    receipt_index = np.repeat(np.arange(receipts), [len(parsed.items) for parsed in parsed_receipts])
+    description_lengths = np.array([len(description.strip()) for parsed in parsed_receipts for description, _ in parsed.items])
+    prices = np.array([price for parsed in parsed_receipts for _, price in parsed.items])
+    columns = (
+        np.array([sum(ch.isalnum() for ch in parsed.retailer) for parsed in parsed_receipts]),
+        np.array([parsed.total_cents for parsed in parsed_receipts]),
+        np.array([parsed.purchase_date.day for parsed in parsed_receipts]),
+        np.array([parsed.purchase_time.hour * 60 + parsed.purchase_time.minute for parsed in parsed_receipts]),
+        np.array([len(parsed.items) for parsed in parsed_receipts]),
+    )
+
+    def score_each():
+        for args in scoring_args:
+            calculate_points(*args)
+
+    compiled_score = compile_built_in(LATEST_RULES).score
+    promotion = [{'rule': 'odd_day', 'points': 100}]
+    variant_score = compile_rule_set(LATEST_RULES.version, rule_set_definition(LATEST_RULES), {
+        f'Promoted retailer {number}': promotion for number in range(variants)
+    }).score
+
+    def score_compiled():
+        for args in scoring_args:
+            compiled_score(*args)
+
+    def score_variants():
+        for args in scoring_args:
+            variant_score(*args)
+
+    def score_each_uncached():
+        with mock.patch.object(scoring, 'retailer_points', scoring.retailer_points.__wrapped__):
+            score_each()
+
+    def parse_each():
+        for payload in payloads:
+            parse_receipt(payload)
+
+    def score_batch():
+        calculate_points_batch(*columns, description_points_batch(receipt_index, description_lengths, prices, receipts))
+
+    results = {}
+    scoring.clear_scoring_caches()
+    benchmarks = (
+        ('calculate_points', score_each),
+        ('calculate_points_uncached', score_each_uncached),
+        ('compiled_rules', score_compiled),
+        ('compiled_rules_with_variants', score_variants),
+        ('parse_receipt', parse_each),
+        ('calculate_points_batch', score_batch),
+    )
+    for name, func in benchmarks:
+        elapsed = best_of(repeat, func)
+        results[name] = {
+            'receipts': receipts,
+            'seconds': round(elapsed, 6),
+            'microseconds_per_receipt': round(elapsed / receipts * 1e6, 3),
+            'receipts_per_second': round(receipts / elapsed, 1),
+        }
+    results['retailer_cache'] = scoring.scoring_cache_stats()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--receipts', type=int, default=10000, help='Receipts scored per run')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs, the best one is reported')
+    parser.add_argument('--items', type=int, help='Items per receipt (default: 1 to 10)')
+    parser.add_argument('--variants', type=int, default=50, help='Retailers with promotional rules in compiled_rules_with_variants')
+    parser.add_argument('--output', help='Write the JSON results to this file instead of stdout')
+    args = parser.parse_args()
+
+    setup_django()
+    emit('scoring', {'parameters': vars(args), **run(args.receipts, args.repeat, args.items, args.variants)}, output=args.output)
+
+
+if __name__ == '__main__':
+    main()
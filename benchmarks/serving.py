@@ -0,0 +1,144 @@
+"""
+Requests per second of the production server (gunicorn.conf.py) as worker processes are added.
+
+For each worker count a gunicorn master is started on a local port with the production settings
+profile and a throwaway database, and `--clients` client processes drive it over keep-alive HTTP
+connections for `--duration` seconds. Each client submits a receipt and then reads its points
+`--reads` times. With one worker the server is bound to one core; throughput should grow with the
+worker count until it reaches the CPUs available (reported as `cpus`) or the SQLite write lock.
+
+    python -m benchmarks.serving --workers 1 2 4 8 --clients 16 --duration 10
+"""
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks import emit, summarize
+from benchmarks.synthetic import example_receipts, synthetic_receipt
+
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def wait_for_server(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'The server did not start listening on port {port}')
+
+
+def client_session(port, duration, reads, seed):
+    """
+    One client process: submit receipts and read their points until `duration` seconds have passed.
+    Returns the latency of every request, in seconds, and the number of failed requests.
+    """
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    latencies, errors = [], 0
+    rng = random.Random(seed)
+    examples = example_receipts()
+    deadline = time.perf_counter() + duration
+
+    def request(method, path, body=None):
+        started = time.perf_counter()
+        connection.request(method, path, body=body, headers={'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        content = response.read()
+        latencies.append(time.perf_counter() - started)
+        if response.status != 200:
+            raise ValueError(f'{method} {path} answered {response.status}')
+        return json.loads(content)
+
+    while time.perf_counter() < deadline:
+        try:
+            receipt_id = request('POST', '/receipts/process', json.dumps(synthetic_receipt(rng, rng.randint(1, 10), examples)))['id']
+            for _ in range(reads):
+                request('GET', f'/receipts/{receipt_id}/points/')
+        except (OSError, ValueError, http.client.HTTPException):
+            errors += 1
+            connection.close()
+            connection = http.client.HTTPConnection('127.0.0.1', port)
+    connection.close()
+    return latencies, errors
+
+
+def run_server(workers, threads, clients, duration, reads, environ):
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'receipt_processor.wsgi'],
+        cwd=BASE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        env={**environ, 'WEB_CONCURRENCY': str(workers), 'GUNICORN_THREADS': str(threads),
+             'GUNICORN_BIND': f'127.0.0.1:{port}'},
+    )
+    try:
+        wait_for_server(port)
+        started = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=clients) as executor:
+            sessions = list(executor.map(
+                client_session, [port] * clients, [duration] * clients, [reads] * clients, range(clients),
+            ))
+        elapsed = time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait()
+    latencies = [latency for session_latencies, _ in sessions for latency in session_latencies]
+    return summarize(latencies, elapsed, errors=sum(errors for _, errors in sessions))
+
+
+def main():
+    from receipt_processor.serving import available_cpus
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', help='Worker counts to measure (default: 1, 2, 4, ... up to the CPUs)')
+    parser.add_argument('--threads', type=int, default=2, help='Threads per worker')
+    parser.add_argument('--clients', type=int, default=16, help='Concurrent client processes')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds each worker count is driven for')
+    parser.add_argument('--reads', type=int, default=4, help='Points lookups after each submitted receipt')
+    parser.add_argument('--output', help='Write the JSON results to this file instead of stdout')
+    args = parser.parse_args()
+
+    cpus = available_cpus()
+    worker_counts = args.workers or sorted({1, *(2 ** power for power in range(1, cpus.bit_length())), cpus})
+
+    directory = tempfile.mkdtemp(prefix='receipt-benchmark-')
+    try:
+        environ = {
+            **os.environ,
+            'DJANGO_SETTINGS_MODULE': 'receipt_processor.settings_production',
+            'DJANGO_SECRET_KEY': 'benchmark',
+            'DJANGO_DATABASE_PATH': os.path.join(directory, 'db.sqlite3'),
+            'DJANGO_LOG_LEVEL': 'WARNING',
+        }
+        subprocess.run([sys.executable, 'manage.py', 'migrate', '--verbosity', '0'],
+                       cwd=BASE_DIR, env=environ, check=True, capture_output=True)
+        results = {
+            f'{workers}_workers': run_server(workers, args.threads, args.clients, args.duration, args.reads, environ)
+            for workers in worker_counts
+        }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    emit('serving', {'parameters': {**vars(args), 'cpus': cpus}, **results}, output=args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Concurrent POST /receipts/process throughput with the default and the production SQLite profile.
+
+Each profile runs in its own subprocess, since Django settings are process wide, against a fresh
+file backed database. `--threads` writers post distinct receipts at the same time.
+
+    python -m benchmarks.sqlite_tuning --threads 8 --requests 200
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+from benchmarks import create_database, emit, setup_django, summarize
+from benchmarks.synthetic import unique_receipts
+
+
+PROFILES = {
+    'default': 'receipt_processor.settings',
+    'production_sqlite': 'receipt_processor.settings_sqlite',
+}
+
+
+def run_profile(threads, requests):
+    from django.test import Client
+
+    receipts = [json.dumps(receipt) for receipt in unique_receipts(threads * requests)]
+
+    def writer(n):
+        client = Client()
+        latencies, errors = [], 0
+        for receipt in receipts[n::threads]:
+            started = time.perf_counter()
+            try:
+                response = client.post('/receipts/process', receipt, content_type='application/json')
+                if response.status_code != 200:
+                    raise ValueError(response.status_code)
+                latencies.append(time.perf_counter() - started)
+            except Exception:
+                errors += 1
+        return latencies, errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        sessions = list(executor.map(writer, range(threads)))
+    elapsed = time.perf_counter() - started
+
+    latencies = [latency for session_latencies, _ in sessions for latency in session_latencies]
+    return summarize(latencies, elapsed, errors=sum(errors for _, errors in sessions))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8, help='Concurrent writers')
+    parser.add_argument('--requests', type=int, default=100, help='Receipts posted per writer')
+    parser.add_argument('--profile', choices=PROFILES, help=argparse.SUPPRESS)  # used by the subprocesses
+    parser.add_argument('--output', help='Write the JSON results to this file instead of stdout')
+    args = parser.parse_args()
+
+    if args.profile:
+        setup_django(PROFILES[args.profile])
+        destroy_database = create_database()
+        try:
+            json.dump(run_profile(args.threads, args.requests), sys.stdout)
+        finally:
+            destroy_database()
+        return
+
+    results = {}
+    for profile in PROFILES:
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.sqlite_tuning', '--profile', profile,
+             '--threads', str(args.threads), '--requests', str(args.requests)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        results[profile] = json.loads(output)
+
+    emit('sqlite_tuning', {'parameters': {'threads': args.threads, 'requests': args.requests}, **results}, output=args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Cold start of a worker process with the default and the api-only settings profile.
+
+Each run is a fresh subprocess, since imports and Django settings are process wide. It reports the
+time to import Django, the project and its URLconf and build the WSGI application, how many modules
+that loaded, the latency of the first POST /receipts/process and GET /receipts/{id}/points, and the
+steady-state latency of a points request answered from the cache, which is mostly middleware cost.
+Requests are handed straight to the WSGI application, without a server or the test client.
+
+    python -m benchmarks.startup --repeat 5
+"""
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+PROFILES = {
+    'default': 'receipt_processor.settings',
+    'api_only': 'receipt_processor.settings_api',
+}
+
+
+def call(application, method, path, body=b''):
+    """
+    Serve one request with the WSGI `application`, the way a WSGI server would. Returns the response body.
+    """
+    environ = {
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'QUERY_STRING': '',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '8000',
+        'HTTP_HOST': 'localhost',
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.url_scheme': 'http',
+    }
+    statuses = []
+    response = application(environ, lambda status, headers: statuses.append(status))
+    try:
+        content = b''.join(response)
+    finally:
+        response.close()
+    if not statuses[0].startswith('200'):
+        raise ValueError(f'{method} {path} answered {statuses[0]}')
+    return content
+
+
+def measure(settings_module, requests):
+    started = time.perf_counter()
+    os.environ['DJANGO_SETTINGS_MODULE'] = settings_module
+    from django.core.wsgi import get_wsgi_application
+    from django.urls import get_resolver
+    application = get_wsgi_application()
+    get_resolver().url_patterns  # imports the URLconf and the views, as the first request would
+    startup = time.perf_counter() - started
+    modules = len(sys.modules)
+    numpy_loaded = 'numpy' in sys.modules
+
+    from django.conf import settings
+
+    from benchmarks import create_database
+    from benchmarks.synthetic import example_receipts
+
+    settings.ALLOWED_HOSTS = ['localhost']
+    destroy_database = create_database()
+    try:
+        receipt = json.dumps(example_receipts()[0]).encode()
+
+        request_started = time.perf_counter()
+        receipt_id = json.loads(call(application, 'POST', '/receipts/process', receipt))['id']
+        first_post = time.perf_counter() - request_started
+
+        request_started = time.perf_counter()
+        call(application, 'GET', f'/receipts/{receipt_id}/points/')
+        first_get = time.perf_counter() - request_started
+
+        request_started = time.perf_counter()
+        for _ in range(requests):
+            call(application, 'GET', f'/receipts/{receipt_id}/points/')
+        steady_get = (time.perf_counter() - request_started) / requests
+    finally:
+        destroy_database()
+
+    return {
+        'startup_ms': startup * 1000,
+        'modules_loaded': modules,
+        'numpy_loaded': numpy_loaded,
+        'first_post_ms': first_post * 1000,
+        'first_get_ms': first_get * 1000,
+        'cached_get_us': steady_get * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help='Fresh processes per profile, the best of each measure is reported')
+    parser.add_argument('--requests', type=int, default=1000, help='Cached points requests timed per process')
+    parser.add_argument('--profile', choices=PROFILES, help=argparse.SUPPRESS)  # used by the subprocesses
+    parser.add_argument('--output', help='Write the JSON results to this file instead of stdout')
+    args = parser.parse_args()
+
+    if args.profile:
+        json.dump(measure(PROFILES[args.profile], args.requests), sys.stdout)
+        return
+
+    from benchmarks import emit
+
+    results = {}
+    for profile in PROFILES:
+        runs = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            output = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.startup', '--profile', profile, '--requests', str(args.requests)],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            runs.append({**json.loads(output), 'process_ms': (time.perf_counter() - started) * 1000})
+        results[profile] = {
+            name: min(run[name] for run in runs) if isinstance(runs[0][name], float) else runs[0][name]
+            for name in runs[0]
+        }
+        results[profile] = {name: round(value, 3) if isinstance(value, float) else value for name, value in results[profile].items()}
+
+    emit('startup', {'parameters': {'repeat': args.repeat, 'requests': args.requests}, **results}, output=args.output)
+
+
+if __name__ == '__main__':
+    main()
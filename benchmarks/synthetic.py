@@ -0,0 +1,59 @@
+"""
+Synthetic receipts shaped like the ones in examples/.
+"""
+from pathlib import Path
+import copy
+import json
+import random
+
+
+EXAMPLES_DIR = Path(__file__).resolve().parent.parent / 'examples'
+
+
+def example_receipts():
+    return [json.loads(path.read_text()) for path in sorted(EXAMPLES_DIR.glob('*.json'))]
+
+
+def unique_receipts(count, seed=0):
+    """
+    `count` receipts copied from the examples, each with a distinct total so none of them are
+    deduplicated against each other.
+    """
+    rng = random.Random(seed)
+    examples = example_receipts()
+    receipts = []
+    for n in range(count):
+        receipt = copy.deepcopy(rng.choice(examples))
+        receipt['total'] = f'{n // 100}.{n % 100:02d}'
+        receipts.append(receipt)
+    return receipts
+
+
+def synthetic_receipt(rng, item_count, examples=None):
+    """
+    A receipt with `item_count` items, built from the retailers and item descriptions in the examples
+    with randomized prices, date and time.
+    """
+    examples = examples or example_receipts()
+    descriptions = [item['shortDescription'] for example in examples for item in example['items']]
+    items = [
+        {'shortDescription': rng.choice(descriptions), 'price': f'{rng.randint(1, 5000) / 100:.2f}'}
+        for _ in range(item_count)
+    ]
+    total = sum(int(item['price'].replace('.', '')) for item in items)
+    return {
+        'retailer': rng.choice(examples)['retailer'],
+        'purchaseDate': f'2022-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+        'purchaseTime': f'{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}',
+        'items': items,
+        'total': f'{total // 100}.{total % 100:02d}',
+    }
+
+
+def synthetic_receipts(count, item_count=None, seed=0):
+    """
+    `count` synthetic receipts, each with `item_count` items or, when it is None, 1 to 10 items.
+    """
+    rng = random.Random(seed)
+    examples = example_receipts()
+    return [synthetic_receipt(rng, item_count or rng.randint(1, 10), examples) for _ in range(count)]
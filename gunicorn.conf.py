@@ -0,0 +1,67 @@
+"""
+Gunicorn configuration for serving receipt_processor in production, read by start.sh:
+
+    gunicorn receipt_processor.wsgi
+
+Worker and thread counts follow the CPUs the container may use, see receipt_processor/serving.py.
+Every setting can be overridden from the environment:
+
+    WEB_CONCURRENCY             worker processes (default: 2 * available CPUs + 1)
+    GUNICORN_THREADS            threads per worker (default: 2)
+    GUNICORN_WORKER_CLASS       e.g. uvicorn_worker.UvicornWorker to serve receipt_processor.asgi
+    GUNICORN_BIND               address to listen on (default: 0.0.0.0:8000)
+    GUNICORN_TIMEOUT            seconds before a silent worker is killed and replaced (default: 30)
+    GUNICORN_MAX_REQUESTS       requests after which a worker is recycled, 0 never (default: 10000)
+
+Send the master SIGHUP to reload the configuration and the code: new workers are started and the
+old ones finish the requests they are serving before they exit. SIGTERM shuts down the same way,
+within graceful_timeout.
+"""
+import os
+import sys
+
+from receipt_processor.serving import available_cpus, default_workers, env_int
+
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = env_int('WEB_CONCURRENCY', default_workers(available_cpus()))
+threads = env_int('GUNICORN_THREADS', 2)
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread' if threads > 1 else 'sync')
+
+timeout = env_int('GUNICORN_TIMEOUT', 30)
+graceful_timeout = 30
+keepalive = 5
+# Recycling workers bounds the growth of anything a long-lived process accumulates
+max_requests = env_int('GUNICORN_MAX_REQUESTS', 10000)
+max_requests_jitter = max_requests // 10
+
+# The application is imported in each worker rather than in the master, so SIGHUP reloads the code
+preload_app = False
+
+accesslog = '-'
+errorlog = '-'
+
+
+def post_worker_init(worker):
+    # Compile the point rules, and fill the worker's retailer points cache from stored receipts,
+    # before it accepts requests
+    from django.conf import settings
+    from django.db import connections
+    from receipt_processor.ingest import current_rule_set, warm_scoring_caches
+
+    worker.log.info('Scoring with rules version %d', current_rule_set().version)
+
+    if settings.RECEIPT_SCORING_WARM_UP:
+        try:
+            worker.log.info('Scoring cache warmed with %d retailers', warm_scoring_caches())
+        except Exception:
+            worker.log.exception('Could not warm the scoring cache')
+        finally:
+            connections.close_all()
+
+
+def worker_exit(server, worker):
+    # Write out receipts accepted by this worker but still queued for the write-behind writer
+    if 'receipt_processor.writebehind' in sys.modules:
+        from receipt_processor.writebehind import reset_write_behind_queue
+        reset_write_behind_queue()
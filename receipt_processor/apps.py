@@ -1,5 +1,10 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 class ReceiptProcessorConfig(AppConfig):
     name = 'receipt_processor'
     verbose_name = 'Receipt Processor'
+
+    def ready(self):
+        from receipt_processor.sqlite import apply_pragmas
+        connection_created.connect(apply_pragmas, dispatch_uid='receipt_processor.sqlite.apply_pragmas')
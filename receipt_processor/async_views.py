@@ -0,0 +1,87 @@
+"""
+Async views for receipt_processor.
+
+These mirror ReceiptView and ReceiptPointsView for ASGI deployments. They are plain Django
+views (DRF's APIView is sync only), use the async ORM for lookups, and score and store receipts
+in worker threads so the event loop is never blocked on CPU work or on a transaction.
+"""
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from receipt_processor.cache import get_points_cache
+from receipt_processor.ingest import InvalidReceipt, parse_receipt, store_receipts
+from receipt_processor.metrics import phase
+from receipt_processor.models import Receipt
+from receipt_processor.sharding import shard_for_receipt
+from receipt_processor.validation import PayloadTooLarge, limit, read_json_body
+from receipt_processor.writebehind import aliased_points, pending_points
+
+
+@method_decorator(csrf_exempt, name='dispatch')  # APIView does the same for the sync views
+class AsyncReceiptView(View):
+    """
+    Endpoint for storing the data for a receipt.
+
+    Supports:
+        HTTP POST:
+            Creates a new Receipt
+    """
+
+    http_method_names = ['post']
+
+    async def post(self, request):
+        try:
+            with phase('parse'):
+                request_body = read_json_body(request, limit('RECEIPT_MAX_BODY_BYTES'))
+            parsed = await sync_to_async(parse_receipt, thread_sensitive=False)(request_body)
+        except PayloadTooLarge as e:
+            return JsonResponse(str(e), status=413, safe=False)
+        except InvalidReceipt as e:
+            return JsonResponse(str(e), status=400, safe=False)
+        except Exception as e:
+            return JsonResponse(f'Request receipt data invalid, threw the following exception: {e}', status=400, safe=False)
+
+        # The async ORM cannot run inside transaction.atomic(), so the receipt, its items and its
+        # rollups are stored by store_receipts in a worker thread, in one transaction. Repeat
+        # submissions answer with the original receipt.
+        with phase('persist'):
+            [(receipt_id, points)] = await sync_to_async(store_receipts)([parsed])
+
+        await get_points_cache().aset(str(receipt_id), points)
+
+        return JsonResponse({'id': str(receipt_id)}, status=200)
+
+
+class AsyncReceiptPointsView(View):
+    """
+    Endpoint for getting the points for a receipt.
+
+    Supports:
+        HTTP GET:
+            Get the points for a Receipt
+    """
+
+    http_method_names = ['get', 'head']
+
+    async def get(self, request, receipt_id):
+        points_cache = get_points_cache()
+        with phase('cache'):
+            points = await points_cache.aget(receipt_id)
+            if points is None:
+                points = pending_points(receipt_id)
+        if points is None:
+            try:
+                with phase('lookup'):
+                    receipts = Receipt.objects.using(shard_for_receipt(receipt_id))
+                    points = await receipts.filter(id=receipt_id).values_list('points', flat=True).afirst()
+                    if points is None:
+                        points = await sync_to_async(aliased_points)(receipt_id)
+            except Exception as e:
+                return JsonResponse(f'Receipt could not be found for id {receipt_id}, threw the following exception: {e}', status=404, safe=False)
+            if points is None:
+                return JsonResponse(f'Receipt could not be found for id {receipt_id}', status=404, safe=False)
+            await points_cache.aset(receipt_id, points)
+
+        return JsonResponse({'points': points}, status=200)
@@ -0,0 +1,186 @@
+"""
+Read-through cache for receipt points.
+
+The backend is chosen with the RECEIPT_POINTS_CACHE setting:
+    {'BACKEND': 'lru', 'MAX_SIZE': 10000, 'TTL': 3600}
+        A bounded in-process LRU (the default). Entries are dropped `TTL` seconds after they were
+        set (never with None), so points changed by another process, e.g. by recompute_points or
+        apply_retention, stop being served from every worker's cache after at most that long.
+    {'BACKEND': 'django', 'ALIAS': 'default', 'TIMEOUT': None}
+        Any cache configured in CACHES (locmem, file based, database, ...).
+"""
+from collections import OrderedDict
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+DEFAULT_MAX_SIZE = 10000
+DEFAULT_TTL = None
+
+
+class LRUPointsCache:
+    """
+    Bounded in-process mapping of receipt id to points, evicting the least recently used id and
+    dropping ids once they are older than `ttl` seconds.
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, ttl=DEFAULT_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # receipt id -> (points, monotonic expiry time or None)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, receipt_id):
+        with self._lock:
+            entry = self._entries.get(receipt_id)
+            if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+                del self._entries[receipt_id]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(receipt_id)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, receipt_id, points):
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries[receipt_id] = (points, expires_at)
+            self._entries.move_to_end(receipt_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    # Nothing here waits on I/O, so the async views use the same dictionary straight from the event loop
+    async def aget(self, receipt_id):
+        return self.get(receipt_id)
+
+    async def aset(self, receipt_id, points):
+        self.set(receipt_id, points)
+
+    def delete(self, receipt_id):
+        with self._lock:
+            self._entries.pop(receipt_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            'backend': 'lru',
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'ttl_seconds': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+
+class DjangoPointsCache:
+    """
+    Points cache stored in one of the caches configured in CACHES.
+
+    Evictions are handled by the cache backend itself and are not counted here.
+    """
+
+    key_prefix = 'receipt-points:'
+
+    def __init__(self, alias='default', timeout=None):
+        self.alias = alias
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def _cache(self):
+        return caches[self.alias]
+
+    def get(self, receipt_id):
+        return self._count(self._cache.get(self.key_prefix + receipt_id))
+
+    def set(self, receipt_id, points):
+        self._cache.set(self.key_prefix + receipt_id, points, timeout=self.timeout)
+
+    # Cache backends that do I/O, such as the database cache, may not be used from the event loop;
+    # their async methods run the call in a worker thread
+    async def aget(self, receipt_id):
+        return self._count(await self._cache.aget(self.key_prefix + receipt_id))
+
+    async def aset(self, receipt_id, points):
+        await self._cache.aset(self.key_prefix + receipt_id, points, timeout=self.timeout)
+
+    def _count(self, points):
+        if points is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return points
+
+    def delete(self, receipt_id):
+        self._cache.delete(self.key_prefix + receipt_id)
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        return {
+            'backend': 'django',
+            'alias': self.alias,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': None,
+        }
+
+
+_points_cache = None
+_points_cache_lock = threading.Lock()
+
+
+def get_points_cache():
+    """
+    Return the process wide points cache, building it from settings on first use.
+    """
+    global _points_cache
+    if _points_cache is None:
+        with _points_cache_lock:
+            if _points_cache is None:
+                _points_cache = build_points_cache(getattr(settings, 'RECEIPT_POINTS_CACHE', {}))
+    return _points_cache
+
+
+def build_points_cache(config):
+    backend = config.get('BACKEND', 'lru')
+    if backend == 'lru':
+        return LRUPointsCache(max_size=config.get('MAX_SIZE', DEFAULT_MAX_SIZE), ttl=config.get('TTL', DEFAULT_TTL))
+    if backend == 'django':
+        return DjangoPointsCache(alias=config.get('ALIAS', 'default'), timeout=config.get('TIMEOUT'))
+    raise ValueError(f'Unknown RECEIPT_POINTS_CACHE backend: {backend}')
+
+
+def reset_points_cache():
+    """
+    Drop the process wide points cache, so the next get_points_cache() rebuilds it from settings.
+    """
+    global _points_cache
+    with _points_cache_lock:
+        _points_cache = None
+
+
+@receiver(setting_changed)
+def _reset_points_cache_on_setting_changed(setting, **kwargs):
+    if setting == 'RECEIPT_POINTS_CACHE':
+        reset_points_cache()
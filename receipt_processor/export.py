@@ -0,0 +1,208 @@
+"""
+Streaming export of receipts, their items and points, for reconciliation outside the service.
+
+Rows are read in keyset-paginated batches (WHERE pk > last ORDER BY pk LIMIT n) through
+values_list().iterator(), shard by shard, and every batch is encoded and handed on before the
+next one is read, so memory stays flat however many rows are exported.
+
+Formats:
+    csv      Amounts formatted like api.yml ('35.35'), always available.
+    arrow    Arrow IPC stream, one record batch per batch read. Needs pyarrow.
+    parquet  Parquet file, one row group per batch read. Needs pyarrow, files only.
+
+pyarrow is only imported when an Arrow or Parquet export is written, so processes that never
+export in those formats do not load it.
+"""
+from collections import namedtuple
+from datetime import date
+from decimal import Decimal
+from importlib import import_module
+from importlib.util import find_spec
+import csv
+import io
+
+from receipt_processor.models import Item, Receipt
+from receipt_processor.money import format_cents
+from receipt_processor.sharding import receipt_shards
+
+
+DEFAULT_BATCH_SIZE = 10000
+
+# One exported column: its name, the model field it is read from, its Arrow type and how CSV writes it
+Column = namedtuple('Column', ['name', 'field', 'kind', 'to_text'])
+
+
+def _format_time(value):
+    return value.strftime('%H:%M')
+
+
+RECEIPT_COLUMNS = [
+    Column('id', 'id', 'string', str),
+    Column('retailer', 'retailer', 'string', None),
+    Column('purchase_date', 'purchase_date', 'date', date.isoformat),
+    Column('purchase_time', 'purchase_time', 'time', _format_time),
+    Column('total', 'total_cents', 'money', format_cents),
+    Column('points', 'points', 'integer', None),
+    Column('rules_version', 'rules_version', 'integer', None),
+]
+
+ITEM_COLUMNS = [
+    Column('receipt_id', 'receipt_id', 'string', str),
+    Column('short_description', 'short_description', 'string', None),
+    Column('price', 'price_cents', 'money', format_cents),
+]
+
+# Table name -> (model, columns, path from the model to the receipt fields that are filtered on)
+TABLES = {
+    'receipts': (Receipt, RECEIPT_COLUMNS, ''),
+    'items': (Item, ITEM_COLUMNS, 'receipt__'),
+}
+
+FORMATS = ('csv', 'arrow', 'parquet')
+STREAMING_FORMATS = ('csv', 'arrow')
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'arrow': 'application/vnd.apache.arrow.stream',
+}
+
+
+def available_formats():
+    return FORMATS if find_spec('pyarrow') is not None else ('csv',)
+
+
+def _import_pyarrow(module='pyarrow'):
+    try:
+        return import_module(module)
+    except ImportError as e:
+        raise ImportError('pyarrow is required for the Arrow and Parquet formats') from e
+
+
+def export_batches(table, start=None, end=None, retailer=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Yield the rows of `table` ('receipts' or 'items') as lists of at most `batch_size` tuples, in
+    the order of TABLES[table] columns, for receipts purchased between `start` and `end` inclusive,
+    optionally from one retailer.
+    """
+    model, columns, receipt_path = TABLES[table]
+    fields = [column.field for column in columns]
+    filters = {}
+    if start is not None:
+        filters[f'{receipt_path}purchase_date__gte'] = start
+    if end is not None:
+        filters[f'{receipt_path}purchase_date__lte'] = end
+    if retailer is not None:
+        filters[f'{receipt_path}retailer'] = retailer
+
+    for shard in receipt_shards():
+        rows = model.objects.using(shard).filter(**filters).order_by('pk').values_list('pk', *fields)
+        last_pk = None
+        while True:
+            page = rows if last_pk is None else rows.filter(pk__gt=last_pk)
+            # Keyset pages rather than one long-running cursor, so each query is short and indexed
+            batch = list(page[:batch_size].iterator(chunk_size=batch_size))
+            if not batch:
+                break
+            last_pk = batch[-1][0]
+            yield [row[1:] for row in batch]
+            if len(batch) < batch_size:
+                break
+
+
+def csv_chunks(columns, batches):
+    """
+    Encode `batches` of rows as CSV, yielding the header and then one string per batch.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([column.name for column in columns])
+    formatters = [column.to_text for column in columns]
+    for batch in batches:
+        writer.writerows(
+            [value if format_value is None else format_value(value) for value, format_value in zip(row, formatters)]
+            for row in batch
+        )
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def arrow_schema(columns):
+    pyarrow = _import_pyarrow()
+    types = {
+        'string': pyarrow.string(),
+        'date': pyarrow.date32(),
+        'time': pyarrow.time64('us'),
+        'money': pyarrow.decimal128(18, 2),
+        'integer': pyarrow.int64(),
+    }
+    return pyarrow.schema([(column.name, types[column.kind]) for column in columns])
+
+
+def arrow_batches(columns, batches):
+    """
+    Convert `batches` of rows to Arrow record batches, column by column.
+    """
+    pyarrow = _import_pyarrow()
+    schema = arrow_schema(columns)
+    for batch in batches:
+        arrays = []
+        for position, (column, field) in enumerate(zip(columns, schema)):
+            values = [row[position] for row in batch]
+            if column.kind == 'string' and column.to_text is not None:
+                values = [column.to_text(value) for value in values]
+            elif column.kind == 'money':
+                values = [Decimal(cents).scaleb(-2) for cents in values]
+            arrays.append(pyarrow.array(values, type=field.type))
+        yield pyarrow.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def arrow_stream_chunks(columns, batches):
+    """
+    Encode `batches` of rows as an Arrow IPC stream, yielding bytes as each batch is written.
+    """
+    ipc = _import_pyarrow('pyarrow.ipc')
+    sink = io.BytesIO()
+    with ipc.new_stream(sink, arrow_schema(columns)) as writer:
+        for record_batch in arrow_batches(columns, batches):
+            writer.write_batch(record_batch)
+            yield _drain(sink)
+    yield _drain(sink)
+
+
+def _drain(buffer):
+    data = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return data
+
+
+def write_export(path, export_format, columns, batches):
+    """
+    Write `batches` of rows to the file `path` in `export_format`. Returns the number of rows written.
+    """
+    rows = 0
+
+    def counted(batches):
+        nonlocal rows
+        for batch in batches:
+            rows += len(batch)
+            yield batch
+
+    if export_format == 'csv':
+        with open(path, 'w', newline='', encoding='utf-8') as csv_file:
+            for chunk in csv_chunks(columns, counted(batches)):
+                csv_file.write(chunk)
+    elif export_format == 'arrow':
+        with open(path, 'wb') as arrow_file:
+            for chunk in arrow_stream_chunks(columns, counted(batches)):
+                arrow_file.write(chunk)
+    elif export_format == 'parquet':
+        pyarrow, parquet = _import_pyarrow(), _import_pyarrow('pyarrow.parquet')
+        with parquet.ParquetWriter(path, arrow_schema(columns)) as writer:
+            for record_batch in arrow_batches(columns, counted(batches)):
+                writer.write_table(pyarrow.Table.from_batches([record_batch]))
+    else:
+        raise ValueError(f'Unknown export format: {export_format}')
+    return rows
@@ -0,0 +1,232 @@
+"""
+Idempotency-Key support for POST /receipts/process.
+
+A client that retries a request with the same Idempotency-Key header gets the original response
+back, without the receipt being parsed, scored or stored again. Responses are kept for a limited
+time, chosen with the RECEIPT_IDEMPOTENCY setting:
+    {'BACKEND': 'lru', 'MAX_SIZE': 100000, 'TTL': 86400}
+        A bounded in-process LRU (the default). Retries must reach the same process.
+    {'BACKEND': 'database', 'MAX_SIZE': 100000, 'TTL': 86400}
+        The same LRU in front of the IdempotencyKey table, shared by every process and kept across
+        restarts. Expired rows are deleted in bulk by `python manage.py expire_idempotency_keys`.
+
+A key reused with a different request body is refused rather than replayed.
+"""
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timezone
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from receipt_processor.models import IdempotencyKey
+
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+DEFAULT_MAX_SIZE = 100000
+DEFAULT_TTL = 24 * 60 * 60
+
+# A response kept for replay; expires_at is a Unix timestamp
+StoredResponse = namedtuple('StoredResponse', ['fingerprint', 'status', 'data', 'expires_at'])
+
+
+def request_fingerprint(body):
+    """
+    Fingerprint of a request body, to tell a retry from a different request reusing its key.
+    """
+    return hashlib.sha256(body).hexdigest()
+
+
+class LRUIdempotencyStore:
+    """
+    Bounded in-process mapping of idempotency key to stored response, evicting the least recently
+    used key when full and dropping keys once they are older than `ttl` seconds.
+    """
+
+    backend = 'lru'
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, ttl=DEFAULT_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            stored = self._entries.get(key)
+            if stored is not None and stored.expires_at <= now:
+                del self._entries[key]
+                self.expirations += 1
+                stored = None
+            if stored is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return stored
+
+    def set(self, key, fingerprint, status, data):
+        stored = StoredResponse(fingerprint, status, data, time.time() + self.ttl)
+        self._remember(key, stored)
+        return stored
+
+    def _remember(self, key, stored):
+        with self._lock:
+            self._entries[key] = stored
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def expire(self):
+        """
+        Drop every expired key, returning how many were dropped.
+        """
+        now = time.time()
+        with self._lock:
+            expired = [key for key, stored in self._entries.items() if stored.expires_at <= now]
+            for key in expired:
+                del self._entries[key]
+            self.expirations += len(expired)
+        return len(expired)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            'backend': self.backend,
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'ttl_seconds': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+
+class DatabaseIdempotencyStore(LRUIdempotencyStore):
+    """
+    LRUIdempotencyStore backed by the IdempotencyKey table, so keys are shared between processes and
+    survive restarts. Misses of the in-process LRU fall through to the table.
+    """
+
+    backend = 'database'
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, ttl=DEFAULT_TTL):
+        super().__init__(max_size=max_size, ttl=ttl)
+        self.database_hits = 0
+
+    def get(self, key):
+        stored = super().get(key)
+        if stored is not None:
+            return stored
+        row = (
+            IdempotencyKey.objects
+            .filter(key=key, expires_at__gt=datetime.now(timezone.utc))
+            .values_list('fingerprint', 'status', 'response', 'expires_at')
+            .first()
+        )
+        if row is None:
+            return None
+        fingerprint, status, data, expires_at = row
+        stored = StoredResponse(fingerprint, status, data, expires_at.timestamp())
+        self._remember(key, stored)
+        with self._lock:
+            # Counted as a miss of the LRU above, it is a hit of the store
+            self.misses -= 1
+            self.hits += 1
+            self.database_hits += 1
+        return stored
+
+    def set(self, key, fingerprint, status, data):
+        stored = super().set(key, fingerprint, status, data)
+        # Overwrites an expired row that has not been deleted yet
+        IdempotencyKey.objects.bulk_create(
+            [IdempotencyKey(
+                key=key,
+                fingerprint=fingerprint,
+                status=status,
+                response=data,
+                expires_at=datetime.fromtimestamp(stored.expires_at, timezone.utc),
+            )],
+            update_conflicts=True,
+            unique_fields=['key'],
+            update_fields=['fingerprint', 'status', 'response', 'expires_at'],
+        )
+        return stored
+
+    def expire(self):
+        return super().expire() + expire_keys()
+
+    def clear(self):
+        super().clear()
+        IdempotencyKey.objects.all().delete()
+
+    def stats(self):
+        return {**super().stats(), 'database_hits': self.database_hits}
+
+
+def expire_keys(batch_size=1000):
+    """
+    Delete the expired rows of the IdempotencyKey table, `batch_size` rows per statement so the
+    table is never locked for long. Returns the number of rows deleted.
+    """
+    now = datetime.now(timezone.utc)
+    deleted = 0
+    while True:
+        keys = list(IdempotencyKey.objects.filter(expires_at__lte=now).values_list('key', flat=True)[:batch_size])
+        if not keys:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(key__in=keys).delete()[0]
+
+
+_idempotency_store = None
+_idempotency_store_lock = threading.Lock()
+
+
+def get_idempotency_store():
+    """
+    Return the process wide idempotency store, building it from settings on first use.
+    """
+    global _idempotency_store
+    if _idempotency_store is None:
+        with _idempotency_store_lock:
+            if _idempotency_store is None:
+                _idempotency_store = build_idempotency_store(getattr(settings, 'RECEIPT_IDEMPOTENCY', {}))
+    return _idempotency_store
+
+
+def build_idempotency_store(config):
+    backend = config.get('BACKEND', 'lru')
+    options = {'max_size': config.get('MAX_SIZE', DEFAULT_MAX_SIZE), 'ttl': config.get('TTL', DEFAULT_TTL)}
+    if backend == 'lru':
+        return LRUIdempotencyStore(**options)
+    if backend == 'database':
+        return DatabaseIdempotencyStore(**options)
+    raise ValueError(f'Unknown RECEIPT_IDEMPOTENCY backend: {backend}')
+
+
+def reset_idempotency_store():
+    """
+    Drop the process wide idempotency store, so the next get_idempotency_store() rebuilds it from settings.
+    """
+    global _idempotency_store
+    with _idempotency_store_lock:
+        _idempotency_store = None
+
+
+@receiver(setting_changed)
+def _reset_idempotency_store_on_setting_changed(setting, **kwargs):
+    if setting == 'RECEIPT_IDEMPOTENCY':
+        reset_idempotency_store()
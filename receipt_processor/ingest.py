@@ -0,0 +1,200 @@
+"""
+Parsing and persistence helpers shared by the receipt endpoints.
+"""
+from collections import namedtuple
+from datetime import date, time
+import hashlib
+import json
+
+from django.db import IntegrityError, transaction
+
+from receipt_processor.metrics import phase
+from receipt_processor.models import Item, Receipt
+from receipt_processor.money import format_cents, parse_cents
+from receipt_processor.rollups import record_receipts, retailer_totals
+from receipt_processor.rules import get_rules_registry
+from receipt_processor.scoring import RETAILER_CACHE_SIZE, retailer_points
+from receipt_processor.sharding import new_receipt_id, shard_for_content, shard_for_receipt
+from receipt_processor.validation import SchemaError, validate_receipt
+
+
+# A receipt that has been validated, cleaned and scored, but not yet stored.
+ParsedReceipt = namedtuple(
+    'ParsedReceipt',
+    ['retailer', 'purchase_date', 'purchase_time', 'total_cents', 'items', 'points', 'content_hash', 'rules_version'],
+)
+
+# Largest number of hashes looked up per query, well under SQLite's bound parameter limit
+HASH_LOOKUP_CHUNK_SIZE = 500
+
+# Inserts tried by store_receipts before an IntegrityError is raised; each retry follows a new lookup
+STORE_ATTEMPTS = 3
+
+
+class InvalidReceipt(ValueError):
+    """
+    Raised when request receipt data cannot be turned into a ParsedReceipt.
+    """
+
+
+def parse_receipt(request_body):
+    """
+    Validate, clean and score a decoded receipt payload.
+
+    Returns a ParsedReceipt, or raises InvalidReceipt with a message suitable for a 400 response.
+    """
+    try:
+        with phase('validate'):
+            validate_receipt(request_body)
+    except SchemaError as e:
+        location = f' at {e.path}' if e.path else ''
+        raise InvalidReceipt(f'Request receipt data invalid{location}, {e.message}')
+
+    # Data cleaning, safe now that the payload matches the schema
+    retailer = request_body['retailer']
+    purchase_date = date.fromisoformat(request_body['purchaseDate'])
+    hour, minute = [int(x) for x in request_body['purchaseTime'].split(':')]
+    purchase_time = time(hour=hour, minute=minute)
+    total_cents = parse_cents(request_body['total'])
+    items = [(item['shortDescription'], parse_cents(item['price'])) for item in request_body['items']]
+
+    with phase('score'):
+        rules = current_rule_set()
+        points = rules.score(retailer, purchase_date, purchase_time, total_cents, items)
+        content_hash = receipt_content_hash(retailer, purchase_date, purchase_time, total_cents, items)
+    return ParsedReceipt(retailer, purchase_date, purchase_time, total_cents, items, points, content_hash, rules.version)
+
+
+def current_rule_set():
+    """
+    The compiled rules new receipts are scored with, see rules.RulesRegistry.current.
+    """
+    return get_rules_registry().current()
+
+
+def receipt_content_hash(retailer, purchase_date, purchase_time, total_cents, items):
+    """
+    SHA-256 over the whole normalized receipt, items included, used to recognise repeat submissions.
+
+    Money is normalized to two decimal places and items are sorted, so the same basket hashes the
+    same however its numbers were formatted or its items ordered.
+    """
+    canonical = [
+        retailer,
+        purchase_date.isoformat(),
+        purchase_time.strftime('%H:%M'),
+        format_cents(total_cents),
+        sorted([short_description, format_cents(price_cents)] for short_description, price_cents in items),
+    ]
+    return hashlib.sha256(json.dumps(canonical, separators=(',', ':')).encode()).hexdigest()
+
+
+def find_receipts_by_hash(content_hashes):
+    """
+    Map each of `content_hashes` that is already stored to the (id, points) of its receipt.
+    """
+    hashes_by_shard = {}
+    for content_hash in content_hashes:
+        hashes_by_shard.setdefault(shard_for_content(content_hash), []).append(content_hash)
+    found = {}
+    for shard, shard_hashes in hashes_by_shard.items():
+        for start in range(0, len(shard_hashes), HASH_LOOKUP_CHUNK_SIZE):
+            rows = Receipt.objects.using(shard).filter(
+                content_hash__in=shard_hashes[start:start + HASH_LOOKUP_CHUNK_SIZE],
+            ).values_list('content_hash', 'id', 'points')
+            for content_hash, receipt_id, points in rows:
+                found[content_hash] = (receipt_id, points)
+    return found
+
+
+def store_receipts(parsed_receipts, found=None):
+    """
+    Store the ParsedReceipts that were not stored before, in a single transaction per shard.
+
+    Returns the (id, points) of the new or original receipt for each of `parsed_receipts`. Repeat
+    submissions, within the list or of earlier receipts, cost one indexed lookup and never touch
+    the item tables. Callers that already looked the receipts up pass the result of
+    find_receipts_by_hash as `found` to skip the lookup.
+    """
+    if found is None:
+        found = find_receipts_by_hash(parsed.content_hash for parsed in parsed_receipts)
+    else:
+        found = dict(found)
+
+    for attempt in range(1, STORE_ATTEMPTS + 1):
+        new_receipts = {}
+        for parsed in parsed_receipts:
+            if parsed.content_hash not in found:
+                new_receipts.setdefault(parsed.content_hash, parsed)
+        if not new_receipts:
+            break
+        try:
+            receipts = save_receipts(list(new_receipts.values()))
+        except IntegrityError:
+            # Some of these receipts were stored concurrently, look them up again. A conflict
+            # that a fresh lookup does not explain is not a duplicate and is raised.
+            if attempt == STORE_ATTEMPTS:
+                raise
+            found.update(find_receipts_by_hash(new_receipts))
+            continue
+        for receipt in receipts:
+            found[receipt.content_hash] = (receipt.id, receipt.points)
+        break
+
+    return [found[parsed.content_hash] for parsed in parsed_receipts]
+
+
+def save_receipts(parsed_receipts, receipt_ids=None):
+    """
+    Store a list of ParsedReceipts, with their items, in a single transaction per shard.
+
+    `receipt_ids` optionally gives the ids to store the receipts under, for receipts whose id has
+    already been handed out (see sharding.new_receipt_id). Returns the created Receipt objects in
+    the same order.
+    """
+    if receipt_ids is None:
+        receipt_ids = [new_receipt_id(parsed.content_hash) for parsed in parsed_receipts]
+    receipts = [
+        Receipt(
+            retailer=parsed.retailer,
+            purchase_date=parsed.purchase_date,
+            purchase_time=parsed.purchase_time,
+            total_cents=parsed.total_cents,
+            points=parsed.points,
+            rules_version=parsed.rules_version,
+            content_hash=parsed.content_hash,
+            id=receipt_id,
+        )
+        for parsed, receipt_id in zip(parsed_receipts, receipt_ids)
+    ]
+
+    # Note: we need a unique item object for each item to get the counts right
+    items_by_shard = {}
+    receipts_by_shard = {}
+    for receipt, parsed in zip(receipts, parsed_receipts):
+        shard = shard_for_receipt(receipt.id)
+        receipts_by_shard.setdefault(shard, []).append(receipt)
+        items_by_shard.setdefault(shard, []).extend(
+            Item(receipt=receipt, short_description=short_description, price_cents=price_cents)
+            for short_description, price_cents in parsed.items
+        )
+
+    for shard, shard_receipts in receipts_by_shard.items():
+        with transaction.atomic(using=shard):
+            Receipt.objects.using(shard).bulk_create(shard_receipts)
+            Item.objects.using(shard).bulk_create(items_by_shard[shard])
+            record_receipts(shard_receipts, using=shard)
+
+    return receipts
+
+
+def warm_scoring_caches():
+    """
+    Fill this process's retailer points cache (see scoring.py) with the retailers that have the
+    most receipts, read from the rollups of every shard. Returns the number of retailers cached.
+    """
+    retailers = [retailer for retailer, _, _ in sorted(retailer_totals(), key=lambda row: -row[1])][:RETAILER_CACHE_SIZE]
+    # Least frequent first, so the most frequent retailers are the last ones the LRU would evict
+    for retailer in reversed(retailers):
+        retailer_points(retailer)
+    return len(retailers)
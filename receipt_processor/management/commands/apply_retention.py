@@ -0,0 +1,85 @@
+"""
+Delete, and optionally archive, receipts older than the retention policy, then compact the database.
+"""
+from datetime import date
+from pathlib import Path
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from receipt_processor.retention import (
+    VACUUM_MODES, apply_retention, cutoff_date, expired_receipts, orphaned_items, retention_config,
+)
+from receipt_processor.sharding import receipt_shards
+
+
+def format_bytes(size):
+    if size is None:
+        return 'n/a'
+    for unit in ('B', 'KiB', 'MiB'):
+        if abs(size) < 1024:
+            return f'{size:.0f} {unit}' if unit == 'B' else f'{size:.1f} {unit}'
+        size /= 1024
+    return f'{size:.1f} GiB'
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete the receipts purchased before the retention cutoff (RECEIPT_RETENTION["MAX_AGE_DAYS"], '
+        '--max-age-days or --before) with their items and rollup counts, shard by shard in short '
+        'transactions, sweep up orphaned items and compact the database. Run it periodically, e.g. from cron.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age-days', type=int, help='Delete receipts purchased more than this many days ago')
+        parser.add_argument('--before', type=date.fromisoformat, help='Delete receipts purchased before this date (YYYY-MM-DD)')
+        parser.add_argument('--batch-size', type=int, help='Receipts deleted per transaction')
+        parser.add_argument('--pause', type=float, help='Seconds between transactions')
+        parser.add_argument('--archive', type=Path,
+                            help='Write the deleted receipts to a gzipped NDJSON file per shard in this directory')
+        parser.add_argument('--vacuum', choices=VACUUM_MODES, default='incremental',
+                            help='"full" rewrites the file and enables incremental vacuum for later runs (default: incremental)')
+        parser.add_argument('--no-analyze', action='store_true', help='Do not refresh the query planner statistics')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the rows that would be deleted')
+
+    def handle(self, *args, **options):
+        max_age_days = options['max_age_days']
+        if max_age_days is None:
+            max_age_days = retention_config()['MAX_AGE_DAYS']
+        if options['before']:
+            before = options['before']
+        elif max_age_days is not None:
+            before = cutoff_date(max_age_days)
+        else:
+            raise CommandError('No retention policy: set RECEIPT_RETENTION["MAX_AGE_DAYS"] or pass --max-age-days or --before')
+        if options['archive'] and not options['archive'].is_dir():
+            raise CommandError(f'{options["archive"]} is not a directory')
+
+        totals = {'receipts': 0, 'items': 0, 'orphaned_items': 0, 'bytes_reclaimed': 0}
+        for shard in receipt_shards():
+            started = time.perf_counter()
+            if options['dry_run']:
+                receipts = expired_receipts(before, shard).count()
+                orphans = orphaned_items(shard).count()
+                self.stdout.write(f'{shard}: {receipts} receipts purchased before {before} and {orphans} orphaned items would be deleted')
+                continue
+
+            report = apply_retention(
+                before, shard, archive_dir=options['archive'], batch_size=options['batch_size'],
+                pause=options['pause'], vacuum=options['vacuum'], analyze=not options['no_analyze'],
+            )
+            for name in totals:
+                totals[name] += report[name] or 0
+            archived = f', archived to {report["archive"]}' if report['archive'] else ''
+            self.stdout.write(
+                f'{shard}: deleted {report["receipts"]} receipts, {report["items"]} items and '
+                f'{report["orphaned_items"]} orphaned items{archived}; {format_bytes(report["bytes_freed"])} freed, '
+                f'file {format_bytes(report["bytes_before"])} -> {format_bytes(report["bytes_after"])} '
+                f'in {time.perf_counter() - started:.1f}s'
+            )
+
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Deleted {totals["receipts"]} receipts purchased before {before}, {totals["items"]} items and '
+                f'{totals["orphaned_items"]} orphaned items, reclaimed {format_bytes(totals["bytes_reclaimed"])}'
+            ))
@@ -0,0 +1,25 @@
+"""
+Delete expired idempotency keys from the IdempotencyKey table.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from receipt_processor.idempotency import expire_keys
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete the idempotency keys whose replay window has passed, in batches so writers are never '
+        'blocked for long. Only needed with the database idempotency backend; run it periodically, e.g. from cron.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Keys deleted per statement')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        deleted = expire_keys(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {deleted} expired idempotency keys in {time.perf_counter() - started:.1f}s'
+        ))
@@ -0,0 +1,52 @@
+"""
+Export stored receipts, their items and points to CSV, Arrow or Parquet files.
+"""
+from datetime import date
+from pathlib import Path
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from receipt_processor.export import DEFAULT_BATCH_SIZE, FORMATS, TABLES, available_formats, export_batches, write_export
+
+
+class Command(BaseCommand):
+    help = (
+        'Export receipts and their items to <directory>/<table>.<format>. Rows are read in keyset batches, shard '
+        'by shard, and written as they are read, so memory stays flat however many receipts are exported. '
+        'The Arrow and Parquet formats need pyarrow.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', type=Path, help='Directory the export files are written to')
+        parser.add_argument('--format', choices=FORMATS, default='csv', help='File format (default: csv)')
+        parser.add_argument('--tables', nargs='+', choices=list(TABLES), default=list(TABLES),
+                            help='Tables to export (default: all)')
+        parser.add_argument('--retailer', help='Only export receipts from this retailer')
+        parser.add_argument('--start', type=date.fromisoformat, help='First purchase date exported, YYYY-MM-DD')
+        parser.add_argument('--end', type=date.fromisoformat, help='Last purchase date exported, YYYY-MM-DD')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Rows read per query')
+
+    def handle(self, *args, **options):
+        export_format = options['format']
+        if export_format not in available_formats():
+            raise CommandError(f'The {export_format} format needs pyarrow, which is not installed')
+        directory = options['directory']
+        directory.mkdir(parents=True, exist_ok=True)
+
+        for table in options['tables']:
+            path = directory / f'{table}.{export_format}'
+            partial_path = path.with_name(path.name + '.tmp')
+            started = time.perf_counter()
+            batches = export_batches(
+                table, start=options['start'], end=options['end'], retailer=options['retailer'],
+                batch_size=options['batch_size'],
+            )
+            rows = write_export(partial_path, export_format, TABLES[table][1], batches)
+            # Readers never see a half-written export
+            os.replace(partial_path, path)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(self.style.SUCCESS(
+                f'Exported {rows} {table} rows to {path} in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):.0f} rows/s)'
+            ))
@@ -0,0 +1,198 @@
+"""
+Bulk import of receipts from JSON and NDJSON files.
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from pathlib import Path
+import gzip
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from receipt_processor.ingest import InvalidReceipt, find_receipts_by_hash, parse_receipt, store_receipts
+from receipt_processor.validation import decode_json
+
+
+NDJSON_SUFFIXES = ('.ndjson', '.jsonl')
+
+
+def read_records(path, skip=0):
+    """
+    Yield (path, record number, raw record) for every receipt in `path`, after the first `skip`.
+
+    NDJSON files are streamed line by line; JSON files hold one receipt or an array of them. Either
+    can be gzipped (.gz), as the archives written by apply_retention are.
+    """
+    compressed = path.suffix == '.gz'
+    opener = gzip.open if compressed else open
+    suffix = path.with_suffix('').suffix if compressed else path.suffix
+    if suffix in NDJSON_SUFFIXES:
+        with opener(path, 'rb') as ndjson_file:
+            records = (line for line in ndjson_file if line.strip())
+            for number, line in enumerate(islice(records, skip, None), start=skip + 1):
+                yield str(path), number, line
+    else:
+        with opener(path, 'rb') as json_file:
+            document = json.loads(json_file.read())
+        receipts = document if isinstance(document, list) else [document]
+        for number, receipt in enumerate(receipts[skip:], start=skip + 1):
+            yield str(path), number, receipt
+
+
+def score_records(records):
+    """
+    Parse and score a chunk of records. Runs in the worker processes, without any database access.
+
+    Returns a (path, record number, ParsedReceipt or None, error or None) tuple per record.
+    """
+    results = []
+    for path, number, record in records:
+        try:
+            request_body = decode_json(record) if isinstance(record, (bytes, str)) else record
+            results.append((path, number, parse_receipt(request_body), None))
+        except InvalidReceipt as e:
+            results.append((path, number, None, str(e)))
+        except Exception as e:
+            results.append((path, number, None, f'Request receipt data invalid, threw the following exception: {e}'))
+    return results
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def map_in_order(executor, func, iterable, window):
+    """
+    Like executor.map, but submits at most `window` tasks ahead of the result being consumed, so
+    the input is read as the results are used rather than all at once. Results keep input order.
+    """
+    futures = deque()
+    for item in iterable:
+        if len(futures) >= window:
+            yield futures.popleft().result()
+        futures.append(executor.submit(func, item))
+    while futures:
+        yield futures.popleft().result()
+
+
+def _init_worker():
+    # Worker processes started with "spawn" (e.g. on macOS) begin without Django configured
+    import django
+    django.setup()
+
+
+class Command(BaseCommand):
+    help = (
+        'Import receipts from JSON or NDJSON files. Receipts are scored in parallel across a process '
+        'pool and written by this process in large batched transactions.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', type=Path, help='JSON (.json) or NDJSON (.ndjson, .jsonl) files, optionally gzipped (.gz)')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Scoring processes, 0 scores in this process (default: CPU count)')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Receipts written per transaction')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Receipts scored per worker task')
+        parser.add_argument('--checkpoint', type=Path,
+                            help='File recording progress after every transaction; rerunning with it resumes the import')
+        parser.add_argument('--errors', type=Path, help='Write invalid receipts to this NDJSON file')
+        parser.add_argument('--dry-run', action='store_true', help='Only validate and score, write nothing to the database')
+        parser.add_argument('--progress-every', type=float, default=5.0, help='Seconds between progress reports')
+
+    def handle(self, *args, **options):
+        for path in options['paths']:
+            if not path.is_file():
+                raise CommandError(f'{path} is not a file')
+
+        self.dry_run = options['dry_run']
+        self.batch_size = options['batch_size']
+        self.checkpoint_path = options['checkpoint']
+        self.checkpoint = self.load_checkpoint()
+        self.errors_file = open(options['errors'], 'a') if options['errors'] else None
+        self.progress_every = options['progress_every']
+        self.counts = {'read': 0, 'stored': 0, 'duplicates': 0, 'invalid': 0, 'points': 0}
+        self.started = self.last_progress = time.perf_counter()
+        self.batch = []
+        self.batch_positions = {}
+
+        records = (
+            record
+            for path in options['paths']
+            for record in read_records(path, skip=self.checkpoint.get(str(path), 0))
+        )
+        chunks = chunked(records, options['chunk_size'])
+
+        try:
+            if options['workers'] == 0:
+                for chunk in chunks:
+                    self.consume(score_records(chunk))
+            else:
+                workers = options['workers'] or 1
+                with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+                    # Results come back in input order, so checkpoints always cover a prefix of each file
+                    for results in map_in_order(executor, score_records, chunks, window=2 * workers):
+                        self.consume(results)
+            self.write_batch()
+        finally:
+            if self.errors_file:
+                self.errors_file.close()
+
+        self.report(final=True)
+
+    def consume(self, results):
+        for path, number, parsed, error in results:
+            self.counts['read'] += 1
+            self.batch_positions[path] = number
+            if error is not None:
+                self.counts['invalid'] += 1
+                if self.errors_file:
+                    self.errors_file.write(json.dumps({'path': path, 'record': number, 'error': error}) + '\n')
+                continue
+            self.counts['points'] += parsed.points
+            self.batch.append(parsed)
+            if len(self.batch) >= self.batch_size:
+                self.write_batch()
+        if time.perf_counter() - self.last_progress >= self.progress_every:
+            self.report()
+
+    def write_batch(self):
+        if self.batch and not self.dry_run:
+            # Receipts already in the database, or repeated within the batch, are not stored again
+            existing = find_receipts_by_hash([parsed.content_hash for parsed in self.batch])
+            stored = {receipt_id for receipt_id, _ in store_receipts(self.batch, found=existing)}
+            stored.difference_update(receipt_id for receipt_id, _ in existing.values())
+            self.counts['stored'] += len(stored)
+            self.counts['duplicates'] += len(self.batch) - len(stored)
+        self.batch = []
+        if self.batch_positions:
+            self.checkpoint.update(self.batch_positions)
+            self.batch_positions = {}
+            self.save_checkpoint()
+
+    def load_checkpoint(self):
+        if self.checkpoint_path and self.checkpoint_path.exists():
+            return json.loads(self.checkpoint_path.read_text())
+        return {}
+
+    def save_checkpoint(self):
+        if not self.checkpoint_path or self.dry_run:
+            return
+        temporary_path = self.checkpoint_path.with_name(self.checkpoint_path.name + '.tmp')
+        temporary_path.write_text(json.dumps(self.checkpoint))
+        os.replace(temporary_path, self.checkpoint_path)
+
+    def report(self, final=False):
+        self.last_progress = time.perf_counter()
+        elapsed = self.last_progress - self.started
+        rate = self.counts['read'] / elapsed if elapsed else 0
+        summary = ', '.join(f'{count} {name}' for name, count in self.counts.items())
+        message = f'{summary} in {elapsed:.1f}s ({rate:.0f} receipts/s)'
+        if final:
+            self.stdout.write(self.style.SUCCESS(('Dry run: ' if self.dry_run else 'Imported: ') + message))
+        else:
+            self.stdout.write(message)
@@ -0,0 +1,18 @@
+"""
+Migrate the default database and every receipt shard.
+"""
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from receipt_processor.sharding import receipt_shards
+
+
+class Command(BaseCommand):
+    help = 'Run migrate on the default database and on every database listed in RECEIPT_SHARDS.'
+
+    def handle(self, *args, **options):
+        aliases = [DEFAULT_DB_ALIAS] + [shard for shard in receipt_shards() if shard != DEFAULT_DB_ALIAS]
+        for alias in aliases:
+            self.stdout.write(f'Migrating {alias}')
+            call_command('migrate', database=alias, interactive=False, verbosity=options['verbosity'], stdout=self.stdout._out)
@@ -0,0 +1,25 @@
+"""
+Recompute the analytics rollup tables from the receipts.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from receipt_processor.rollups import rebuild_rollups
+from receipt_processor.sharding import receipt_shards
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the retailer/day and points rollups from the Receipt table, replacing their contents. '
+        'Run it periodically (or after bulk changes made outside the ORM) to compact and repair the rollups.'
+    )
+
+    def handle(self, *args, **options):
+        for shard in receipt_shards():
+            started = time.perf_counter()
+            written = rebuild_rollups(using=shard)
+            self.stdout.write(self.style.SUCCESS(
+                f'Rebuilt {written["retailer_daily"]} retailer/day rows and {written["points"]} points rows '
+                f'on {shard} in {time.perf_counter() - started:.1f}s'
+            ))
@@ -0,0 +1,177 @@
+"""
+Rescore stored receipts under a (new) version of the point rules.
+"""
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Prefetch
+
+from receipt_processor.cache import get_points_cache
+from receipt_processor.ingest import current_rule_set
+from receipt_processor.models import Item, Receipt
+from receipt_processor.rollups import record_receipts
+from receipt_processor.rules import get_rules_registry
+from receipt_processor.sharding import receipt_shards
+
+
+# What the rollups need to know about a receipt whose points change
+RollupEntry = namedtuple('RollupEntry', ['retailer', 'purchase_date', 'points'])
+
+
+def rescore_receipts(version, rows):
+    """
+    Score (receipt id, retailer, purchase date, purchase time, total cents, items) rows under the rules
+    of `version`. Runs in the worker processes, without any database access.
+    """
+    score = get_rules_registry().get(version).score
+    return [
+        (receipt_id, score(retailer, purchase_date, purchase_time, total_cents, items))
+        for receipt_id, retailer, purchase_date, purchase_time, total_cents, items in rows
+    ]
+
+
+def _init_worker():
+    # Worker processes started with "spawn" (e.g. on macOS) begin without Django configured
+    import django
+    django.setup()
+
+
+class Command(BaseCommand):
+    help = (
+        'Rescore stored receipts that were scored under a different rules version. Receipts are read '
+        'in primary key order in chunks, shard by shard, rescored across a process pool and written back in one '
+        'transaction per chunk, together with the rollups. Rerunning with the same checkpoint resumes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rules-version', type=int,
+                            help='Rules version to rescore with (default: the current one, see receipt_processor/rules.py)')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Receipts read and written per transaction')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Scoring processes, 0 scores in this process (default: CPU count)')
+        parser.add_argument('--checkpoint', type=Path,
+                            help='File recording the last rescored receipt; rerunning with it resumes the job')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many receipts would change')
+
+    def handle(self, *args, **options):
+        registry = get_rules_registry()
+        if options['rules_version'] is None:
+            rules = current_rule_set()
+        elif options['rules_version'] in registry.versions():
+            rules = registry.get(options['rules_version'])
+        else:
+            raise CommandError(f'Unknown rules version {options["rules_version"]}, known versions: {registry.versions()}')
+
+        checkpoint_path = options['checkpoint']
+        last_ids = {}  # shard -> last receipt id rescored there
+        if checkpoint_path and checkpoint_path.exists():
+            checkpoint = json.loads(checkpoint_path.read_text())
+            if checkpoint['rules_version'] == rules.version:
+                last_ids = checkpoint['last_ids']
+
+        counts = {'scanned': 0, 'changed': 0, 'unchanged': 0}
+        started = time.perf_counter()
+        rescore = partial(rescore_receipts, rules.version)
+        executor = None
+        if options['workers']:
+            executor = ProcessPoolExecutor(max_workers=options['workers'], initializer=_init_worker)
+        try:
+            for shard in receipt_shards():
+                while True:
+                    receipts = self.read_chunk(shard, rules.version, last_ids.get(shard), options['chunk_size'])
+                    if not receipts:
+                        break
+                    rows = [
+                        (
+                            receipt.id,
+                            receipt.retailer,
+                            receipt.purchase_date,
+                            receipt.purchase_time,
+                            receipt.total_cents,
+                            [(item.short_description, item.price_cents) for item in receipt.items.all()],
+                        )
+                        for receipt in receipts
+                    ]
+                    if executor is None:
+                        scored = rescore(rows)
+                    else:
+                        worker_rows = -(-len(rows) // options['workers'])
+                        scored = [
+                            result
+                            for results in executor.map(rescore, [rows[i:i + worker_rows] for i in range(0, len(rows), worker_rows)])
+                            for result in results
+                        ]
+
+                    changed = self.write_chunk(shard, receipts, dict(scored), rules.version, options['dry_run'])
+                    counts['scanned'] += len(receipts)
+                    counts['changed'] += changed
+                    counts['unchanged'] += len(receipts) - changed
+
+                    last_ids[shard] = str(receipts[-1].id)
+                    if checkpoint_path and not options['dry_run']:
+                        temporary_path = checkpoint_path.with_name(checkpoint_path.name + '.tmp')
+                        temporary_path.write_text(json.dumps({'rules_version': rules.version, 'last_ids': last_ids}))
+                        os.replace(temporary_path, checkpoint_path)
+
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(
+                        f'{counts["scanned"]} scanned, {counts["changed"]} changed in {elapsed:.1f}s '
+                        f'({counts["scanned"] / elapsed:.0f} receipts/s)'
+                    )
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        summary = ', '.join(f'{count} {name}' for name, count in counts.items())
+        prefix = 'Dry run' if options['dry_run'] else f'Rescored under rules version {rules.version}'
+        self.stdout.write(self.style.SUCCESS(f'{prefix}: {summary} in {time.perf_counter() - started:.1f}s'))
+
+    def read_chunk(self, shard, rules_version, last_id, chunk_size):
+        """
+        The next `chunk_size` receipts on `shard` after `last_id`, in primary key order, that were
+        scored under another rules version, with their items.
+        """
+        receipts = (
+            Receipt.objects.using(shard)
+            .exclude(rules_version=rules_version)
+            .order_by('id')
+            .only('id', 'retailer', 'purchase_date', 'purchase_time', 'total_cents', 'points', 'rules_version')
+            .prefetch_related(Prefetch('items', queryset=Item.objects.only('receipt_id', 'short_description', 'price_cents')))
+        )
+        if last_id is not None:
+            receipts = receipts.filter(id__gt=last_id)
+        # Keyset pages rather than one long-running cursor, so no cursor is open while a chunk is written
+        return list(receipts[:chunk_size].iterator(chunk_size=chunk_size))
+
+    def write_chunk(self, shard, receipts, points_by_id, rules_version, dry_run):
+        """
+        Store the new points and rules version of `receipts`, moving changed receipts between
+        rollup rows. Returns the number of receipts whose points changed.
+        """
+        changed = [receipt for receipt in receipts if points_by_id[receipt.id] != receipt.points]
+        if dry_run:
+            return len(changed)
+
+        previous = [RollupEntry(receipt.retailer, receipt.purchase_date, receipt.points) for receipt in changed]
+        changed_ids = {receipt.id for receipt in changed}
+        for receipt in receipts:
+            receipt.points = points_by_id[receipt.id]
+            receipt.rules_version = rules_version
+        with transaction.atomic(using=shard):
+            Receipt.objects.using(shard).bulk_update(changed, ['points', 'rules_version'])
+            unchanged_ids = [receipt.id for receipt in receipts if receipt.id not in changed_ids]
+            Receipt.objects.using(shard).filter(id__in=unchanged_ids).update(rules_version=rules_version)
+            record_receipts(previous, sign=-1, using=shard)
+            record_receipts(changed, using=shard)
+
+        points_cache = get_points_cache()
+        for receipt in changed:
+            points_cache.set(str(receipt.id), receipt.points)
+        return len(changed)
@@ -0,0 +1,260 @@
+"""
+Hot-path instrumentation for receipt_processor.
+
+MetricsMiddleware times every request and counts the database queries it runs, including those
+async views run through sync_to_async. Code on the hot
+path marks its phases with `phase()`:
+
+    with phase('persist'):
+        store_receipts(parsed_receipts)
+
+Everything is kept in an in-process registry and served in the Prometheus text format by
+MetricsView at /metrics. Optional cProfile sampling is configured with RECEIPT_PROFILE:
+
+    RECEIPT_PROFILE = {
+        'ENABLED': False,
+        'SAMPLE_RATE': 0.01,    # fraction of requests run under the profiler
+        'SLOW_MS': 250,         # profiled requests slower than this are dumped
+        'DIRECTORY': '/tmp/receipt-profiles',
+    }
+"""
+from bisect import bisect_left
+from contextlib import ExitStack, asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+import cProfile
+import random
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 500, 1000)
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram, as Prometheus expects them.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last slot is the +Inf bucket
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+    Histograms keyed by metric name and label values.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}  # name -> (help text, {labels: Histogram})
+
+    def observe(self, name, help_text, labels, value, buckets=LATENCY_BUCKETS):
+        labels = tuple(sorted(labels.items()))
+        with self._lock:
+            _, histograms = self._metrics.setdefault(name, (help_text, {}))
+            histogram = histograms.get(labels)
+            if histogram is None:
+                histogram = histograms[labels] = Histogram(buckets)
+            histogram.observe(value)
+
+    def clear(self):
+        with self._lock:
+            self._metrics.clear()
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, (help_text, histograms) in sorted(self._metrics.items()):
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for labels, histogram in sorted(histograms.items()):
+                    cumulative = 0
+                    for bound, count in zip((*histogram.buckets, '+Inf'), histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{format_labels(labels, le=bound)} {cumulative}')
+                    lines.append(f'{name}_sum{format_labels(labels)} {histogram.sum}')
+                    lines.append(f'{name}_count{format_labels(labels)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels, **extra):
+    pairs = [*labels, *extra.items()]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in pairs) + '}'
+
+
+def format_gauges(name, help_text, values, labels=()):
+    """
+    Prometheus gauge lines for the numeric entries of a stats() dict.
+    """
+    lines = []
+    for key, value in values.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        metric = f'{name}_{key}'
+        lines.append(f'# HELP {metric} {help_text}: {key.replace("_", " ")}')
+        lines.append(f'# TYPE {metric} gauge')
+        lines.append(f'{metric}{format_labels(labels)} {value}')
+    return lines
+
+
+registry = MetricsRegistry()
+
+
+class RequestMetrics:
+    """
+    Measurements for the request being served, see track_request.
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.queries = 0
+        self.db_seconds = 0.0
+
+    def record_query(self, execute, sql, params, many, context):
+        if _current_request.get() is not self:
+            # Another request's query on a connection shared through sync_to_async's thread
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - started
+            self.queries += 1
+
+
+_current_request = ContextVar('receipt_processor_request_metrics', default=None)
+
+
+@contextmanager
+def phase(name):
+    """
+    Time a phase of the current request (parse, validate, score, persist, ...).
+
+    Does nothing outside of a request tracked by MetricsMiddleware.
+    """
+    current = _current_request.get()
+    if current is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        current.phases[name] = current.phases.get(name, 0.0) + time.perf_counter() - started
+
+
+def count_query(seconds):
+    """
+    Record a query of the current request that was run outside Django's cursor wrappers.
+    """
+    current = _current_request.get()
+    if current is not None:
+        current.queries += 1
+        current.db_seconds += seconds
+
+
+_profiler_lock = threading.Lock()  # cProfile cannot profile two requests at once
+
+
+def _wrap_connections(stack, current):
+    # Connections are per thread, so this has to run in the thread that will run the queries
+    for alias in connections:
+        stack.enter_context(connections[alias].execute_wrapper(current.record_query))
+
+
+@contextmanager
+def track_request(request):
+    """
+    Measure the request served inside the block and record it in the registry when it ends.
+    """
+    with _measure(request) as current, ExitStack() as stack:
+        _wrap_connections(stack, current)
+        yield current
+
+
+@asynccontextmanager
+async def atrack_request(request):
+    """
+    track_request for requests served on the event loop.
+
+    The async ORM runs queries in the thread sync_to_async hands thread-sensitive work to, which
+    is one thread per request under ASGI, so the connections are wrapped in that thread.
+    """
+    with _measure(request) as current:
+        stack = ExitStack()
+        await sync_to_async(_wrap_connections)(stack, current)
+        try:
+            yield current
+        finally:
+            await sync_to_async(stack.close)()
+
+
+@contextmanager
+def _measure(request):
+    current = RequestMetrics()
+    token = _current_request.set(current)
+    profiler = _start_profiler()
+    started = time.perf_counter()
+    try:
+        yield current
+    finally:
+        elapsed = time.perf_counter() - started
+        _current_request.reset(token)
+        endpoint = request.resolver_match.url_name if request.resolver_match else 'unmatched'
+        labels = {'endpoint': endpoint, 'method': request.method}
+
+        registry.observe('receipt_request_duration_seconds', 'Request latency', labels, elapsed)
+        registry.observe('receipt_request_db_queries', 'Database queries per request', labels, current.queries, QUERY_COUNT_BUCKETS)
+        registry.observe('receipt_request_db_duration_seconds', 'Database time per request', labels, current.db_seconds)
+        for name, seconds in current.phases.items():
+            registry.observe('receipt_request_phase_duration_seconds', 'Time per request phase', {**labels, 'phase': name}, seconds)
+
+        if profiler is not None:
+            _stop_profiler(profiler, endpoint, elapsed)
+
+
+def _profile_config():
+    return getattr(settings, 'RECEIPT_PROFILE', {})
+
+
+def _start_profiler():
+    config = _profile_config()
+    if not config.get('ENABLED') or random.random() >= config.get('SAMPLE_RATE', 0.01):
+        return None
+    if not _profiler_lock.acquire(blocking=False):
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:  # another profiler is active in this interpreter
+        _profiler_lock.release()
+        return None
+    return profiler
+
+
+def _stop_profiler(profiler, endpoint, elapsed):
+    try:
+        profiler.disable()
+        config = _profile_config()
+        if elapsed * 1000 >= config.get('SLOW_MS', 250):
+            directory = Path(config.get('DIRECTORY', '/tmp/receipt-profiles'))
+            directory.mkdir(parents=True, exist_ok=True)
+            profiler.dump_stats(directory / f'{time.time_ns()}-{endpoint}-{elapsed * 1000:.0f}ms.prof')
+    finally:
+        _profiler_lock.release()
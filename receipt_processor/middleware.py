@@ -0,0 +1,32 @@
+"""
+Middleware for receipt_processor
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from receipt_processor.metrics import atrack_request, track_request
+
+
+class MetricsMiddleware:
+    """
+    Records latency, database query count and time, and phase timings for every request.
+
+    Place it first in MIDDLEWARE so the measurements cover the rest of the stack.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with track_request(request):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        async with atrack_request(request):
+            return await self.get_response(request)
@@ -0,0 +1,51 @@
+import hashlib
+import json
+
+from django.db import migrations, models
+
+
+def populate_content_hashes(apps, schema_editor):
+    """
+    Hash existing receipts the same way ingest.receipt_content_hash does.
+
+    Receipts whose content repeats an earlier receipt keep a NULL hash, so the unique constraint holds.
+    """
+    db_alias = schema_editor.connection.alias
+    Receipt = apps.get_model('receipt_processor', 'Receipt')
+    ItemAssignmentToReceipt = apps.get_model('receipt_processor', 'ItemAssignmentToReceipt')
+
+    items_by_receipt = {}
+    assignments = ItemAssignmentToReceipt.objects.using(db_alias).values_list('receipt_id', 'item__short_description', 'item__price')
+    for receipt_id, short_description, price in assignments.iterator():
+        items_by_receipt.setdefault(receipt_id, []).append([short_description, f'{price:.2f}'])
+
+    seen = set()
+    for receipt in Receipt.objects.using(db_alias).only('id', 'retailer', 'purchase_date', 'purchase_time', 'total').iterator():
+        canonical = [
+            receipt.retailer,
+            receipt.purchase_date.isoformat(),
+            receipt.purchase_time.strftime('%H:%M'),
+            f'{receipt.total:.2f}',
+            sorted(items_by_receipt.get(receipt.id, [])),
+        ]
+        content_hash = hashlib.sha256(json.dumps(canonical, separators=(',', ':')).encode()).hexdigest()
+        if content_hash in seen:
+            continue
+        seen.add(content_hash)
+        Receipt.objects.using(db_alias).filter(id=receipt.id).update(content_hash=content_hash)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('receipt_processor', '0008_alter_receipt_purchase_date_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='receipt',
+            name='content_hash',
+            field=models.CharField(editable=False, max_length=64, null=True, unique=True),
+        ),
+        migrations.RunPython(populate_content_hashes, migrations.RunPython.noop),
+    ]
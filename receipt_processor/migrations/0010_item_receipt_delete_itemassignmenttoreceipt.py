@@ -0,0 +1,56 @@
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_assignments_to_items(apps, schema_editor):
+    """
+    Point every Item at the Receipt it was assigned to, and drop Items that were never assigned.
+    """
+    db_alias = schema_editor.connection.alias
+    Item = apps.get_model('receipt_processor', 'Item')
+    ItemAssignmentToReceipt = apps.get_model('receipt_processor', 'ItemAssignmentToReceipt')
+
+    Item.objects.using(db_alias).update(receipt_id=Subquery(
+        ItemAssignmentToReceipt.objects.using(db_alias).filter(item_id=OuterRef('pk')).values('receipt_id')[:1]
+    ))
+    Item.objects.using(db_alias).filter(receipt__isnull=True).delete()
+
+
+def copy_items_to_assignments(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+    Item = apps.get_model('receipt_processor', 'Item')
+    ItemAssignmentToReceipt = apps.get_model('receipt_processor', 'ItemAssignmentToReceipt')
+
+    ItemAssignmentToReceipt.objects.using(db_alias).bulk_create(
+        ItemAssignmentToReceipt(item_id=item_id, receipt_id=receipt_id)
+        for item_id, receipt_id in Item.objects.using(db_alias).values_list('id', 'receipt_id').iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('receipt_processor', '0009_receipt_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='receipt',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='receipt_processor.receipt'),
+        ),
+        migrations.RunPython(copy_assignments_to_items, copy_items_to_assignments),
+        migrations.RemoveField(
+            model_name='receipt',
+            name='items',
+        ),
+        migrations.DeleteModel(
+            name='ItemAssignmentToReceipt',
+        ),
+        migrations.AlterField(
+            model_name='item',
+            name='receipt',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='receipt_processor.receipt'),
+        ),
+    ]
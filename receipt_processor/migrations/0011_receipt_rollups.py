@@ -0,0 +1,69 @@
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def populate_rollups(apps, schema_editor):
+    """
+    Aggregate the existing receipts into the rollup tables, the same way rollups.rebuild_rollups does.
+    """
+    db_alias = schema_editor.connection.alias
+    Receipt = apps.get_model('receipt_processor', 'Receipt')
+    RetailerDailyRollup = apps.get_model('receipt_processor', 'RetailerDailyRollup')
+    PointsRollup = apps.get_model('receipt_processor', 'PointsRollup')
+
+    daily = Receipt.objects.using(db_alias).values('retailer', 'purchase_date').annotate(receipts=Count('id'), total_points=Sum('points'))
+    RetailerDailyRollup.objects.using(db_alias).bulk_create(
+        RetailerDailyRollup(
+            retailer=row['retailer'],
+            purchase_date=row['purchase_date'],
+            receipts=row['receipts'],
+            points=row['total_points'],
+        )
+        for row in daily.order_by().iterator()
+    )
+    distribution = Receipt.objects.using(db_alias).values('points').annotate(receipts=Count('id'))
+    PointsRollup.objects.using(db_alias).bulk_create(
+        PointsRollup(points=row['points'], receipts=row['receipts'])
+        for row in distribution.order_by().iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('receipt_processor', '0010_item_receipt_delete_itemassignmenttoreceipt'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='receipt',
+            index=models.Index(fields=['retailer', 'purchase_date'], name='receipt_retailer_date_idx'),
+        ),
+        migrations.CreateModel(
+            name='RetailerDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('retailer', models.CharField(max_length=30)),
+                ('purchase_date', models.DateField()),
+                ('receipts', models.BigIntegerField(default=0)),
+                ('points', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [
+                    models.UniqueConstraint(fields=('retailer', 'purchase_date'), name='retailer_daily_rollup_unique'),
+                ],
+                'indexes': [
+                    models.Index(fields=['purchase_date'], name='retailer_daily_rollup_date_idx'),
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name='PointsRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('points', models.BigIntegerField(unique=True)),
+                ('receipts', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
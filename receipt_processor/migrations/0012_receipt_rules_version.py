@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('receipt_processor', '0011_receipt_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='receipt',
+            name='rules_version',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,67 @@
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def copy_amounts(model, source, target, convert, using, batch_size=1000):
+    batch = []
+    for row in model.objects.using(using).only('pk', source).iterator(chunk_size=batch_size):
+        setattr(row, target, convert(getattr(row, source)))
+        batch.append(row)
+        if len(batch) == batch_size:
+            model.objects.using(using).bulk_update(batch, [target])
+            batch = []
+    model.objects.using(using).bulk_update(batch, [target])
+
+
+def decimals_to_cents(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+    to_cents = lambda amount: int(amount * 100)
+    copy_amounts(apps.get_model('receipt_processor', 'Receipt'), 'total', 'total_cents', to_cents, db_alias)
+    copy_amounts(apps.get_model('receipt_processor', 'Item'), 'price', 'price_cents', to_cents, db_alias)
+
+
+def cents_to_decimals(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+    to_decimal = lambda cents: Decimal(cents).scaleb(-2)
+    copy_amounts(apps.get_model('receipt_processor', 'Receipt'), 'total_cents', 'total', to_decimal, db_alias)
+    copy_amounts(apps.get_model('receipt_processor', 'Item'), 'price_cents', 'price', to_decimal, db_alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('receipt_processor', '0012_receipt_rules_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='receipt',
+            name='total_cents',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='price_cents',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='receipt',
+            name='total',
+            field=models.DecimalField(decimal_places=2, max_digits=20, null=True),
+        ),
+        migrations.RunPython(decimals_to_cents, cents_to_decimals),
+        migrations.RemoveField(
+            model_name='receipt',
+            name='total',
+        ),
+        migrations.RemoveField(
+            model_name='item',
+            name='price',
+        ),
+        migrations.AlterField(
+            model_name='receipt',
+            name='total_cents',
+            field=models.BigIntegerField(),
+        ),
+    ]
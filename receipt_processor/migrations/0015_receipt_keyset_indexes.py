@@ -0,0 +1,24 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('receipt_processor', '0014_idempotencykey'),
+    ]
+
+    operations = [
+        # Extended with the id rather than kept alongside, it still serves (retailer, purchase_date) lookups
+        migrations.RemoveIndex(
+            model_name='receipt',
+            name='receipt_retailer_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='receipt',
+            index=models.Index(fields=['retailer', 'purchase_date', 'id'], name='receipt_retailer_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='receipt',
+            index=models.Index(fields=['purchase_date', 'id'], name='receipt_date_id_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('receipt_processor', '0015_receipt_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReceiptAlias',
+            fields=[
+                ('id', models.UUIDField(editable=False, primary_key=True, serialize=False)),
+                ('receipt', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='aliases', to='receipt_processor.receipt')),
+            ],
+        ),
+    ]
@@ -1,25 +1,70 @@
 """
 Models for receipt_processor
 """
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from datetime import datetime
 import uuid
 
 class Item(models.Model):
+    # Items are never shared between receipts, so each one points straight at its receipt
+    receipt = models.ForeignKey('Receipt', on_delete=models.CASCADE, related_name='items')
     short_description = models.CharField(max_length=100, blank=False, null=False, default='')
-    price = models.DecimalField(max_digits=20, decimal_places=2, blank=False, null=False, default=0)
+    price_cents = models.BigIntegerField(default=0)  # Money is stored as integer cents, see money.py
 
 class Receipt(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     retailer = models.CharField(max_length=30, blank=False, null=False)
     purchase_date = models.DateField(blank=False, null=False, default=datetime.today())
     purchase_time = models.TimeField(blank=False, null=False, default=datetime.now().time())
-    total = models.DecimalField(max_digits=20, decimal_places=2, blank=False, null=False)
+    total_cents = models.BigIntegerField(blank=False, null=False)
     points = models.BigIntegerField(default=0)  # Big integer field covers the int64 specification in api.yml
+    # Rules version that produced `points`, built in (scoring.RULE_SETS) or from the rules file, see rules.py
+    rules_version = models.PositiveSmallIntegerField(default=1)
+    # SHA-256 of the normalized receipt, items included, see ingest.receipt_content_hash
+    content_hash = models.CharField(max_length=64, unique=True, null=True, editable=False)
 
-    # create a join table with foreign keys to Receipt and Item
-    items = models.ManyToManyField(Item, through='ItemAssignmentToReceipt')
+    class Meta:
+        indexes = [
+            # Both end in the id so the keyset pages of retrieval.list_receipts are index range scans
+            models.Index(fields=['retailer', 'purchase_date', 'id'], name='receipt_retailer_date_id_idx'),
+            models.Index(fields=['purchase_date', 'id'], name='receipt_date_id_idx'),
+        ]
 
-class ItemAssignmentToReceipt(models.Model):
-    receipt = models.ForeignKey(Receipt, on_delete=models.CASCADE)
-    item = models.ForeignKey(Item, on_delete=models.CASCADE)
+class ReceiptAlias(models.Model):
+    # An id handed out by the write-behind queue for a receipt that was already stored under another id, see writebehind.py
+    id = models.UUIDField(primary_key=True, editable=False)
+    receipt = models.ForeignKey('Receipt', on_delete=models.CASCADE, related_name='aliases')
+
+class RetailerDailyRollup(models.Model):
+    # Receipt count and points per retailer and purchase date, kept up to date by rollups.record_receipts
+    retailer = models.CharField(max_length=30, blank=False, null=False)
+    purchase_date = models.DateField(blank=False, null=False)
+    receipts = models.BigIntegerField(default=0)
+    points = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['retailer', 'purchase_date'], name='retailer_daily_rollup_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['purchase_date'], name='retailer_daily_rollup_date_idx'),
+        ]
+
+class PointsRollup(models.Model):
+    # Number of receipts awarded each points value, kept up to date by rollups.record_receipts
+    points = models.BigIntegerField(unique=True)
+    receipts = models.BigIntegerField(default=0)
+
+class IdempotencyKey(models.Model):
+    # Response replayed for retries of POST /receipts/process carrying the same Idempotency-Key, see idempotency.py
+    key = models.CharField(max_length=255, primary_key=True)
+    fingerprint = models.CharField(max_length=64)  # SHA-256 of the request body the key was first used with
+    status = models.PositiveSmallIntegerField()
+    response = models.JSONField(encoder=DjangoJSONEncoder)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['expires_at'], name='idempotency_key_expires_idx'),
+        ]
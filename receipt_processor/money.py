@@ -0,0 +1,26 @@
+"""
+Integer cents, the money representation used from parsing through scoring to storage.
+
+Amounts arrive as strings matching api.yml's `^\d+\.\d{2}$`, so they convert to whole cents
+exactly, without going through float or Decimal.
+"""
+
+
+# Largest amount accepted, $9,999,999,999,999.99. Cents are stored in 64-bit integer columns and
+# summed into the rollups, so single amounts are held well below the int64 limit.
+MAX_CENTS = 10 ** 15 - 1
+
+
+def parse_cents(amount):
+    """
+    Convert a validated amount string such as '35.35' to integer cents (3535).
+    """
+    dollars, cents = amount.split('.')
+    return int(dollars) * 100 + int(cents)
+
+
+def format_cents(cents):
+    """
+    Convert integer cents back to the api.yml amount format, e.g. 3535 -> '35.35'.
+    """
+    return f'{cents // 100}.{cents % 100:02d}'
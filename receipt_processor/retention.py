@@ -0,0 +1,251 @@
+"""
+Retention of stored receipts: deleting old receipts, optionally archiving them first, and
+compacting the database afterwards. Run it periodically with the apply_retention command.
+
+    RECEIPT_RETENTION = {
+        'MAX_AGE_DAYS': None,    # receipts purchased more than this many days ago are deleted, None keeps all
+        'BATCH_SIZE': 1000,      # receipts deleted per transaction
+        'PAUSE': 0.0,            # seconds between transactions, leaving the write lock to the web processes
+        'VACUUM_PAGES': 1000,    # free pages returned to the filesystem per incremental vacuum step
+    }
+
+Receipts are deleted oldest first, one short transaction per batch on the receipt's shard. Each
+transaction subtracts the batch from the rollups (rollups.record_receipts with sign=-1) and deletes
+the receipts and their items, so the analytics endpoints never see a half-applied batch. Items
+left without a receipt, which the foreign key should prevent but an import outside the ORM or a
+manual edit can leave behind, are swept up afterwards.
+
+Deleted rows only become free pages inside the SQLite file. compact() returns them to the
+filesystem with incremental vacuum, a few pages at a time; the database must be in
+auto_vacuum=INCREMENTAL mode, which a one-off full vacuum (vacuum='full') switches it to.
+"""
+from datetime import date, datetime, timedelta
+import gzip
+import json
+import os
+import time
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Exists, OuterRef
+
+from receipt_processor.cache import get_points_cache
+from receipt_processor.models import Item, PointsRollup, Receipt, RetailerDailyRollup
+from receipt_processor.retrieval import RECEIPT_FIELDS, prefetch_items, receipt_document
+from receipt_processor.rollups import record_receipts
+
+
+DEFAULTS = {
+    'MAX_AGE_DAYS': None,
+    'BATCH_SIZE': 1000,
+    'PAUSE': 0.0,
+    'VACUUM_PAGES': 1000,
+}
+
+VACUUM_MODES = ('none', 'incremental', 'full')
+
+# SQLite's PRAGMA auto_vacuum values
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+def retention_config():
+    return {**DEFAULTS, **getattr(settings, 'RECEIPT_RETENTION', {})}
+
+
+def cutoff_date(max_age_days, today=None):
+    """
+    The earliest purchase date that is kept when receipts older than `max_age_days` are deleted.
+    """
+    return (today or date.today()) - timedelta(days=max_age_days)
+
+
+class ReceiptArchive:
+    """
+    Gzip compressed NDJSON file of deleted receipts, one receipt per line in the shape it was
+    submitted in, plus its id, points and rules version for the record. import_receipts reads the
+    file, but ignores those three fields: it stores the receipts again as new receipts, under new
+    ids and scored with the current rules.
+
+    Lines are written to `path` + '.partial' and flushed before the receipts are deleted; the file
+    is renamed to `path` when the archive is closed, or removed if no receipt was written.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.partial_path = f'{path}.partial'
+        self.receipts = 0
+        self._file = gzip.open(self.partial_path, 'wt', encoding='utf-8')
+
+    def write(self, receipts):
+        prefetch_items(receipts)
+        for receipt in receipts:
+            document = {**receipt_document(receipt), 'rulesVersion': receipt.rules_version}
+            self._file.write(json.dumps(document, separators=(',', ':')) + '\n')
+        self._file.flush()
+        self.receipts += len(receipts)
+
+    def close(self):
+        self._file.close()
+        if self.receipts:
+            os.replace(self.partial_path, self.path)
+        else:
+            os.remove(self.partial_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def expired_receipts(before, using):
+    """
+    The receipts of the `using` database purchased before `before`, oldest first.
+    """
+    return Receipt.objects.using(using).filter(purchase_date__lt=before).order_by('purchase_date', 'id')
+
+
+def delete_expired_receipts(before, using, batch_size=None, pause=None, archive=None):
+    """
+    Delete the receipts of the `using` database purchased before `before`, with their items and
+    their share of the rollups, `batch_size` receipts per transaction. Receipts are written to
+    `archive`, a ReceiptArchive, before they are deleted.
+
+    Returns the number of receipts and items deleted.
+    """
+    config = retention_config()
+    batch_size = batch_size or config['BATCH_SIZE']
+    pause = config['PAUSE'] if pause is None else pause
+    points_cache = get_points_cache()
+
+    deleted_receipts = deleted_items = 0
+    while True:
+        with transaction.atomic(using=using):
+            batch = list(expired_receipts(before, using).only(*RECEIPT_FIELDS)[:batch_size])
+            if not batch:
+                break
+            if archive is not None:
+                archive.write(batch)
+            record_receipts(batch, sign=-1, using=using)
+            _, counts = Receipt.objects.using(using).filter(id__in=[receipt.id for receipt in batch]).delete()
+        deleted_receipts += counts.get(Receipt._meta.label, 0)
+        deleted_items += counts.get(Item._meta.label, 0)
+        for receipt in batch:
+            points_cache.delete(str(receipt.id))
+        if len(batch) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+
+    # Rollup rows of days and points values that no longer have any receipts
+    with transaction.atomic(using=using):
+        RetailerDailyRollup.objects.using(using).filter(receipts=0).delete()
+        PointsRollup.objects.using(using).filter(receipts=0).delete()
+    return deleted_receipts, deleted_items
+
+
+def orphaned_items(using):
+    """
+    The items of the `using` database whose receipt no longer exists.
+    """
+    receipt_exists = Exists(Receipt.objects.using(using).filter(pk=OuterRef('receipt_id')))
+    return Item.objects.using(using).filter(~receipt_exists)
+
+
+def delete_orphaned_items(using, batch_size=None):
+    """
+    Delete the items of the `using` database whose receipt no longer exists. Returns the number deleted.
+    """
+    batch_size = batch_size or retention_config()['BATCH_SIZE']
+    orphans = orphaned_items(using).order_by('pk').values_list('pk', flat=True)
+
+    deleted = 0
+    while True:
+        with transaction.atomic(using=using):
+            batch = list(orphans[:batch_size])
+            if batch:
+                deleted += Item.objects.using(using).filter(pk__in=batch).delete()[0]
+        if len(batch) < batch_size:
+            return deleted
+
+
+def database_size(using):
+    """
+    The size in bytes of the `using` SQLite database and of its free pages, or (None, None) for
+    other databases.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return None, None
+    with connection.cursor() as cursor:
+        page_size = cursor.execute('PRAGMA page_size').fetchone()[0]
+        page_count = cursor.execute('PRAGMA page_count').fetchone()[0]
+        free_pages = cursor.execute('PRAGMA freelist_count').fetchone()[0]
+    return page_count * page_size, free_pages * page_size
+
+
+def compact(using, vacuum='incremental', analyze=True, vacuum_pages=None, pause=None):
+    """
+    Return free pages of the `using` SQLite database to the filesystem and refresh the query
+    planner statistics.
+
+    vacuum='incremental' frees `vacuum_pages` pages per step, pausing `pause` seconds in between,
+    and does nothing unless the database is in auto_vacuum=INCREMENTAL mode. vacuum='full'
+    rewrites the whole file, holding the write lock throughout, and switches the database to
+    incremental mode for later runs. Vacuuming is skipped for other databases.
+    """
+    config = retention_config()
+    vacuum_pages = vacuum_pages or config['VACUUM_PAGES']
+    pause = config['PAUSE'] if pause is None else pause
+    connection = connections[using]
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite' and vacuum == 'full':
+            cursor.execute(f'PRAGMA auto_vacuum = {AUTO_VACUUM_INCREMENTAL}')
+            cursor.execute('VACUUM')
+        elif connection.vendor == 'sqlite' and vacuum == 'incremental':
+            if cursor.execute('PRAGMA auto_vacuum').fetchone()[0] == AUTO_VACUUM_INCREMENTAL:
+                while cursor.execute('PRAGMA freelist_count').fetchone()[0]:
+                    cursor.execute(f'PRAGMA incremental_vacuum({vacuum_pages})').fetchall()
+                    if pause:
+                        time.sleep(pause)
+        if analyze:
+            cursor.execute('ANALYZE')
+
+
+def archive_path(directory, before, using):
+    timestamp = datetime.now().strftime('%Y%m%dT%H%M%S')
+    return os.path.join(directory, f'receipts-{using}-before-{before.isoformat()}-{timestamp}.ndjson.gz')
+
+
+def apply_retention(before, using, archive_dir=None, batch_size=None, pause=None, vacuum='incremental', analyze=True):
+    """
+    Delete the receipts of the `using` database purchased before `before` and the orphaned items,
+    archiving the receipts to `archive_dir` if given, then compact the database.
+
+    Returns a report of the rows deleted and of the database size in bytes: `bytes_freed` is the
+    free space inside the file after the deletes, reused by later writes, and `bytes_reclaimed` how
+    much the file shrank. Sizes are None for databases other than SQLite.
+    """
+    bytes_before, _ = database_size(using)
+    archive = ReceiptArchive(archive_path(archive_dir, before, using)) if archive_dir else None
+    try:
+        receipts, items = delete_expired_receipts(before, using, batch_size=batch_size, pause=pause, archive=archive)
+    finally:
+        if archive is not None:
+            archive.close()
+    orphans = delete_orphaned_items(using, batch_size=batch_size)
+    _, bytes_freed = database_size(using)
+    compact(using, vacuum=vacuum, analyze=analyze, pause=pause)
+    bytes_after, _ = database_size(using)
+
+    return {
+        'receipts': receipts,
+        'items': items,
+        'orphaned_items': orphans,
+        'archive': archive.path if archive is not None and archive.receipts else None,
+        'bytes_before': bytes_before,
+        'bytes_after': bytes_after,
+        'bytes_freed': bytes_freed,
+        'bytes_reclaimed': None if bytes_before is None else bytes_before - bytes_after,
+    }
@@ -0,0 +1,156 @@
+"""
+Reading stored receipts back: one receipt by id, or pages of receipts for browsing.
+
+Pages use keyset (cursor) pagination in (purchase_date, id) order, newest first. The cursor is the
+position of the last receipt on the previous page, so every page is an index range scan on
+receipt_date_id_idx (or receipt_retailer_date_id_idx when filtered by retailer) that reads `limit`
+rows, however deep it is, where OFFSET would read and skip every earlier row. With sharding, each
+shard returns its next `limit` receipts and the pages are merged.
+
+Items are loaded with one prefetch query per shard and page, after the ETag has been checked, so a
+request answered with 304 Not Modified never reads them.
+"""
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import date
+from operator import attrgetter
+import hashlib
+import heapq
+import uuid
+
+from django.db.models import Prefetch, Q, prefetch_related_objects
+
+from receipt_processor.models import Item, Receipt
+from receipt_processor.money import format_cents
+from receipt_processor.sharding import receipt_shards, shard_for_receipt
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+RECEIPT_FIELDS = ('id', 'retailer', 'purchase_date', 'purchase_time', 'total_cents', 'points', 'rules_version')
+ORDERING = ('-purchase_date', '-id')
+
+sort_key = attrgetter('purchase_date', 'id')
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(receipt):
+    """
+    The opaque cursor of the page following `receipt`.
+    """
+    position = f'{receipt.purchase_date.isoformat()}|{receipt.id}'
+    return urlsafe_b64encode(position.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    The (purchase date, receipt id) position encoded in `cursor`. Raises InvalidCursor for a cursor
+    that encode_cursor did not produce.
+    """
+    try:
+        purchase_date, receipt_id = urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode().split('|')
+        return date.fromisoformat(purchase_date), uuid.UUID(receipt_id)
+    except ValueError as e:
+        raise InvalidCursor(f'Invalid cursor {cursor!r}') from e
+
+
+def get_receipt(receipt_id):
+    """
+    The receipt with `receipt_id`, without its items, or None. Raises ValueError for an id that is not a UUID.
+    """
+    return Receipt.objects.using(shard_for_receipt(receipt_id)).only(*RECEIPT_FIELDS).filter(id=receipt_id).first()
+
+
+def page_queryset(start=None, end=None, retailer=None, cursor=None):
+    """
+    The receipts purchased between `start` and `end` inclusive, optionally from one retailer, that
+    come after `cursor`, newest first.
+    """
+    receipts = Receipt.objects.only(*RECEIPT_FIELDS).order_by(*ORDERING)
+    if start is not None:
+        receipts = receipts.filter(purchase_date__gte=start)
+    if end is not None:
+        receipts = receipts.filter(purchase_date__lte=end)
+    if retailer is not None:
+        receipts = receipts.filter(retailer=retailer)
+    if cursor is not None:
+        last_date, last_id = decode_cursor(cursor)
+        # The first condition bounds the index range scan, the second skips the receipts of the
+        # last date that were already returned
+        receipts = receipts.filter(Q(purchase_date__lte=last_date), Q(purchase_date__lt=last_date) | Q(id__lt=last_id))
+    return receipts
+
+
+def list_receipts(start=None, end=None, retailer=None, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    One page of receipts purchased between `start` and `end` inclusive, optionally from one retailer,
+    newest first, without their items. Returns (receipts, cursor of the next page or None).
+    """
+    receipts = page_queryset(start, end, retailer, cursor)
+    # One extra row tells whether there is a next page
+    shard_pages = [list(receipts.using(shard)[:limit + 1]) for shard in receipt_shards()]
+    if len(shard_pages) == 1:
+        page = shard_pages[0]
+    else:
+        page = list(heapq.merge(*shard_pages, key=sort_key, reverse=True))
+    if len(page) > limit:
+        return page[:limit], encode_cursor(page[limit - 1])
+    return page, None
+
+
+def prefetch_items(receipts):
+    """
+    Load the items of `receipts` with one query per shard, in the order they were listed on the receipt.
+    """
+    by_shard = {}
+    for receipt in receipts:
+        by_shard.setdefault(receipt._state.db, []).append(receipt)
+    for shard_receipts in by_shard.values():
+        prefetch_related_objects(shard_receipts, Prefetch(
+            'items', queryset=Item.objects.only('receipt_id', 'short_description', 'price_cents').order_by('pk'),
+        ))
+
+
+def receipt_etag(receipts, next_cursor=None):
+    """
+    Strong ETag of the representation of `receipts` (and the cursor of the page after them). Receipts
+    and their items never change after they are stored, except for the points when rescored under a
+    new rules version.
+    """
+    digest = hashlib.sha256(f'{next_cursor};'.encode())
+    for receipt in receipts:
+        digest.update(f'{receipt.id}:{receipt.rules_version}:{receipt.points};'.encode())
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match, etag):
+    """
+    Whether the If-None-Match header value `if_none_match` names `etag`.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return etag in (tag.strip().removeprefix('W/') for tag in if_none_match.split(','))
+
+
+def receipt_document(receipt):
+    """
+    The receipt, with its prefetched items, in the shape it was submitted in (api.yml's Receipt),
+    plus its id and points.
+    """
+    return {
+        'id': str(receipt.id),
+        'retailer': receipt.retailer,
+        'purchaseDate': receipt.purchase_date.isoformat(),
+        'purchaseTime': receipt.purchase_time.strftime('%H:%M'),
+        'total': format_cents(receipt.total_cents),
+        'items': [
+            {'shortDescription': item.short_description, 'price': format_cents(item.price_cents)}
+            for item in receipt.items.all()
+        ],
+        'points': receipt.points,
+    }
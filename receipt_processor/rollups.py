@@ -0,0 +1,168 @@
+"""
+Incrementally maintained aggregates for the analytics endpoints.
+
+Every receipt stored through ingest.save_receipts is added to two rollup tables in the same
+transaction:
+
+    RetailerDailyRollup  receipt count and points per (retailer, purchase date)
+    PointsRollup         receipt count per points value
+
+Their size depends on the number of retailers and days, not receipts, so the analytics queries
+stay cheap however large the Receipt table grows. rebuild_rollups() recomputes both tables from
+the receipts, to backfill them or repair any drift (see the rebuild_rollups command).
+
+When receipts are sharded each shard keeps the rollups of its own receipts, and the query
+functions below run on every shard and merge the results.
+"""
+from collections import Counter
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Count, Sum
+
+from receipt_processor.models import PointsRollup, Receipt, RetailerDailyRollup
+from receipt_processor.sharding import receipt_shards
+
+
+def record_receipts(receipts, sign=1, using=DEFAULT_DB_ALIAS):
+    """
+    Add `receipts` (anything with retailer, purchase_date and points) to the rollups of the
+    `using` database, or remove them with `sign=-1`.
+
+    Runs in the caller's transaction; each rollup row is incremented atomically with an upsert.
+    """
+    daily = Counter()
+    daily_points = Counter()
+    distribution = Counter()
+    for receipt in receipts:
+        key = (receipt.retailer, receipt.purchase_date)
+        daily[key] += sign
+        daily_points[key] += sign * receipt.points
+        distribution[receipt.points] += sign
+    if not daily:
+        return
+
+    connection = connections[using]
+    adapt_date = connection.ops.adapt_datefield_value
+    _upsert(
+        connection,
+        RetailerDailyRollup,
+        conflict_fields=['retailer', 'purchase_date'],
+        increment_fields=['receipts', 'points'],
+        rows=[
+            (retailer, adapt_date(purchase_date), count, daily_points[retailer, purchase_date])
+            for (retailer, purchase_date), count in daily.items()
+        ],
+    )
+    _upsert(
+        connection,
+        PointsRollup,
+        conflict_fields=['points'],
+        increment_fields=['receipts'],
+        rows=list(distribution.items()),
+    )
+
+
+def _upsert(connection, model, conflict_fields, increment_fields, rows):
+    # Django's bulk_create(update_conflicts=True) can only overwrite columns, not add to them
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    columns = [quote(model._meta.get_field(name).column) for name in (*conflict_fields, *increment_fields)]
+    conflict_columns = columns[:len(conflict_fields)]
+    increment_columns = columns[len(conflict_fields):]
+    sql = (
+        f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({", ".join(["%s"] * len(columns))}) '
+        f'ON CONFLICT ({", ".join(conflict_columns)}) DO UPDATE SET '
+        + ', '.join(f'{column} = {table}.{column} + excluded.{column}' for column in increment_columns)
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+def rebuild_rollups(using=DEFAULT_DB_ALIAS):
+    """
+    Recompute both rollup tables of the `using` database from its Receipt table. Returns the number
+    of rows written to each.
+    """
+    receipts = Receipt.objects.using(using)
+    daily = receipts.values('retailer', 'purchase_date').annotate(receipts=Count('id'), total_points=Sum('points'))
+    distribution = receipts.values('points').annotate(receipts=Count('id'))
+    with transaction.atomic(using=using):
+        RetailerDailyRollup.objects.using(using).all().delete()
+        PointsRollup.objects.using(using).all().delete()
+        daily_rows = RetailerDailyRollup.objects.using(using).bulk_create(
+            (
+                RetailerDailyRollup(
+                    retailer=row['retailer'],
+                    purchase_date=row['purchase_date'],
+                    receipts=row['receipts'],
+                    points=row['total_points'],
+                )
+                for row in daily.order_by().iterator()
+            ),
+            batch_size=1000,
+        )
+        distribution_rows = PointsRollup.objects.using(using).bulk_create(
+            (PointsRollup(points=row['points'], receipts=row['receipts']) for row in distribution.order_by().iterator()),
+            batch_size=1000,
+        )
+    return {'retailer_daily': len(daily_rows), 'points': len(distribution_rows)}
+
+
+def retailer_totals(start=None, end=None, retailer=None):
+    """
+    Receipt count and points per retailer, for purchases between `start` and `end` inclusive.
+    """
+    totals = _merge_daily_totals('retailer', start, end, retailer)
+    return sorted(
+        ((retailer, receipts, points) for retailer, (receipts, points) in totals.items()),
+        key=lambda row: (-row[2], row[0]),
+    )
+
+
+def daily_totals(start=None, end=None, retailer=None):
+    """
+    Receipt count and points per purchase date, optionally for one retailer.
+    """
+    totals = _merge_daily_totals('purchase_date', start, end, retailer)
+    return sorted((purchase_date, receipts, points) for purchase_date, (receipts, points) in totals.items())
+
+
+def points_distribution(bucket_size=1):
+    """
+    Number of receipts per points range, as (lowest points in the range, receipts) pairs.
+    """
+    buckets = Counter()
+    for shard in receipt_shards():
+        for points, receipts in PointsRollup.objects.using(shard).filter(receipts__gt=0).values_list('points', 'receipts'):
+            buckets[points - points % bucket_size] += receipts
+    return sorted(buckets.items())
+
+
+def _merge_daily_totals(group_by, start, end, retailer):
+    """
+    {group_by value: [receipts, points]} summed over the retailer/day rollups of every shard.
+    """
+    totals = {}
+    for shard in receipt_shards():
+        rows = (
+            _filter_daily(shard, start, end, retailer).values(group_by)
+            .annotate(receipts_count=Sum('receipts'), points_total=Sum('points'))
+            .values_list(group_by, 'receipts_count', 'points_total')
+            .order_by()
+        )
+        for key, receipts, points in rows:
+            merged = totals.setdefault(key, [0, 0])
+            merged[0] += receipts
+            merged[1] += points
+    return totals
+
+
+def _filter_daily(using, start, end, retailer):
+    rows = RetailerDailyRollup.objects.using(using).filter(receipts__gt=0)
+    if start is not None:
+        rows = rows.filter(purchase_date__gte=start)
+    if end is not None:
+        rows = rows.filter(purchase_date__lte=end)
+    if retailer is not None:
+        rows = rows.filter(retailer=retailer)
+    return rows
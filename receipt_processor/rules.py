@@ -0,0 +1,449 @@
+"""
+Declarative point rules, compiled into one fused scoring function per rules version.
+
+Rule sets beyond the built-in ones of scoring.RULE_SETS are defined in a YAML (or JSON) file,
+selected with the RECEIPT_RULES setting:
+
+    RECEIPT_RULES = {
+        'PATH': None,              # rules file, None for the built-in rule sets only
+        'RELOAD_INTERVAL': 5.0,    # seconds between checks of the file for changes, None never reloads
+    }
+
+The file lists rule sets by version, each a list of rules plus optional extra rules for given
+retailers (promotions), and may name the version new receipts are scored with:
+
+    current: 2                      # takes precedence over the RECEIPT_RULES_VERSION setting
+    rule_sets:
+      - version: 2
+        rules:
+          - {rule: retailer_alphanumerics, points: 1}
+          - {rule: total_multiple, cents: 100, points: 50}
+          - {rule: purchase_time_window, start: '14:00', end: '16:00', points: 10}
+        retailers:
+          Target:
+            - {rule: purchase_date_window, start: 2022-12-01, end: 2023-01-01, points: 100}
+
+See RULE_KINDS for the rules and their parameters; times must be quoted, YAML reads 14:00 as a
+number. Windows include their start and exclude their end.
+
+At load time every rule set is turned into the source of a single Python function with the
+parameters inlined, the same code calculate_points has written by hand, and compiled once.
+Retailers with extra rules get their own fused function, picked with one dict lookup. Scoring a
+receipt therefore costs no more than the hand-written rules, see benchmarks/scoring.py.
+
+A version's rules must never change once receipts were scored with it (each Receipt stores its
+rules version, see scoring.py): publish a new version and switch `current` to it instead. The
+file is checked for changes every RELOAD_INTERVAL seconds by whichever request comes first; the
+new rule sets replace the old ones in one reference swap, so requests already scoring finish with
+the rules they started with. A file that does not load, or that changes a version already in use,
+is logged and ignored, and the previous rules keep serving. A version removed from the file stays
+loaded, as stored receipts may carry it. Both guards only know the versions this process loaded:
+after a restart an edited version loads as it now reads, so keep every published version in the
+file unchanged.
+"""
+from collections import namedtuple
+from datetime import date, time
+import functools
+import logging
+import os
+import threading
+import time as clock
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from receipt_processor.scoring import LATEST_RULES_VERSION, RULE_SETS, get_rule_set, retailer_points
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RELOAD_INTERVAL = 5.0
+
+# Largest version a Receipt can store (PositiveSmallIntegerField)
+MAX_RULES_VERSION = 32767
+
+CompiledRuleSet = namedtuple('CompiledRuleSet', [
+    'version',
+    'score',          # score(retailer, purchase_date, purchase_time, total_cents, items) -> points
+    'definition',     # the normalized rules it was compiled from
+    'source',         # the generated Python source of `score`
+])
+
+RulesState = namedtuple('RulesState', ['rule_sets', 'current_version'])
+
+
+class InvalidRules(ValueError):
+    pass
+
+
+def _integer(value):
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError('must be an integer')
+    return value
+
+
+def _positive_integer(value):
+    if _integer(value) <= 0:
+        raise ValueError('must be a positive integer')
+    return value
+
+
+def _time_of_day(value):
+    if isinstance(value, time):
+        return value
+    if not isinstance(value, str):
+        raise ValueError("must be a quoted 'HH:MM' time")
+    return time.fromisoformat(value)
+
+
+def _date(value):
+    if isinstance(value, date):
+        return value
+    if not isinstance(value, str):
+        raise ValueError('must be a YYYY-MM-DD date')
+    return date.fromisoformat(value)
+
+
+# Rule name -> parameters and how to read each. Item rules are scored once per item.
+RULE_KINDS = {
+    # `points` per alphanumeric character of the retailer name
+    'retailer_alphanumerics': {'points': _integer},
+    # `points` if the total is a multiple of `cents`
+    'total_multiple': {'cents': _positive_integer, 'points': _integer},
+    # `points` for every `every` items
+    'item_count': {'every': _positive_integer, 'points': _integer},
+    # `points` if the day of the purchase date is odd
+    'odd_day': {'points': _integer},
+    # `points` for a purchase time from `start` to before `end`
+    'purchase_time_window': {'start': _time_of_day, 'end': _time_of_day, 'points': _integer},
+    # `points` for a purchase date from `start` to before `end`
+    'purchase_date_window': {'start': _date, 'end': _date, 'points': _integer},
+    # for each item whose trimmed description length is a multiple of `multiple`, `percent` of its
+    # price in dollars, rounded up
+    'description_length_multiple': {'multiple': _positive_integer, 'percent': _integer},
+}
+
+ITEM_RULES = {'description_length_multiple'}
+
+
+def normalize_rule(rule):
+    """
+    Check a rule from a rules file, e.g. {'rule': 'odd_day', 'points': 6}, and return it with its
+    parameters read (times and dates as time and date objects).
+    """
+    if not isinstance(rule, dict) or 'rule' not in rule:
+        raise InvalidRules(f'A rule must be a mapping with a "rule" key, not {rule!r}')
+    kind = rule['rule']
+    if kind not in RULE_KINDS:
+        raise InvalidRules(f'Unknown rule {kind!r}, known rules: {sorted(RULE_KINDS)}')
+    parameters = RULE_KINDS[kind]
+    given = set(rule) - {'rule'}
+    if given != set(parameters):
+        raise InvalidRules(f'Rule {kind} takes the parameters {sorted(parameters)}, not {sorted(given)}')
+    normalized = {'rule': kind}
+    for name, read in parameters.items():
+        try:
+            normalized[name] = read(rule[name])
+        except ValueError as e:
+            raise InvalidRules(f'Rule {kind}: {name} {e}') from None
+    return normalized
+
+
+def rule_set_definition(rule_set):
+    """
+    The rules of a built-in scoring.RuleSet, in the form of a rules file.
+    """
+    return [
+        {'rule': 'retailer_alphanumerics', 'points': 1},
+        {'rule': 'total_multiple', 'cents': 100, 'points': rule_set.round_total_points},
+        {'rule': 'total_multiple', 'cents': rule_set.total_multiple_cents, 'points': rule_set.total_multiple_points},
+        {'rule': 'item_count', 'every': 2, 'points': rule_set.item_pair_points},
+        {'rule': 'odd_day', 'points': rule_set.odd_day_points},
+        {'rule': 'purchase_time_window', 'start': rule_set.afternoon_start, 'end': rule_set.afternoon_end,
+         'points': rule_set.afternoon_points},
+        {'rule': 'description_length_multiple', 'multiple': rule_set.description_length_multiple,
+         'percent': rule_set.description_price_percent},
+    ]
+
+
+class _FunctionSource:
+    """
+    Generates the source of one fused scoring function; values that are not plain integers are
+    passed in as module level names of the compiled code.
+    """
+
+    def __init__(self, name, namespace):
+        self.name = name
+        self.namespace = namespace
+        self.lines = []
+        self.assigned = False
+
+    def constant(self, value):
+        name = f'constant_{len(self.namespace)}'
+        self.namespace[name] = value
+        return name
+
+    def add_points(self, condition, points):
+        if condition is None:
+            self.lines.append(f'    points {"+=" if self.assigned else "="} {points}')
+        else:
+            if not self.assigned:
+                self.lines.append('    points = 0')
+            self.lines += [f'    if {condition}:', f'        points += {points}']
+        self.assigned = True
+
+    def build(self, rules, dispatch=None):
+        self.lines = [f'def {self.name}(retailer, purchase_date, purchase_time, total_cents, items):']
+        if dispatch:
+            self.lines += [
+                f'    variant = {dispatch}.get(retailer)',
+                '    if variant is not None:',
+                '        return variant(retailer, purchase_date, purchase_time, total_cents, items)',
+            ]
+        self.assigned = False
+        for rule in rules:
+            kind = rule['rule']
+            if kind == 'retailer_alphanumerics':
+                multiplier = '' if rule['points'] == 1 else f' * {rule["points"]}'
+                self.add_points(None, f'retailer_points(retailer){multiplier}')
+            elif kind == 'total_multiple':
+                self.add_points(f'total_cents % {rule["cents"]} == 0', rule['points'])
+            elif kind == 'item_count':
+                self.add_points(None, f'len(items) // {rule["every"]} * {rule["points"]}')
+            elif kind == 'odd_day':
+                self.add_points('purchase_date.day % 2', rule['points'])
+            elif kind == 'purchase_time_window':
+                start, end = self.constant(rule['start']), self.constant(rule['end'])
+                self.add_points(f'{start} <= purchase_time < {end}', rule['points'])
+            elif kind == 'purchase_date_window':
+                start, end = self.constant(rule['start']), self.constant(rule['end'])
+                self.add_points(f'{start} <= purchase_date < {end}', rule['points'])
+
+        item_rules = [rule for rule in rules if rule['rule'] in ITEM_RULES]
+        if not self.assigned:
+            self.lines.append('    points = 0')
+        if item_rules:
+            # Subtracting the floor of the negated value adds the price percentage rounded up, as
+            # scoring.calculate_points does; one loop serves every item rule
+            self.lines.append('    for short_description, price_cents in items:')
+            length = 'len(short_description.strip())'
+            if len(item_rules) > 1:
+                self.lines.append(f'        length = {length}')
+                length = 'length'
+            for rule in item_rules:
+                self.lines += [
+                    f'        if {length} % {rule["multiple"]} == 0:',
+                    f'            points -= -price_cents * {rule["percent"]} // 10000',
+                ]
+        self.lines.append('    return points')
+        return '\n'.join(self.lines) + '\n'
+
+
+def compile_rule_set(version, rules, retailers=None):
+    """
+    Compile a rules version into a CompiledRuleSet. `rules` is a list of rules in the form of a
+    rules file and `retailers` maps retailer names to the rules they get on top of those.
+    """
+    retailers = retailers or {}
+    if not isinstance(retailers, dict):
+        raise InvalidRules('retailers must map retailer names to lists of rules')
+    if not isinstance(rules, list) or not all(isinstance(extra_rules, list) for extra_rules in retailers.values()):
+        raise InvalidRules('Rules must be given as lists')
+    rules = [normalize_rule(rule) for rule in rules]
+    retailers = {
+        str(retailer): [normalize_rule(rule) for rule in extra_rules]
+        for retailer, extra_rules in retailers.items()
+    }
+    namespace = {'retailer_points': retailer_points}
+    sources = []
+    variants = {}
+    for position, (retailer, extra_rules) in enumerate(retailers.items()):
+        function = _FunctionSource(f'score_variant_{position}', namespace)
+        sources.append(function.build(rules + extra_rules))
+        variants[retailer] = function.name
+    sources.append(_FunctionSource('score', namespace).build(rules, dispatch='variants' if variants else None))
+
+    source = '\n\n'.join(sources)
+    exec(compile(source, f'<receipt rules version {version}>', 'exec'), namespace)
+    namespace['variants'] = {retailer: namespace[name] for retailer, name in variants.items()}
+    return CompiledRuleSet(version, namespace['score'], {'rules': rules, 'retailers': retailers}, source)
+
+
+@functools.lru_cache(maxsize=None)
+def compile_built_in(rule_set):
+    return compile_rule_set(rule_set.version, rule_set_definition(rule_set))
+
+
+def load_rules_file(path):
+    """
+    Read and compile the rule sets of a rules file. Returns a RulesState.
+    """
+    import yaml
+
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    try:
+        with open(path) as rules_file:
+            document = yaml.load(rules_file, Loader=loader) or {}
+    except (OSError, yaml.YAMLError) as e:
+        raise InvalidRules(f'Could not read the rules file {path}: {e}') from None
+    if not isinstance(document, dict) or not isinstance(document.get('rule_sets', []), list):
+        raise InvalidRules(f'{path} must hold a mapping with a "rule_sets" list')
+
+    rule_sets = {}
+    for entry in document.get('rule_sets', []):
+        version = entry.get('version') if isinstance(entry, dict) else None
+        if isinstance(version, bool) or not isinstance(version, int) or not 1 <= version <= MAX_RULES_VERSION:
+            raise InvalidRules(f'Every rule set needs a version from 1 to {MAX_RULES_VERSION}, not {version!r}')
+        if version in RULE_SETS or version in rule_sets:
+            raise InvalidRules(f'Rules version {version} is defined more than once (built-in versions: {sorted(RULE_SETS)})')
+        try:
+            rule_sets[version] = compile_rule_set(version, entry.get('rules', []), entry.get('retailers'))
+        except InvalidRules as e:
+            raise InvalidRules(f'Rules version {version}: {e}') from None
+
+    current_version = document.get('current')
+    if current_version is not None and (not isinstance(current_version, int) or current_version not in {*RULE_SETS, *rule_sets}):
+        raise InvalidRules(f'The current rules version {current_version!r} is not defined')
+    return RulesState(rule_sets, current_version)
+
+
+def _file_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class RulesRegistry:
+    """
+    The compiled rule sets of this process: the built-in ones and those of the rules file, which
+    is reloaded when it changes.
+    """
+
+    def __init__(self, path=None, reload_interval=DEFAULT_RELOAD_INTERVAL):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.reloads = 0
+        self.reload_errors = 0
+        self._lock = threading.Lock()
+        self._next_check = 0.0
+        self._signature = None
+        self._state = RulesState({}, None)
+        if path is not None:
+            self._signature = _file_signature(path)
+            self._state = load_rules_file(path)
+            self._next_check = clock.monotonic() + (reload_interval or 0)
+
+    def get(self, version):
+        """
+        The CompiledRuleSet of `version`. Raises ValueError for an unknown version.
+        """
+        self.check_for_changes()
+        return self._compiled(self._state, version)
+
+    def current(self):
+        """
+        The CompiledRuleSet new receipts are scored with: the rules file's `current` version, or
+        else the one of the RECEIPT_RULES_VERSION setting.
+        """
+        self.check_for_changes()
+        state = self._state
+        return self._compiled(state, self._current_version(state))
+
+    def _compiled(self, state, version):
+        compiled = state.rule_sets.get(version)
+        if compiled is None:
+            compiled = compile_built_in(get_rule_set(version))
+        return compiled
+
+    def _current_version(self, state):
+        return state.current_version or getattr(settings, 'RECEIPT_RULES_VERSION', LATEST_RULES_VERSION)
+
+    def versions(self):
+        self.check_for_changes()
+        return sorted({*RULE_SETS, *self._state.rule_sets})
+
+    def check_for_changes(self):
+        if self.path is None or self.reload_interval is None or clock.monotonic() < self._next_check:
+            return
+        # One request checks the file, the others carry on with the current rules meanwhile
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._next_check = clock.monotonic() + self.reload_interval
+            signature = _file_signature(self.path)
+            if signature != self._signature:
+                self._signature = signature
+                self.reload()
+        finally:
+            self._lock.release()
+
+    def reload(self):
+        """
+        Load the rules file again. Keeps the current rules, and returns False, if it does not load
+        or changes a version already loaded. Versions missing from the file stay loaded.
+        """
+        try:
+            state = load_rules_file(self.path)
+            for version, compiled in state.rule_sets.items():
+                previous = self._state.rule_sets.get(version)
+                if previous is not None and previous.definition != compiled.definition:
+                    raise InvalidRules(f'Rules version {version} changed; add a new version instead')
+        except InvalidRules:
+            self.reload_errors += 1
+            logger.exception('Keeping the previous point rules')
+            return False
+        removed = {version: compiled for version, compiled in self._state.rule_sets.items() if version not in state.rule_sets}
+        if removed:
+            logger.warning('Rules versions %s were removed from %s, keeping them loaded', sorted(removed), self.path)
+            state = state._replace(rule_sets={**removed, **state.rule_sets})
+        self._state = state
+        self.reloads += 1
+        logger.info('Loaded point rules versions %s from %s', sorted(state.rule_sets), self.path)
+        return True
+
+    def stats(self):
+        state = self._state
+        return {
+            'current_version': self._current_version(state),
+            'file_versions': len(state.rule_sets),
+            'reloads': self.reloads,
+            'reload_errors': self.reload_errors,
+        }
+
+
+_rules_registry = None
+_rules_registry_lock = threading.Lock()
+
+
+def get_rules_registry():
+    """
+    Return the process wide rules registry, building it from settings on first use.
+    """
+    global _rules_registry
+    if _rules_registry is None:
+        with _rules_registry_lock:
+            if _rules_registry is None:
+                _rules_registry = build_rules_registry(getattr(settings, 'RECEIPT_RULES', {}))
+    return _rules_registry
+
+
+def build_rules_registry(config):
+    return RulesRegistry(path=config.get('PATH'), reload_interval=config.get('RELOAD_INTERVAL', DEFAULT_RELOAD_INTERVAL))
+
+
+def reset_rules_registry():
+    """
+    Drop the process wide rules registry, so the next get_rules_registry() rebuilds it from settings.
+    """
+    global _rules_registry
+    with _rules_registry_lock:
+        _rules_registry = None
+
+
+@receiver(setting_changed)
+def _reset_rules_registry_on_setting_changed(setting, **kwargs):
+    if setting == 'RECEIPT_RULES':
+        reset_rules_registry()
@@ -0,0 +1,181 @@
+"""
+Point rules for receipts: the built-in, versioned RuleSets, and calculate_points and
+calculate_points_batch, which score a single receipt or a columnar batch with one of them.
+"""
+from collections import namedtuple
+from datetime import time
+import functools
+
+
+# Distinct retailer names remembered, least recently used first out
+RETAILER_CACHE_SIZE = 4096
+
+TWO_PM = time(hour=14, minute=0)
+FOUR_PM = time(hour=16, minute=0)
+
+RuleSet = namedtuple('RuleSet', [
+    'version',
+    'round_total_points',             # for a total with no cents
+    'total_multiple_cents',           # a total that is a multiple of this many cents...
+    'total_multiple_points',          # ...earns these points
+    'item_pair_points',               # for every two items
+    'odd_day_points',                 # for an odd day of the month
+    'afternoon_start',                # a purchase at or after this time...
+    'afternoon_end',                  # ...and before this one...
+    'afternoon_points',               # ...earns these points
+    'description_length_multiple',    # an item whose trimmed description length is a multiple of this...
+    'description_price_percent',      # ...earns this percentage of its price in dollars, rounded up
+])
+
+RULE_SETS = {
+    1: RuleSet(
+        version=1,
+        round_total_points=50,
+        total_multiple_cents=25,
+        total_multiple_points=25,
+        item_pair_points=5,
+        odd_day_points=6,
+        afternoon_start=TWO_PM,
+        afternoon_end=FOUR_PM,
+        afternoon_points=10,
+        description_length_multiple=3,
+        description_price_percent=20,
+    ),
+}
+
+LATEST_RULES_VERSION = max(RULE_SETS)
+LATEST_RULES = RULE_SETS[LATEST_RULES_VERSION]
+
+
+def get_rule_set(version):
+    try:
+        return RULE_SETS[version]
+    except KeyError:
+        raise ValueError(f'Unknown rules version: {version}')
+
+
+@functools.lru_cache(maxsize=RETAILER_CACHE_SIZE)
+def retailer_points(retailer):
+    """
+    One point for every alphanumeric character in the retailer name.
+    """
+    numbers = sum(ch.isdigit() for ch in retailer)
+    letters = sum(ch.isalpha() for ch in retailer)
+    return numbers + letters
+
+
+def scoring_cache_stats():
+    """
+    Hits, misses, size and hit rate of the retailer points cache of this process.
+    """
+    info = retailer_points.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        'hits': info.hits,
+        'misses': info.misses,
+        'size': info.currsize,
+        'max_size': info.maxsize,
+        'hit_rate': round(info.hits / lookups, 4) if lookups else 0.0,
+    }
+
+
+def clear_scoring_caches():
+    retailer_points.cache_clear()
+
+
+def _percent_of_dollars_rounded_up(cents, percent):
+    # ceil(cents / 100 * percent / 100), as floor division of the negated value
+    return -(-cents * percent // 10000)
+
+
+def calculate_points(retailer, purchase_date, purchase_time, total_cents, items, rules=LATEST_RULES):
+    """
+    Count the points for a single receipt under `rules`, the latest RuleSet by default.
+
+    `total_cents` and the prices are integer cents and `items` is a list of (short_description,
+    price_cents) pairs.
+    """
+    points = retailer_points(retailer)
+
+    # 50 points if the total is a round dollar amount with no cents.
+    if total_cents % 100 == 0:
+        points += rules.round_total_points
+
+    # 25 points if the total is a multiple of 0.25.
+    if total_cents % rules.total_multiple_cents == 0:
+        points += rules.total_multiple_points
+
+    # 5 points for every two items on the receipt.
+    points += (len(items) // 2) * rules.item_pair_points
+
+    # 6 points if the day in the purchase date is odd.
+    if purchase_date.day % 2 != 0:
+        points += rules.odd_day_points
+
+    # 10 points if the time of purchase is after 2:00pm and before 4:00pm.
+    if rules.afternoon_start <= purchase_time < rules.afternoon_end:
+        points += rules.afternoon_points
+
+    # Items are scored inline, a function call per item would be most of the per-item cost; subtracting
+    # the floor of the negated value adds the price percentage rounded up, as in _percent_of_dollars_rounded_up
+    length_multiple = rules.description_length_multiple
+    price_percent = rules.description_price_percent
+    for short_description, price_cents in items:
+        if len(short_description.strip()) % length_multiple == 0:
+            points -= -price_cents * price_percent // 10000
+
+    return points
+
+
+def description_points_batch(receipt_index, description_lengths, prices_cents, size, rules=LATEST_RULES):
+    """
+    Sum the item description points per receipt for a columnar batch of items.
+
+    `receipt_index` gives, for every item, the position of its receipt in the batch, and
+    `description_lengths` the trimmed length of its description, and `prices_cents` its price in
+    integer cents. Returns an int64 array of `size`.
+    """
+    import numpy as np  # imported here so web processes, which score one receipt at a time, never load NumPy
+
+    description_lengths = np.asarray(description_lengths)
+    prices_cents = np.asarray(prices_cents, dtype=np.int64)
+    points = np.where(
+        description_lengths % rules.description_length_multiple == 0,
+        _percent_of_dollars_rounded_up(prices_cents, rules.description_price_percent),
+        0,
+    )
+    # float64 weights sum whole numbers exactly well past any realistic points total
+    return np.bincount(np.asarray(receipt_index, dtype=np.intp), weights=points, minlength=size).astype(np.int64)
+
+
+def calculate_points_batch(retailer_alphanumerics, totals_cents, days, minutes, item_counts, description_points=None,
+                           rules=LATEST_RULES):
+    """
+    Count the points for a columnar batch of receipts.
+
+    Every argument is an array-like with one entry per receipt: the alphanumeric character count
+    of the retailer, the total in integer cents, the day of the month, the minute of the day the
+    purchase was made at, and the number of items. `description_points` holds the per-receipt
+    item description points, see description_points_batch. Returns an int64 array.
+
+    `rules` is a built-in RuleSet; rules file versions are scored with their compiled function,
+    see rules.get_rules_registry().
+    """
+    import numpy as np
+
+    totals_cents = np.asarray(totals_cents, dtype=np.int64)
+    days = np.asarray(days)
+    minutes = np.asarray(minutes)
+
+    afternoon_start = rules.afternoon_start.hour * 60 + rules.afternoon_start.minute
+    afternoon_end = rules.afternoon_end.hour * 60 + rules.afternoon_end.minute
+
+    points = np.asarray(retailer_alphanumerics, dtype=np.int64).copy()
+    points += np.where(totals_cents % 100 == 0, rules.round_total_points, 0)
+    points += np.where(totals_cents % rules.total_multiple_cents == 0, rules.total_multiple_points, 0)
+    points += (np.asarray(item_counts, dtype=np.int64) // 2) * rules.item_pair_points
+    points += np.where(days % 2 != 0, rules.odd_day_points, 0)
+    points += np.where((minutes >= afternoon_start) & (minutes < afternoon_end), rules.afternoon_points, 0)
+    if description_points is not None:
+        points += np.asarray(description_points, dtype=np.int64)
+    return points
@@ -0,0 +1,68 @@
+"""
+Sizing of the production server processes, used by gunicorn.conf.py.
+
+The number of CPUs a container can use is often lower than os.cpu_count(), which reports every
+core of the host: the process may be pinned to some cores (sched_getaffinity) or given a CPU quota
+by its cgroup (docker run --cpus, Kubernetes limits). available_cpus() takes the smallest of the three.
+
+Every worker is a separate process with its own points cache, idempotency LRU, write-behind queue
+and metrics registry, see the README.
+"""
+import math
+import os
+
+
+CGROUP_V2_CPU_MAX = '/sys/fs/cgroup/cpu.max'
+CGROUP_V1_CPU_QUOTA = '/sys/fs/cgroup/cpu/cpu.cfs_quota_us'
+CGROUP_V1_CPU_PERIOD = '/sys/fs/cgroup/cpu/cpu.cfs_period_us'
+
+
+def _read(path):
+    try:
+        with open(path) as cgroup_file:
+            return cgroup_file.read().strip()
+    except OSError:
+        return None
+
+
+def cgroup_cpu_limit(cpu_max=CGROUP_V2_CPU_MAX, cpu_quota=CGROUP_V1_CPU_QUOTA, cpu_period=CGROUP_V1_CPU_PERIOD):
+    """
+    The CPU quota of this process's cgroup, in CPUs and possibly fractional, or None when unlimited.
+    """
+    limit = _read(cpu_max)
+    if limit is not None:
+        quota, _, period = limit.partition(' ')
+        if quota == 'max':
+            return None
+        return int(quota) / int(period or 100000)
+    quota, period = _read(cpu_quota), _read(cpu_period)
+    if quota is None or period is None or int(quota) <= 0:
+        return None
+    return int(quota) / int(period)
+
+
+def available_cpus():
+    """
+    The number of CPUs this process can actually run on, at least 1.
+    """
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+    quota = cgroup_cpu_limit()
+    if quota is not None:
+        cpus = min(cpus, math.ceil(quota))
+    return max(cpus, 1)
+
+
+def default_workers(cpus):
+    """
+    Worker processes for `cpus` CPUs: gunicorn's recommended 2 * CPUs + 1, so one worker's CPU
+    work overlaps with another's database and network waits.
+    """
+    return 2 * cpus + 1
+
+
+def env_int(name, default):
+    """
+    The integer environment variable `name`, or `default` when it is unset or empty.
+    """
+    value = os.environ.get(name)
+    return int(value) if value else default
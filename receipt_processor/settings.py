@@ -44,6 +44,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'receipt_processor.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -84,6 +85,84 @@ DATABASES = {
     }
 }
 
+# Read-through cache for GET /receipts/{id}/points, see receipt_processor/cache.py. TTL bounds how
+# long a worker serves points that another process changed or deleted.
+# Use {'BACKEND': 'django', 'ALIAS': 'default'} to store points in a cache from CACHES instead.
+
+RECEIPT_POINTS_CACHE = {
+    'BACKEND': 'lru',
+    'MAX_SIZE': 100000,
+    'TTL': 3600,
+}
+
+# Responses replayed for retried POST /receipts/process requests carrying an Idempotency-Key header,
+# see receipt_processor/idempotency.py. Use 'BACKEND': 'database' to share keys between processes.
+
+RECEIPT_IDEMPOTENCY = {
+    'BACKEND': 'lru',
+    'MAX_SIZE': 100000,
+    'TTL': 24 * 60 * 60,
+}
+
+# Database aliases receipts are sharded over, see receipt_processor/sharding.py and settings_sharded.py.
+# Empty keeps every receipt in the default database.
+
+RECEIPT_SHARDS = []
+
+# Whether each gunicorn worker fills its retailer points cache from the rollups before serving,
+# see ingest.warm_scoring_caches. Otherwise the cache fills from traffic.
+
+RECEIPT_SCORING_WARM_UP = True
+
+# Deletion of old receipts by `python manage.py apply_retention`, see receipt_processor/retention.py.
+# MAX_AGE_DAYS None keeps every receipt.
+
+RECEIPT_RETENTION = {
+    'MAX_AGE_DAYS': None,
+    'BATCH_SIZE': 1000,
+    'PAUSE': 0.0,
+    'VACUUM_PAGES': 1000,
+}
+
+# Version of the point rules new receipts are scored with, see receipt_processor/scoring.py.
+# After changing it, rescore stored receipts with `python manage.py recompute_points`.
+
+RECEIPT_RULES_VERSION = 1
+
+# Rule sets defined in a YAML file rather than in code, see receipt_processor/rules.py and
+# rules.example.yaml. The file is reloaded when it changes; its `current` version, if set,
+# overrides RECEIPT_RULES_VERSION.
+
+RECEIPT_RULES = {
+    'PATH': None,
+    'RELOAD_INTERVAL': 5.0,
+}
+
+# Request limits, see receipt_processor/validation.py
+
+RECEIPT_MAX_BODY_BYTES = 64 * 1024
+RECEIPT_MAX_ITEMS = 500
+RECEIPT_BATCH_MAX_BODY_BYTES = 64 * 1024 * 1024
+RECEIPT_BATCH_MAX_RECEIPTS = 50000
+
+# Opt-in cProfile sampling of requests, see receipt_processor/metrics.py
+
+RECEIPT_PROFILE = {
+    'ENABLED': False,
+    'SAMPLE_RATE': 0.01,
+    'SLOW_MS': 250,
+    'DIRECTORY': '/tmp/receipt-profiles',
+}
+
+# Optional write-behind mode for POST /receipts/process, see receipt_processor/writebehind.py
+
+RECEIPT_WRITE_BEHIND = {
+    'ENABLED': False,
+    'MAX_QUEUE_SIZE': 10000,
+    'BATCH_SIZE': 500,
+    'FLUSH_INTERVAL': 0.05,
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -0,0 +1,36 @@
+"""
+API-only settings profile for receipt_processor.
+
+Select it with DJANGO_SETTINGS_MODULE=receipt_processor.settings_api for worker processes that only
+serve the JSON endpoints. It drops the admin, auth, sessions and messages apps, the middleware that
+goes with them (every request otherwise pays for the session, CSRF, auth and message middleware),
+the template engine and DRF's browsable API, so a worker imports less and does less per request.
+
+The endpoints all use AllowAny and never read request.user, so DRF authentication is turned off;
+the admin is not served (ROOT_URLCONF is urls_api.py). To combine it with another profile, import
+that profile instead of settings below.
+"""
+from receipt_processor.settings import *  # noqa: F401,F403
+
+INSTALLED_APPS = [
+    'receipt_processor.apps.ReceiptProcessorConfig',
+]
+
+MIDDLEWARE = [
+    'receipt_processor.middleware.MetricsMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'django.middleware.common.CommonMiddleware',
+]
+
+ROOT_URLCONF = 'receipt_processor.urls_api'
+
+TEMPLATES = []
+
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [],
+    'DEFAULT_PERMISSION_CLASSES': ['rest_framework.permissions.AllowAny'],
+    'DEFAULT_RENDERER_CLASSES': ['rest_framework.renderers.JSONRenderer'],
+    'DEFAULT_PARSER_CLASSES': ['rest_framework.parsers.JSONParser'],
+    # The default AnonymousUser lives in django.contrib.auth, which is not installed
+    'UNAUTHENTICATED_USER': None,
+}
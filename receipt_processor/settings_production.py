@@ -0,0 +1,44 @@
+"""
+Production settings profile for receipt_processor, read from the environment.
+
+Select it with DJANGO_SETTINGS_MODULE=receipt_processor.settings_production, as compose.yaml does,
+and serve with gunicorn (see start.sh and gunicorn.conf.py). On top of the production SQLite
+profile it turns DEBUG off, which also stops Django from keeping every executed query in memory,
+and takes the secrets and host names from the environment:
+
+    DJANGO_SECRET_KEY       required
+    DJANGO_ALLOWED_HOSTS    comma separated (default: localhost,127.0.0.1)
+    DJANGO_DEBUG            1 to turn DEBUG back on while investigating (default: 0)
+    DJANGO_DATABASE_PATH    SQLite database file (default: db.sqlite3 in the project directory)
+    DJANGO_LOG_LEVEL        level of the console log (default: INFO)
+"""
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from receipt_processor.settings_sqlite import *  # noqa: F401,F403
+from receipt_processor.settings_sqlite import DATABASES
+
+try:
+    SECRET_KEY = os.environ['DJANGO_SECRET_KEY']
+except KeyError:
+    raise ImproperlyConfigured('Set DJANGO_SECRET_KEY to use the production settings') from None
+
+DEBUG = os.environ.get('DJANGO_DEBUG', '0').lower() in ('1', 'true', 'yes')
+
+ALLOWED_HOSTS = [host.strip() for host in os.environ.get('DJANGO_ALLOWED_HOSTS', 'localhost,127.0.0.1').split(',') if host.strip()]
+
+if os.environ.get('DJANGO_DATABASE_PATH'):
+    DATABASES['default'] = {**DATABASES['default'], 'NAME': os.environ['DJANGO_DATABASE_PATH']}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'root': {
+        'handlers': ['console'],
+        'level': os.environ.get('DJANGO_LOG_LEVEL', 'INFO'),
+    },
+}
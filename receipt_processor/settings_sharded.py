@@ -0,0 +1,26 @@
+"""
+Sharded SQLite settings profile for receipt_processor.
+
+Select it with DJANGO_SETTINGS_MODULE=receipt_processor.settings_sharded. On top of the
+production SQLite profile, receipts are spread over RECEIPT_SHARD_COUNT (default 4) database
+files, each with its own write lock, while admin, auth and sessions stay in db.sqlite3. See
+receipt_processor/sharding.py.
+
+Create the tables with `python manage.py migrate_shards`.
+"""
+import os
+
+from receipt_processor.settings_sqlite import *  # noqa: F401,F403
+from receipt_processor.settings_sqlite import BASE_DIR, DATABASES
+
+RECEIPT_SHARD_COUNT = int(os.environ.get('RECEIPT_SHARD_COUNT', 4))
+
+RECEIPT_SHARDS = [f'shard_{number}' for number in range(RECEIPT_SHARD_COUNT)]
+
+for number, alias in enumerate(RECEIPT_SHARDS):
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'NAME': BASE_DIR / f'db-shard-{number}.sqlite3',
+    }
+
+DATABASE_ROUTERS = ['receipt_processor.sharding.ShardRouter']
@@ -0,0 +1,115 @@
+"""
+Horizontal sharding of receipts across several databases.
+
+RECEIPT_SHARDS lists the database aliases receipts are spread over, e.g.
+
+    RECEIPT_SHARDS = ['shard_0', 'shard_1', 'shard_2', 'shard_3']
+    DATABASE_ROUTERS = ['receipt_processor.sharding.ShardRouter']
+
+(see settings_sharded.py). When it is empty everything lives in the default database.
+
+A receipt lives on the shard picked by its UUID, and its items and its share of the rollups live
+on the same shard, so storing a receipt is a transaction on one database. Repeat submissions are
+found by content hash, so new receipt ids are drawn until the id lands on the shard picked by the
+content hash: both the id and the content of a receipt lead to the same shard.
+
+Queries for one receipt go to its shard with .using(shard_for_receipt(receipt_id)); aggregates
+run on every shard and are merged, see rollups.py.
+"""
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+import uuid
+
+
+SHARDED_APP_LABEL = 'receipt_processor'
+# Models of SHARDED_APP_LABEL that are not about one receipt, and stay in the default database
+UNSHARDED_MODELS = {'idempotencykey'}
+
+
+def receipt_shards():
+    """
+    The database aliases receipts are sharded over, just the default database when not sharded.
+    """
+    return getattr(settings, 'RECEIPT_SHARDS', None) or [DEFAULT_DB_ALIAS]
+
+
+def shard_for_receipt(receipt_id):
+    """
+    The alias of the database holding the receipt with `receipt_id`. Raises ValueError for an id
+    that is not a UUID.
+    """
+    shards = receipt_shards()
+    if len(shards) == 1:
+        return shards[0]
+    if not isinstance(receipt_id, uuid.UUID):
+        receipt_id = uuid.UUID(str(receipt_id))
+    return shards[receipt_id.int % len(shards)]
+
+
+def shard_for_content(content_hash):
+    """
+    The alias of the database that holds, or will hold, the receipt with `content_hash`.
+    """
+    shards = receipt_shards()
+    return shards[int(content_hash[:16], 16) % len(shards)]
+
+
+def new_receipt_id(content_hash):
+    """
+    A new random receipt id that lives on the same shard as `content_hash`.
+    """
+    shards = receipt_shards()
+    receipt_id = uuid.uuid4()
+    if len(shards) == 1:
+        return receipt_id
+    target = int(content_hash[:16], 16) % len(shards)
+    # Takes len(shards) draws on average
+    while receipt_id.int % len(shards) != target:
+        receipt_id = uuid.uuid4()
+    return receipt_id
+
+
+def is_sharded(opts):
+    """
+    Whether the model with the options `opts` (its _meta) lives on the receipt shards.
+    """
+    return opts.app_label == SHARDED_APP_LABEL and opts.model_name not in UNSHARDED_MODELS
+
+
+class ShardRouter:
+    """
+    Keeps receipt_processor's tables on the receipt shards, except UNSHARDED_MODELS, and everything
+    else on the default database. Instances are routed to their receipt's shard; queries without an instance must
+    pick their shard with .using().
+    """
+
+    def db_for_read(self, model, **hints):
+        return self._db_for_instance(model, hints.get('instance'))
+
+    def db_for_write(self, model, **hints):
+        return self._db_for_instance(model, hints.get('instance'))
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if is_sharded(obj1._meta) or is_sharded(obj2._meta):
+            return obj1._state.db == obj2._state.db
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Data migrations (model_name None) of the sharded app run wherever its receipts are
+        if app_label == SHARDED_APP_LABEL and model_name not in UNSHARDED_MODELS:
+            return db in receipt_shards()
+        return db == DEFAULT_DB_ALIAS
+
+    def _db_for_instance(self, model, instance):
+        # `instance` can be a related object rather than an instance of `model`
+        if not is_sharded(model._meta):
+            return DEFAULT_DB_ALIAS if model._meta.app_label == SHARDED_APP_LABEL else None
+        if instance is None:
+            return None
+        if instance._state.db is not None:
+            return instance._state.db
+        if instance._meta.model_name == 'receipt':
+            return shard_for_receipt(instance.pk)
+        if instance._meta.model_name in ('item', 'receiptalias') and instance.receipt_id is not None:
+            return shard_for_receipt(instance.receipt_id)
+        return None
@@ -0,0 +1,23 @@
+"""
+SQLite connection tuning.
+
+apply_pragmas runs on every new SQLite connection (see ReceiptProcessorConfig.ready) and applies
+the SQLITE_PRAGMAS setting, e.g.:
+
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+    }
+"""
+from django.conf import settings
+
+
+def apply_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    if not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
@@ -0,0 +1,110 @@
+"""
+All tests for async_views.py
+"""
+from unittest import mock
+import json
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from receipt_processor.cache import get_points_cache
+from receipt_processor.models import Item, Receipt
+
+
+class AsyncReceiptViewTests(TestCase):
+
+    receipt_data = {
+        'retailer': 'M&M Corner Market',
+        'purchaseDate': '2022-03-20',
+        'purchaseTime': '14:33',
+        'items': [
+            {'shortDescription': 'Gatorade', 'price': '2.25'},
+            {'shortDescription': 'Gatorade', 'price': '2.25'},
+            {'shortDescription': 'Gatorade', 'price': '2.25'},
+            {'shortDescription': 'Gatorade', 'price': '2.25'}
+        ],
+        'total': '9.00'
+    }
+
+    async def test_process_then_get_points(self):
+        response = await self.async_client.post(
+            reverse('receipt_processor.async_receipt'),
+            json.dumps(self.receipt_data),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        receipt_id = response.json()['id']
+
+        receipt = await Receipt.objects.aget(id=receipt_id)
+        self.assertEqual(receipt.points, 109)
+        self.assertEqual(await receipt.items.acount(), 4)
+
+        response = await self.async_client.get(reverse('receipt_processor.async_points', args=[receipt_id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'points': 109})
+
+    async def test_failed_receipt_is_not_left_behind(self):
+        with mock.patch('receipt_processor.ingest.record_receipts', side_effect=RuntimeError('rollups unavailable')):
+            with self.assertRaises(RuntimeError):
+                await self.async_client.post(
+                    reverse('receipt_processor.async_receipt'),
+                    json.dumps(self.receipt_data),
+                    content_type='application/json'
+                )
+
+        self.assertEqual(await Receipt.objects.acount(), 0)
+        self.assertEqual(await Item.objects.acount(), 0)
+
+        response = await self.async_client.post(
+            reverse('receipt_processor.async_receipt'),
+            json.dumps(self.receipt_data),
+            content_type='application/json'
+        )
+        receipt = await Receipt.objects.aget(id=response.json()['id'])
+        self.assertEqual(await receipt.items.acount(), 4)
+
+    async def test_process_missing_values(self):
+        receipt_data = dict(self.receipt_data)
+        del receipt_data['retailer']
+
+        response = await self.async_client.post(
+            reverse('receipt_processor.async_receipt'),
+            json.dumps(receipt_data),
+            content_type='application/json'
+        )
+
+        self.assertEqual(response.status_code, 400)
+
+    async def test_receipt_does_not_exist(self):
+        response = await self.async_client.get(
+            reverse('receipt_processor.async_points', args=['ead122bd-3cef-40d3-8db1-835a75fef386'])
+        )
+
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'receipt_points_cache'}},
+    RECEIPT_POINTS_CACHE={'BACKEND': 'django', 'ALIAS': 'default'},
+)
+class AsyncDatabasePointsCacheTests(TestCase):
+
+    def setUp(self):
+        call_command('createcachetable', verbosity=0)
+
+    async def test_database_cache_used_off_the_event_loop(self):
+        response = await self.async_client.post(
+            reverse('receipt_processor.async_receipt'),
+            json.dumps(AsyncReceiptViewTests.receipt_data),
+            content_type='application/json'
+        )
+        receipt_id = response.json()['id']
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(await get_points_cache().aget(receipt_id), 109)
+
+        response = await self.async_client.get(reverse('receipt_processor.async_points', args=[receipt_id]))
+
+        self.assertEqual(response.json(), {'points': 109})
+        self.assertEqual(get_points_cache().stats()['hits'], 2)
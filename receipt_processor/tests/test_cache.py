@@ -0,0 +1,97 @@
+"""
+All tests for cache.py
+"""
+from unittest import mock
+import json
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.urls import reverse
+
+from receipt_processor.cache import DjangoPointsCache, LRUPointsCache, get_points_cache
+
+
+class LRUPointsCacheTests(SimpleTestCase):
+
+    def test_eviction_order_and_counters(self):
+        cache = LRUPointsCache(max_size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)  # 'b' is now least recently used
+        cache.set('c', 3)
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.stats()['hits'], 2)
+        self.assertEqual(cache.stats()['misses'], 1)
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertEqual(cache.stats()['size'], 2)
+
+    def test_entries_expire_after_ttl(self):
+        cache = LRUPointsCache(ttl=60)
+        with mock.patch('receipt_processor.cache.time.monotonic', return_value=1000.0):
+            cache.set('a', 1)
+        with mock.patch('receipt_processor.cache.time.monotonic', return_value=1059.0):
+            self.assertEqual(cache.get('a'), 1)
+        with mock.patch('receipt_processor.cache.time.monotonic', return_value=1060.0):
+            self.assertIsNone(cache.get('a'))
+
+        self.assertEqual(cache.stats()['expirations'], 1)
+        self.assertEqual(cache.stats()['size'], 0)
+
+    def test_zero_points_are_cached(self):
+        cache = LRUPointsCache()
+        cache.set('a', 0)
+        self.assertEqual(cache.get('a'), 0)
+
+
+class PointsReadThroughTests(TestCase):
+
+    receipt_data = {
+        'retailer': 'Target',
+        'purchaseDate': '2022-01-02',
+        'purchaseTime': '13:13',
+        'total': '1.25',
+        'items': [
+            {'shortDescription': 'Pepsi - 12-oz', 'price': '1.25'}
+        ]
+    }
+
+    def post_receipt(self):
+        response = self.client.post(
+            reverse('receipt_processor.receipt'),
+            json.dumps(self.receipt_data),
+            content_type='application/json'
+        )
+        return str(response.data['id'])
+
+    def test_first_read_after_write_is_a_hit(self):
+        receipt_id = self.post_receipt()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('receipt_processor.points', args=[receipt_id]))
+
+        self.assertEqual(response.data['points'], 31)
+        self.assertEqual(len(queries), 0)
+
+    def test_miss_reads_through_and_populates(self):
+        receipt_id = self.post_receipt()
+        get_points_cache().delete(receipt_id)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('receipt_processor.points', args=[receipt_id]))
+            response = self.client.get(reverse('receipt_processor.points', args=[receipt_id]))
+
+        self.assertEqual(response.data['points'], 31)
+        self.assertEqual(len(queries), 1)
+
+    @override_settings(RECEIPT_POINTS_CACHE={'BACKEND': 'django', 'ALIAS': 'default'})
+    def test_django_cache_backend(self):
+        self.assertIsInstance(get_points_cache(), DjangoPointsCache)
+        receipt_id = self.post_receipt()
+
+        response = self.client.get(reverse('receipt_processor.points', args=[receipt_id]))
+
+        self.assertEqual(response.data['points'], 31)
+        self.assertEqual(get_points_cache().stats()['hits'], 1)
@@ -0,0 +1,147 @@
+"""
+All tests for export.py and the export_receipts management command
+"""
+from datetime import date
+from io import StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
+import csv
+import json
+import sys
+import tempfile
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from receipt_processor.export import ITEM_COLUMNS, RECEIPT_COLUMNS, arrow_schema, csv_chunks, export_batches
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        receipts_data = [
+            {
+                'retailer': 'Target',
+                'purchaseDate': '2022-01-01',
+                'purchaseTime': '13:01',
+                'total': '35.35',
+                'items': [
+                    {'shortDescription': 'Mountain Dew 12PK', 'price': '6.49'},
+                    {'shortDescription': 'Emils Cheese Pizza', 'price': '12.25'},
+                    {'shortDescription': 'Knorr Creamy Chicken', 'price': '1.26'},
+                    {'shortDescription': 'Doritos Nacho Cheese', 'price': '3.35'},
+                    {'shortDescription': '   Klarbrunn 12-PK 12 FL OZ  ', 'price': '12.00'}
+                ]
+            },
+            {
+                'retailer': 'M&M Corner Market',
+                'purchaseDate': '2022-03-20',
+                'purchaseTime': '14:33',
+                'total': '9.00',
+                'items': [{'shortDescription': 'Gatorade', 'price': '2.25'}] * 4,
+            },
+        ]
+        response = self.client.post(
+            reverse('receipt_processor.receipt_batch'),
+            json.dumps(receipts_data),
+            content_type='application/json'
+        )
+        self.target_id, self.market_id = [result['id'] for result in response.data['receipts']]
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def read_csv(self, content):
+        return list(csv.DictReader(StringIO(content)))
+
+    def test_receipts_as_csv(self):
+        rows = self.read_csv(''.join(csv_chunks(RECEIPT_COLUMNS, export_batches('receipts'))))
+
+        self.assertEqual(sorted(rows, key=lambda row: row['retailer']), [
+            {'id': str(self.market_id), 'retailer': 'M&M Corner Market', 'purchase_date': '2022-03-20',
+             'purchase_time': '14:33', 'total': '9.00', 'points': '109', 'rules_version': '1'},
+            {'id': str(self.target_id), 'retailer': 'Target', 'purchase_date': '2022-01-01',
+             'purchase_time': '13:01', 'total': '35.35', 'points': '28', 'rules_version': '1'},
+        ])
+
+    def test_filters_apply_to_items_through_their_receipt(self):
+        batches = export_batches('items', start=date(2022, 3, 1), retailer='M&M Corner Market')
+        rows = self.read_csv(''.join(csv_chunks(ITEM_COLUMNS, batches)))
+
+        self.assertEqual(rows, [{'receipt_id': str(self.market_id), 'short_description': 'Gatorade', 'price': '2.25'}] * 4)
+        self.assertEqual(list(export_batches('items', end=date(2021, 12, 31))), [])
+
+    def test_rows_are_read_in_keyset_batches(self):
+        with self.assertNumQueries(4):
+            batches = list(export_batches('items', batch_size=3))
+
+        self.assertEqual([len(batch) for batch in batches], [3, 3, 3])
+        self.assertEqual(sum(batch[0][2] for batch in batches), 649 + 335 + 225)
+
+    def test_empty_export_still_has_a_header(self):
+        self.assertEqual(''.join(csv_chunks(RECEIPT_COLUMNS, [])), 'id,retailer,purchase_date,purchase_time,total,points,rules_version\r\n')
+
+    def test_command_writes_every_table(self):
+        stdout = StringIO()
+
+        call_command('export_receipts', str(self.directory), '--batch-size', '2', stdout=stdout)
+
+        self.assertIn('Exported 2 receipts rows', stdout.getvalue())
+        self.assertIn('Exported 9 items rows', stdout.getvalue())
+        self.assertEqual(len(self.read_csv((self.directory / 'receipts.csv').read_text())), 2)
+        self.assertEqual(len(self.read_csv((self.directory / 'items.csv').read_text())), 9)
+        self.assertEqual(sorted(path.name for path in self.directory.iterdir()), ['items.csv', 'receipts.csv'])
+
+    def test_pyarrow_only_needed_for_arrow_formats(self):
+        # A None entry in sys.modules makes the import fail, whether or not pyarrow is installed
+        with mock.patch.dict(sys.modules, {'pyarrow': None}):
+            rows = self.read_csv(''.join(csv_chunks(RECEIPT_COLUMNS, export_batches('receipts'))))
+            with self.assertRaisesMessage(ImportError, 'pyarrow is required for the Arrow and Parquet formats'):
+                arrow_schema(RECEIPT_COLUMNS)
+
+        self.assertEqual(len(rows), 2)
+
+    @skipUnless(pyarrow is None, 'pyarrow is installed')
+    def test_command_without_pyarrow(self):
+        with self.assertRaises(CommandError):
+            call_command('export_receipts', str(self.directory), '--format', 'parquet', stdout=StringIO())
+
+    @skipUnless(pyarrow, 'pyarrow is not installed')
+    def test_command_writes_parquet(self):
+        import pyarrow.parquet
+
+        call_command('export_receipts', str(self.directory), '--format', 'parquet', '--tables', 'receipts', stdout=StringIO())
+
+        table = pyarrow.parquet.read_table(self.directory / 'receipts.parquet')
+        self.assertEqual(sorted(table.column('points').to_pylist()), [28, 109])
+        self.assertEqual(str(sorted(table.column('total').to_pylist())[1]), '35.35')
+
+    def test_endpoint_streams_csv(self):
+        response = self.client.get(reverse('receipt_processor.export_receipts'), {'retailer': 'Target'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="receipts.csv"')
+        rows = self.read_csv(b''.join(response.streaming_content).decode())
+        self.assertEqual([(row['id'], row['points']) for row in rows], [(str(self.target_id), '28')])
+
+    def test_endpoint_rejects_bad_filters_and_formats(self):
+        self.assertEqual(self.client.get(reverse('receipt_processor.export_items'), {'start': '2022-13-01'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('receipt_processor.export_items'), {'format': 'parquet'}).status_code, 400)
+
+    @skipUnless(pyarrow, 'pyarrow is not installed')
+    def test_endpoint_streams_arrow(self):
+        import pyarrow.ipc
+
+        response = self.client.get(reverse('receipt_processor.export_items'), {'format': 'arrow'})
+
+        table = pyarrow.ipc.open_stream(b''.join(response.streaming_content)).read_all()
+        self.assertEqual(table.num_rows, 9)
+        self.assertEqual(table.schema.field('price').type, pyarrow.decimal128(18, 2))
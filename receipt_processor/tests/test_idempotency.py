@@ -0,0 +1,177 @@
+"""
+All tests for idempotency.py
+"""
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+import json
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from receipt_processor.idempotency import (
+    DatabaseIdempotencyStore,
+    LRUIdempotencyStore,
+    expire_keys,
+    get_idempotency_store,
+    reset_idempotency_store,
+)
+from receipt_processor.models import IdempotencyKey, Item, Receipt
+
+
+class LRUIdempotencyStoreTests(SimpleTestCase):
+
+    def test_eviction_order_and_counters(self):
+        store = LRUIdempotencyStore(max_size=2)
+        store.set('a', 'fa', 200, {'id': 1})
+        store.set('b', 'fb', 200, {'id': 2})
+        self.assertEqual(store.get('a').data, {'id': 1})  # 'b' is now least recently used
+        store.set('c', 'fc', 200, {'id': 3})
+
+        self.assertIsNone(store.get('b'))
+        self.assertEqual(store.get('c').fingerprint, 'fc')
+        stats = store.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions'], stats['size']), (2, 1, 1, 2))
+
+    def test_expired_keys_are_not_replayed(self):
+        store = LRUIdempotencyStore(ttl=0)
+        store.set('a', 'fa', 200, {'id': 1})
+
+        self.assertIsNone(store.get('a'))
+        self.assertEqual(store.stats()['expirations'], 1)
+        self.assertEqual(store.stats()['size'], 0)
+
+    def test_expire_drops_only_expired_keys(self):
+        store = LRUIdempotencyStore(ttl=60)
+        store.set('fresh', 'f', 200, {})
+        store.ttl = 0
+        store.set('old', 'f', 200, {})
+
+        self.assertEqual(store.expire(), 1)
+        self.assertIsNotNone(store.get('fresh'))
+        self.assertEqual(store.stats()['expirations'], 1)
+
+
+class DatabaseIdempotencyStoreTests(TestCase):
+
+    def test_keys_are_shared_between_stores(self):
+        DatabaseIdempotencyStore().set('a', 'fa', 200, {'id': 'ead122bd-3cef-40d3-8db1-835a75fef386'})
+
+        other = DatabaseIdempotencyStore()
+        stored = other.get('a')
+
+        self.assertEqual(stored.fingerprint, 'fa')
+        self.assertEqual(stored.data, {'id': 'ead122bd-3cef-40d3-8db1-835a75fef386'})
+        self.assertEqual(other.stats()['database_hits'], 1)
+        self.assertEqual(other.stats()['hits'], 1)
+        self.assertEqual(other.stats()['misses'], 0)
+        # The second read is served by the LRU in front of the table
+        with self.assertNumQueries(0):
+            other.get('a')
+
+    def test_expired_row_is_not_replayed_and_can_be_reused(self):
+        DatabaseIdempotencyStore(ttl=0).set('a', 'fa', 200, {})
+
+        store = DatabaseIdempotencyStore()
+        self.assertIsNone(store.get('a'))
+        store.set('a', 'fb', 200, {})
+
+        self.assertEqual(IdempotencyKey.objects.get(key='a').fingerprint, 'fb')
+
+    def test_expire_keys_in_batches(self):
+        now = datetime.now(timezone.utc)
+        IdempotencyKey.objects.bulk_create(
+            [IdempotencyKey(key=f'old-{n}', fingerprint='f', status=200, response={}, expires_at=now - timedelta(seconds=1)) for n in range(5)]
+            + [IdempotencyKey(key='fresh', fingerprint='f', status=200, response={}, expires_at=now + timedelta(hours=1))]
+        )
+
+        self.assertEqual(expire_keys(batch_size=2), 5)
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['fresh'])
+
+    def test_expire_command(self):
+        IdempotencyKey.objects.create(key='old', fingerprint='f', status=200, response={},
+                                      expires_at=datetime.now(timezone.utc) - timedelta(seconds=1))
+        stdout = StringIO()
+
+        call_command('expire_idempotency_keys', stdout=stdout)
+
+        self.assertIn('Deleted 1 expired idempotency keys', stdout.getvalue())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+class IdempotentReceiptViewTests(TestCase):
+
+    receipt_data = {
+        'retailer': 'Target',
+        'purchaseDate': '2022-01-02',
+        'purchaseTime': '13:13',
+        'total': '1.25',
+        'items': [
+            {'shortDescription': 'Pepsi - 12-oz', 'price': '1.25'}
+        ]
+    }
+
+    def setUp(self):
+        reset_idempotency_store()
+
+    def post_receipt(self, receipt_data, key):
+        return self.client.post(
+            reverse('receipt_processor.receipt'),
+            json.dumps(receipt_data),
+            content_type='application/json',
+            headers={'Idempotency-Key': key},
+        )
+
+    def test_retry_replays_the_original_response(self):
+        first = self.post_receipt(self.receipt_data, 'retry-1')
+
+        with self.assertNumQueries(0):
+            second = self.post_receipt(self.receipt_data, 'retry-1')
+
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertFalse(first.has_header('Idempotent-Replayed'))
+        self.assertEqual(Receipt.objects.count(), 1)
+        self.assertEqual(Item.objects.count(), 1)
+
+    def test_key_reused_for_another_receipt(self):
+        self.post_receipt(self.receipt_data, 'retry-1')
+
+        response = self.post_receipt(dict(self.receipt_data, total='2.25'), 'retry-1')
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Receipt.objects.count(), 1)
+
+    def test_invalid_receipts_are_not_stored(self):
+        receipt_data = dict(self.receipt_data)
+        del receipt_data['retailer']
+
+        self.assertEqual(self.post_receipt(receipt_data, 'retry-1').status_code, 400)
+        self.assertEqual(self.post_receipt(receipt_data, 'retry-1').status_code, 400)
+        self.assertEqual(get_idempotency_store().stats()['size'], 0)
+
+    def test_key_too_long(self):
+        response = self.post_receipt(self.receipt_data, 'k' * 256)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Receipt.objects.exists())
+
+    @override_settings(RECEIPT_IDEMPOTENCY={'BACKEND': 'database', 'MAX_SIZE': 10, 'TTL': 60})
+    def test_database_backend_replays_after_restart(self):
+        first = self.post_receipt(self.receipt_data, 'retry-1')
+        reset_idempotency_store()  # as if the retry reached a fresh process
+
+        second = self.post_receipt(self.receipt_data, 'retry-1')
+
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(get_idempotency_store().stats()['database_hits'], 1)
+
+    def test_metrics_report_the_store(self):
+        self.post_receipt(self.receipt_data, 'retry-1')
+
+        body = self.client.get(reverse('receipt_processor.metrics')).content.decode()
+
+        self.assertIn('receipt_idempotency_size 1', body)
+        self.assertIn('receipt_idempotency_evictions 0', body)
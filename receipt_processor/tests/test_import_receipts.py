@@ -0,0 +1,156 @@
+"""
+All tests for the import_receipts management command
+"""
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+import json
+import tempfile
+
+import ddt
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+
+from receipt_processor import ingest
+from receipt_processor.management.commands.import_receipts import map_in_order
+from receipt_processor.models import Item, Receipt
+
+
+@ddt.ddt
+class ImportReceiptsTests(TestCase):
+
+    def setUp(self):
+        self.receipts_data = [
+            {
+                'retailer': 'Walgreens',
+                'purchaseDate': '2022-01-02',
+                'purchaseTime': '08:13',
+                'total': '2.65',
+                'items': [
+                    {'shortDescription': 'Pepsi - 12-oz', 'price': '1.25'},
+                    {'shortDescription': 'Dasani', 'price': '1.40'}
+                ]
+            },
+            {
+                'retailer': 'Target',
+                'purchaseDate': '2022-01-02',
+                'purchaseTime': '13:13',
+                'total': '1.25',
+                'items': [
+                    {'shortDescription': 'Pepsi - 12-oz', 'price': '1.25'}
+                ]
+            },
+        ]
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def write_ndjson(self, name, receipts_data):
+        path = self.directory / name
+        path.write_text('\n'.join(json.dumps(receipt_data) for receipt_data in receipts_data) + '\n')
+        return path
+
+    def import_receipts(self, *args, **options):
+        stdout = StringIO()
+        call_command('import_receipts', *map(str, args), workers=0, stdout=stdout, **options)
+        return stdout.getvalue()
+
+    @ddt.data('receipts.ndjson', 'receipts.json')
+    def test_import(self, name):
+        path = self.directory / name
+        if name.endswith('.ndjson'):
+            self.write_ndjson(name, self.receipts_data)
+        else:
+            path.write_text(json.dumps(self.receipts_data))
+
+        output = self.import_receipts(path)
+
+        self.assertIn('2 stored', output)
+        self.assertEqual(
+            sorted(Receipt.objects.values_list('retailer', 'points')),
+            [('Target', 31), ('Walgreens', 15)],
+        )
+        self.assertEqual(Item.objects.count(), 3)
+
+    def test_invalid_receipts_are_reported(self):
+        del self.receipts_data[0]['retailer']
+        path = self.write_ndjson('receipts.ndjson', self.receipts_data)
+        errors = self.directory / 'errors.ndjson'
+
+        output = self.import_receipts(path, errors=errors)
+
+        self.assertIn('1 invalid', output)
+        self.assertEqual(Receipt.objects.count(), 1)
+        [error] = [json.loads(line) for line in errors.read_text().splitlines()]
+        self.assertEqual(error['record'], 1)
+        self.assertIn('retailer', error['error'])
+
+    def test_dry_run_writes_nothing(self):
+        path = self.write_ndjson('receipts.ndjson', self.receipts_data)
+
+        output = self.import_receipts(path, dry_run=True)
+
+        self.assertIn('Dry run', output)
+        self.assertIn('46 points', output)
+        self.assertEqual(Receipt.objects.count(), 0)
+
+    def test_repeat_import_stores_nothing_new(self):
+        path = self.write_ndjson('receipts.ndjson', self.receipts_data)
+
+        self.import_receipts(path)
+        output = self.import_receipts(path)
+
+        self.assertIn('0 stored, 2 duplicates', output)
+        self.assertEqual(Receipt.objects.count(), 2)
+
+    def test_receipts_looked_up_once_per_batch(self):
+        path = self.write_ndjson('receipts.ndjson', self.receipts_data)
+
+        with mock.patch.object(ingest, 'find_receipts_by_hash', wraps=ingest.find_receipts_by_hash) as lookup:
+            self.import_receipts(path)
+
+        # The command's own lookup is handed to store_receipts
+        lookup.assert_not_called()
+        self.assertEqual(Receipt.objects.count(), 2)
+
+    def test_checkpoint_resumes_import(self):
+        path = self.write_ndjson('receipts.ndjson', self.receipts_data[:1])
+        checkpoint = self.directory / 'checkpoint.json'
+
+        self.import_receipts(path, checkpoint=checkpoint, batch_size=1)
+        self.assertEqual(json.loads(checkpoint.read_text()), {str(path): 1})
+
+        # The file grows, only the new record is read on the next run
+        self.write_ndjson('receipts.ndjson', self.receipts_data)
+        output = self.import_receipts(path, checkpoint=checkpoint, batch_size=1)
+
+        self.assertIn('1 read', output)
+        self.assertEqual(json.loads(checkpoint.read_text()), {str(path): 2})
+        self.assertEqual(Receipt.objects.count(), 2)
+
+    def test_process_pool(self):
+        path = self.write_ndjson('receipts.ndjson', self.receipts_data)
+
+        stdout = StringIO()
+        call_command('import_receipts', str(path), workers=2, chunk_size=1, stdout=stdout)
+
+        self.assertEqual(Receipt.objects.count(), 2)
+
+
+class MapInOrderTests(SimpleTestCase):
+
+    def test_reads_ahead_at_most_the_window(self):
+        read = []
+
+        def chunks():
+            for number in range(100):
+                read.append(number)
+                yield number
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            results = map_in_order(executor, lambda number: number * 2, chunks(), window=4)
+            self.assertEqual(next(results), 0)
+            self.assertLessEqual(len(read), 5)
+            self.assertEqual(list(results), [number * 2 for number in range(1, 100)])
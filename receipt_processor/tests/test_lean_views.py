@@ -0,0 +1,88 @@
+"""
+All tests for lean_views.py
+"""
+import ddt
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+
+from receipt_processor.cache import get_points_cache
+from receipt_processor.lean_views import points_statement
+from receipt_processor.metrics import registry
+from receipt_processor.models import Receipt
+
+
+@ddt.ddt
+class LeanPointsViewTests(TestCase):
+
+    def setUp(self):
+        get_points_cache().clear()
+        self.receipt = Receipt.objects.create(
+            retailer='Walgreens',
+            purchase_date='2022-01-02',
+            purchase_time='13:13',
+            total_cents=125,
+            points=31,
+        )
+
+    def test_get_points_for_receipt(self):
+        response = self.client.get(reverse('receipt_processor.lean_points', args=[self.receipt.id]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(response.content, b'{"points":31}')
+        self.assertEqual(get_points_cache().get(str(self.receipt.id)), 31)
+
+    def test_points_answered_from_cache(self):
+        get_points_cache().set(str(self.receipt.id), 99)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('receipt_processor.lean_points', args=[self.receipt.id]))
+
+        self.assertEqual(response.json(), {'points': 99})
+
+    def test_id_in_other_forms(self):
+        # Upper case and undashed spellings name the same receipt
+        for receipt_id in (str(self.receipt.id).upper(), self.receipt.id.hex):
+            response = self.client.get(reverse('receipt_processor.lean_points', args=[receipt_id]))
+            self.assertEqual(response.json(), {'points': 31})
+
+    def test_repeated_lookups_reuse_the_cursor(self):
+        statements = set()
+        for _ in range(3):
+            get_points_cache().clear()
+            response = self.client.get(reverse('receipt_processor.lean_points', args=[self.receipt.id]))
+            self.assertEqual(response.json(), {'points': 31})
+            statements.add(points_statement(connection))
+
+        self.assertEqual(len(statements), 1)
+
+    def test_query_reported_to_metrics(self):
+        registry.clear()
+
+        self.client.get(reverse('receipt_processor.lean_points', args=[self.receipt.id]))
+
+        labels = (('endpoint', 'receipt_processor.lean_points'), ('method', 'GET'))
+        _, histograms = registry._metrics['receipt_request_db_queries']
+        self.assertEqual(histograms[labels].sum, 1)
+
+    def test_receipt_does_not_exist(self):
+        response = self.client.get(
+            reverse('receipt_processor.lean_points', args=['ead122bd-3cef-40d3-8db1-835a75fef386'])
+        )
+
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('ead122bd-3cef-40d3-8db1-835a75fef386', response.json())
+
+    @ddt.data('not-a-uuid', '1234', 'ead122bd-3cef-40d3-8db1-835a75fef38z')
+    def test_malformed_id_rejected_without_query(self, receipt_id):
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('receipt_processor.lean_points', args=[receipt_id]))
+
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('not a valid id', response.json())
+
+    def test_post_not_allowed(self):
+        response = self.client.post(reverse('receipt_processor.lean_points', args=[self.receipt.id]))
+
+        self.assertEqual(response.status_code, 405)
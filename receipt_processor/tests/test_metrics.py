@@ -0,0 +1,97 @@
+"""
+All tests for metrics.py and middleware.py
+"""
+import json
+import os
+import tempfile
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from receipt_processor.metrics import MetricsRegistry, phase, registry
+
+
+class MetricsRegistryTests(TestCase):
+
+    def test_render_cumulative_buckets(self):
+        metrics = MetricsRegistry()
+        for value in (0, 3, 3, 50):
+            metrics.observe('queries', 'Queries', {'endpoint': 'points'}, value, buckets=(1, 5))
+
+        rendered = metrics.render()
+
+        self.assertIn('# TYPE queries histogram', rendered)
+        self.assertIn('queries_bucket{endpoint="points",le="1"} 1', rendered)
+        self.assertIn('queries_bucket{endpoint="points",le="5"} 3', rendered)
+        self.assertIn('queries_bucket{endpoint="points",le="+Inf"} 4', rendered)
+        self.assertIn('queries_sum{endpoint="points"} 56', rendered)
+        self.assertIn('queries_count{endpoint="points"} 4', rendered)
+
+    def test_phase_outside_request_is_a_no_op(self):
+        with phase('score'):
+            pass
+
+
+class MetricsMiddlewareTests(TestCase):
+
+    receipt_data = {
+        'retailer': 'Target',
+        'purchaseDate': '2022-01-02',
+        'purchaseTime': '13:13',
+        'total': '1.25',
+        'items': [
+            {'shortDescription': 'Pepsi - 12-oz', 'price': '1.25'}
+        ]
+    }
+
+    def setUp(self):
+        registry.clear()
+
+    def post_receipt(self):
+        return self.client.post(
+            reverse('receipt_processor.receipt'),
+            json.dumps(self.receipt_data),
+            content_type='application/json'
+        )
+
+    def test_metrics_endpoint_reports_request_breakdown(self):
+        self.post_receipt()
+
+        response = self.client.get(reverse('receipt_processor.metrics'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        labels = 'endpoint="receipt_processor.receipt",method="POST"'
+        self.assertIn(f'receipt_request_duration_seconds_count{{{labels}}} 1', body)
+        self.assertIn(f'receipt_request_db_queries_count{{{labels}}} 1', body)
+        for name in ('parse', 'validate', 'score', 'persist'):
+            self.assertIn(f'receipt_request_phase_duration_seconds_count{{{labels},phase="{name}"}} 1', body)
+        self.assertIn('receipt_points_cache_hits', body)
+
+    def test_query_count_recorded(self):
+        self.post_receipt()
+
+        labels = (('endpoint', 'receipt_processor.receipt'), ('method', 'POST'))
+        _, histograms = registry._metrics['receipt_request_db_queries']
+        # hash lookup, savepoint, receipt insert, item insert, two rollup upserts, savepoint release
+        self.assertEqual(histograms[labels].sum, 7)
+
+    def test_slow_requests_are_profiled(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(RECEIPT_PROFILE={'ENABLED': True, 'SAMPLE_RATE': 1, 'SLOW_MS': 0, 'DIRECTORY': directory}):
+                self.post_receipt()
+
+            self.assertEqual(len(os.listdir(directory)), 1)
+
+    async def test_async_query_count_recorded(self):
+        await self.async_client.post(
+            reverse('receipt_processor.async_receipt'),
+            json.dumps(self.receipt_data),
+            content_type='application/json'
+        )
+
+        labels = (('endpoint', 'receipt_processor.async_receipt'), ('method', 'POST'))
+        _, histograms = registry._metrics['receipt_request_db_queries']
+        # the same statements as the sync view, run by sync_to_async in its worker thread
+        self.assertEqual(histograms[labels].sum, 7)
@@ -0,0 +1,25 @@
+"""
+All tests for money.py
+"""
+import ddt
+
+from django.test import SimpleTestCase
+
+from receipt_processor.money import format_cents, parse_cents
+
+
+@ddt.ddt
+class MoneyTests(SimpleTestCase):
+
+    @ddt.data(
+        ('0.00', 0),
+        ('0.05', 5),
+        ('1.25', 125),
+        ('35.35', 3535),
+        ('0.29', 29),  # float('0.29') * 100 is 28.999999999999996
+        ('12345678901234.99', 1234567890123499),
+    )
+    @ddt.unpack
+    def test_round_trip(self, amount, cents):
+        self.assertEqual(parse_cents(amount), cents)
+        self.assertEqual(format_cents(cents), amount)
@@ -0,0 +1,140 @@
+"""
+All tests for the recompute_points management command
+"""
+from datetime import time
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+import json
+import tempfile
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from receipt_processor.cache import get_points_cache
+from receipt_processor.models import PointsRollup, Receipt, RetailerDailyRollup
+from receipt_processor.scoring import RULE_SETS
+
+
+# The 2-4pm bonus window extended to 5pm
+LONGER_AFTERNOON = RULE_SETS[1]._replace(version=2, afternoon_end=time(17, 0))
+
+
+@mock.patch.dict(RULE_SETS, {2: LONGER_AFTERNOON})
+class RecomputePointsTests(TestCase):
+
+    def setUp(self):
+        receipts_data = [
+            # 99 points under version 1, 109 once 16:33 is in the afternoon window
+            {
+                'retailer': 'M&M Corner Market',
+                'purchaseDate': '2022-03-20',
+                'purchaseTime': '16:33',
+                'total': '9.00',
+                'items': [{'shortDescription': 'Gatorade', 'price': '2.25'}] * 4,
+            },
+            # 15 points under both versions
+            {
+                'retailer': 'Walgreens',
+                'purchaseDate': '2022-01-02',
+                'purchaseTime': '08:13',
+                'total': '2.65',
+                'items': [
+                    {'shortDescription': 'Pepsi - 12-oz', 'price': '1.25'},
+                    {'shortDescription': 'Dasani', 'price': '1.40'}
+                ]
+            },
+        ]
+        response = self.client.post(
+            reverse('receipt_processor.receipt_batch'),
+            json.dumps(receipts_data),
+            content_type='application/json'
+        )
+        self.market_id, self.walgreens_id = [result['id'] for result in response.data['receipts']]
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def recompute(self, **options):
+        stdout = StringIO()
+        call_command('recompute_points', workers=0, stdout=stdout, **options)
+        return stdout.getvalue()
+
+    def test_new_receipts_use_the_configured_rules(self):
+        self.assertEqual(Receipt.objects.get(id=self.market_id).rules_version, 1)
+
+        with override_settings(RECEIPT_RULES_VERSION=2):
+            response = self.client.post(
+                reverse('receipt_processor.receipt'),
+                json.dumps({
+                    'retailer': 'Target',
+                    'purchaseDate': '2022-01-02',
+                    'purchaseTime': '16:13',
+                    'total': '1.25',
+                    'items': [{'shortDescription': 'Pepsi - 12-oz', 'price': '1.25'}]
+                }),
+                content_type='application/json'
+            )
+
+        receipt = Receipt.objects.get(id=response.data['id'])
+        self.assertEqual((receipt.points, receipt.rules_version), (41, 2))
+
+    def test_recompute(self):
+        output = self.recompute(rules_version=2)
+
+        self.assertIn('2 scanned, 1 changed, 1 unchanged', output)
+        self.assertEqual(
+            dict(Receipt.objects.values_list('retailer', 'points')),
+            {'M&M Corner Market': 109, 'Walgreens': 15},
+        )
+        self.assertEqual(set(Receipt.objects.values_list('rules_version', flat=True)), {2})
+
+        # the rollups and points cache follow the new points
+        self.assertEqual(
+            sorted(PointsRollup.objects.filter(receipts__gt=0).values_list('points', 'receipts')),
+            [(15, 1), (109, 1)],
+        )
+        self.assertEqual(RetailerDailyRollup.objects.get(retailer='M&M Corner Market').points, 109)
+        self.assertEqual(get_points_cache().get(str(self.market_id)), 109)
+
+        # everything is on version 2 already
+        self.assertIn('0 scanned', self.recompute(rules_version=2))
+
+    def test_recompute_defaults_to_the_configured_rules(self):
+        with override_settings(RECEIPT_RULES_VERSION=2):
+            self.recompute()
+
+        self.assertEqual(Receipt.objects.get(id=self.market_id).points, 109)
+
+    def test_dry_run(self):
+        output = self.recompute(rules_version=2, dry_run=True)
+
+        self.assertIn('1 changed', output)
+        self.assertEqual(Receipt.objects.get(id=self.market_id).points, 99)
+        self.assertEqual(set(Receipt.objects.values_list('rules_version', flat=True)), {1})
+
+    def test_checkpoint(self):
+        checkpoint = self.directory / 'checkpoint.json'
+
+        self.recompute(rules_version=2, chunk_size=1, checkpoint=checkpoint)
+
+        self.assertEqual(json.loads(checkpoint.read_text()), {
+            'rules_version': 2,
+            'last_ids': {'default': str(max(Receipt.objects.values_list('id', flat=True)))},
+        })
+
+        # A receipt moved back to version 1 behind the checkpoint is not revisited when resuming
+        Receipt.objects.update(rules_version=1)
+        self.assertIn('0 scanned', self.recompute(rules_version=2, checkpoint=checkpoint))
+
+    def test_process_pool(self):
+        stdout = StringIO()
+        call_command('recompute_points', rules_version=2, workers=2, chunk_size=1, stdout=stdout)
+
+        self.assertEqual(Receipt.objects.get(id=self.market_id).points, 109)
+
+    def test_unknown_rules_version(self):
+        with self.assertRaises(CommandError):
+            self.recompute(rules_version=3)
@@ -0,0 +1,167 @@
+"""
+All tests for retention.py and the apply_retention management command
+"""
+from datetime import date
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+import gzip
+import json
+import tempfile
+import uuid
+
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+
+from receipt_processor.cache import get_points_cache
+from receipt_processor.models import Item, PointsRollup, Receipt, RetailerDailyRollup
+from receipt_processor.retention import AUTO_VACUUM_INCREMENTAL, apply_retention, compact, cutoff_date, database_size
+
+
+class RetentionTests(TestCase):
+
+    def setUp(self):
+        self.receipts_data = [
+            {
+                'retailer': 'Target',
+                'purchaseDate': f'2022-01-0{day}',
+                'purchaseTime': '13:13',
+                'total': f'{day}.25',
+                'items': [
+                    {'shortDescription': 'Pepsi - 12-oz', 'price': f'{day}.00'},
+                    {'shortDescription': 'Dasani', 'price': '0.25'},
+                ]
+            }
+            for day in range(1, 7)
+        ]
+        response = self.client.post(
+            reverse('receipt_processor.receipt_batch'),
+            json.dumps(self.receipts_data),
+            content_type='application/json'
+        )
+        self.ids = [str(result['id']) for result in response.data['receipts']]
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def rollup_rows(self):
+        return (
+            sorted(RetailerDailyRollup.objects.values_list('purchase_date', 'receipts')),
+            sum(PointsRollup.objects.values_list('receipts', flat=True)),
+        )
+
+    def test_cutoff_date(self):
+        self.assertEqual(cutoff_date(30, today=date(2022, 3, 1)), date(2022, 1, 30))
+
+    def test_old_receipts_deleted_with_their_items_and_rollups(self):
+        get_points_cache().set(self.ids[0], 40)
+
+        report = apply_retention(date(2022, 1, 4), 'default', batch_size=2, vacuum='none')
+
+        self.assertEqual(report['receipts'], 3)
+        self.assertEqual(report['items'], 6)
+        self.assertEqual(report['orphaned_items'], 0)
+        self.assertIsNone(report['archive'])
+        self.assertEqual(sorted(Receipt.objects.values_list('purchase_date', flat=True)),
+                         [date(2022, 1, 4), date(2022, 1, 5), date(2022, 1, 6)])
+        self.assertEqual(Item.objects.count(), 6)
+        self.assertEqual(self.rollup_rows(), ([(date(2022, 1, day), 1) for day in (4, 5, 6)], 3))
+        self.assertIsNone(get_points_cache().get(self.ids[0]))
+        self.assertGreater(report['bytes_before'], 0)
+        self.assertEqual(report['bytes_reclaimed'], report['bytes_before'] - report['bytes_after'])
+
+    def test_batches_pause_in_between(self):
+        with mock.patch('receipt_processor.retention.time.sleep') as sleep:
+            report = apply_retention(date(2022, 1, 5), 'default', batch_size=2, pause=0.5, vacuum='none')
+
+        self.assertEqual(report['receipts'], 4)
+        self.assertEqual(sleep.call_args_list, [mock.call(0.5)] * 2)
+
+    def test_orphaned_items_deleted(self):
+        orphan = Item.objects.create(receipt_id=uuid.uuid4(), short_description='Dasani', price_cents=140)
+
+        report = apply_retention(date(2022, 1, 1), 'default', vacuum='none')
+
+        self.assertEqual((report['receipts'], report['orphaned_items']), (0, 1))
+        self.assertFalse(Item.objects.filter(pk=orphan.pk).exists())
+        self.assertEqual(Item.objects.count(), 12)
+
+    def test_archive_can_be_imported_as_new_receipts(self):
+        report = apply_retention(date(2022, 1, 3), 'default', archive_dir=self.directory, vacuum='none')
+
+        path = Path(report['archive'])
+        self.assertEqual([p.name for p in self.directory.iterdir()], [path.name])
+        self.assertTrue(path.name.endswith('.ndjson.gz'))
+        with gzip.open(path, 'rt') as archive:
+            archived = [json.loads(line) for line in archive]
+        self.assertEqual([receipt['id'] for receipt in archived], self.ids[:2])
+        self.assertEqual(archived[0]['items'], self.receipts_data[0]['items'])
+        self.assertEqual(archived[0]['rulesVersion'], 1)
+
+        call_command('import_receipts', str(path), workers=0, stdout=StringIO())
+        self.assertEqual(Receipt.objects.count(), 6)
+        self.assertEqual(self.rollup_rows()[1], 6)
+        # Re-imported receipts are new receipts, the archived ids are not restored
+        self.assertFalse(Receipt.objects.filter(id__in=self.ids[:2]).exists())
+
+    def test_empty_archive_not_kept(self):
+        report = apply_retention(date(2021, 1, 1), 'default', archive_dir=self.directory, vacuum='none')
+
+        self.assertIsNone(report['archive'])
+        self.assertEqual(list(self.directory.iterdir()), [])
+
+    def test_command(self):
+        stdout = StringIO()
+        call_command('apply_retention', before='2022-01-03', vacuum='none', stdout=stdout)
+
+        self.assertIn('Deleted 2 receipts purchased before 2022-01-03, 4 items and 0 orphaned items', stdout.getvalue())
+        self.assertEqual(Receipt.objects.count(), 4)
+
+    def test_command_max_age(self):
+        with self.settings(RECEIPT_RETENTION={'MAX_AGE_DAYS': 30}):
+            call_command('apply_retention', vacuum='none', stdout=StringIO())
+
+        self.assertFalse(Receipt.objects.exists())
+
+    def test_command_max_age_zero_overrides_setting(self):
+        with self.settings(RECEIPT_RETENTION={'MAX_AGE_DAYS': 36500}):
+            call_command('apply_retention', max_age_days=0, vacuum='none', stdout=StringIO())
+
+        self.assertFalse(Receipt.objects.exists())
+
+    def test_command_dry_run(self):
+        stdout = StringIO()
+        call_command('apply_retention', before='2022-01-04', dry_run=True, stdout=stdout)
+
+        self.assertIn('default: 3 receipts purchased before 2022-01-04 and 0 orphaned items would be deleted', stdout.getvalue())
+        self.assertEqual(Receipt.objects.count(), 6)
+
+    def test_command_requires_a_policy(self):
+        with self.assertRaisesMessage(CommandError, 'No retention policy'):
+            call_command('apply_retention', stdout=StringIO())
+
+
+class CompactionTests(TransactionTestCase):
+
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            return cursor.execute(f'PRAGMA {name}').fetchone()[0]
+
+    def test_full_vacuum_enables_incremental_vacuum(self):
+        compact('default', vacuum='full')
+        self.assertEqual(self.pragma('auto_vacuum'), AUTO_VACUUM_INCREMENTAL)
+
+        Item.objects.bulk_create([
+            Item(receipt=Receipt.objects.create(retailer='Target', total_cents=100), short_description='x' * 100)
+            for _ in range(500)
+        ])
+        Receipt.objects.all().delete()
+        size, free = database_size('default')
+        self.assertGreater(free, 0)
+
+        compact('default', vacuum='incremental', vacuum_pages=10)
+
+        self.assertEqual(self.pragma('freelist_count'), 0)
+        self.assertEqual(database_size('default'), (size - free, 0))
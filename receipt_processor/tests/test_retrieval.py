@@ -0,0 +1,158 @@
+"""
+All tests for retrieval.py
+"""
+from datetime import date
+import json
+import uuid
+
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from receipt_processor.models import Receipt
+from receipt_processor.retrieval import InvalidCursor, decode_cursor, encode_cursor, etag_matches, list_receipts, page_queryset
+
+
+class CursorTests(SimpleTestCase):
+
+    def test_round_trip(self):
+        receipt = Receipt(id='ead122bd-3cef-40d3-8db1-835a75fef386', purchase_date=date(2022, 1, 2))
+
+        self.assertEqual(decode_cursor(encode_cursor(receipt)), (receipt.purchase_date, uuid.UUID(receipt.id)))
+
+    def test_invalid_cursor(self):
+        for cursor in ['', 'not a cursor', encode_cursor(Receipt(id='bad', purchase_date=date(2022, 1, 2)))]:
+            with self.assertRaises(InvalidCursor):
+                decode_cursor(cursor)
+
+    def test_etag_matches(self):
+        self.assertTrue(etag_matches('"a", "b"', '"b"'))
+        self.assertTrue(etag_matches('W/"b"', '"b"'))
+        self.assertTrue(etag_matches('*', '"b"'))
+        self.assertFalse(etag_matches('"a"', '"b"'))
+        self.assertFalse(etag_matches(None, '"b"'))
+
+
+class ReceiptRetrievalTests(TestCase):
+
+    def setUp(self):
+        self.receipts_data = [
+            {
+                'retailer': 'Target' if number % 3 else 'Walgreens',
+                'purchaseDate': f'2022-01-{number % 5 + 1:02d}',
+                'purchaseTime': '13:13',
+                'total': f'{number}.25',
+                'items': [
+                    {'shortDescription': 'Pepsi - 12-oz', 'price': f'{number}.00'},
+                    {'shortDescription': 'Dasani', 'price': '0.25'},
+                ]
+            }
+            for number in range(12)
+        ]
+        response = self.client.post(
+            reverse('receipt_processor.receipt_batch'),
+            json.dumps(self.receipts_data),
+            content_type='application/json'
+        )
+        self.results = response.data['receipts']
+
+    def list_all(self, page_size, **params):
+        receipts = []
+        cursor = None
+        while True:
+            query = dict(params, limit=page_size, **({'cursor': cursor} if cursor else {}))
+            response = self.client.get(reverse('receipt_processor.receipts'), query)
+            self.assertEqual(response.status_code, 200)
+            receipts += response.data['receipts']
+            cursor = response.data['next']
+            if cursor is None:
+                return receipts
+
+    def test_get_receipt_with_its_items(self):
+        result = self.results[7]
+
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('receipt_processor.receipt_detail', args=[result['id']]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {
+            'id': str(result['id']),
+            **self.receipts_data[7],
+            'points': result['points'],
+        })
+
+    def test_unknown_and_invalid_ids(self):
+        for receipt_id in ['ead122bd-3cef-40d3-8db1-835a75fef386', 'not-a-uuid']:
+            response = self.client.get(reverse('receipt_processor.receipt_detail', args=[receipt_id]))
+            self.assertEqual(response.status_code, 404)
+
+    def test_not_modified_skips_the_items(self):
+        url = reverse('receipt_processor.receipt_detail', args=[self.results[0]['id']])
+        etag = self.client.get(url)['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, headers={'If-None-Match': etag})
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_etag_changes_when_rescored(self):
+        url = reverse('receipt_processor.receipt_detail', args=[self.results[0]['id']])
+        etag = self.client.get(url)['ETag']
+        Receipt.objects.filter(id=self.results[0]['id']).update(points=1000, rules_version=2)
+
+        response = self.client.get(url, headers={'If-None-Match': etag})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['points'], 1000)
+
+    def test_pages_cover_every_receipt_once_newest_first(self):
+        receipts = self.list_all(page_size=5)
+
+        self.assertEqual(sorted(receipt['id'] for receipt in receipts), sorted(str(result['id']) for result in self.results))
+        self.assertEqual(
+            [(receipt['purchaseDate'], receipt['id']) for receipt in receipts],
+            sorted([(receipt['purchaseDate'], receipt['id']) for receipt in receipts], reverse=True),
+        )
+        self.assertTrue(all(len(receipt['items']) == 2 for receipt in receipts))
+
+    def test_pages_take_a_fixed_number_of_queries(self):
+        first = self.client.get(reverse('receipt_processor.receipts'), {'limit': 3})
+
+        # The page, then the items of every receipt on it
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('receipt_processor.receipts'), {'limit': 3, 'cursor': first.data['next']})
+
+        self.assertEqual(len(response.data['receipts']), 3)
+
+    def test_filters(self):
+        receipts = self.list_all(page_size=2, retailer='Walgreens', start='2022-01-02', end='2022-01-04')
+
+        expected = [
+            str(result['id']) for result, data in zip(self.results, self.receipts_data)
+            if data['retailer'] == 'Walgreens' and '2022-01-02' <= data['purchaseDate'] <= '2022-01-04'
+        ]
+        self.assertEqual(sorted(receipt['id'] for receipt in receipts), sorted(expected))
+
+    def test_list_not_modified(self):
+        url = reverse('receipt_processor.receipts')
+        etag = self.client.get(url, {'limit': 4})['ETag']
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url, {'limit': 4}, headers={'If-None-Match': etag}).status_code, 304)
+        # A newer receipt moves onto the first page
+        self.client.post(reverse('receipt_processor.receipt'), json.dumps(dict(self.receipts_data[0], purchaseDate='2022-01-31')),
+                         content_type='application/json')
+        self.assertEqual(self.client.get(url, {'limit': 4}, headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_invalid_parameters(self):
+        url = reverse('receipt_processor.receipts')
+        for params in [{'cursor': 'nope'}, {'limit': '0'}, {'limit': '501'}, {'limit': 'x'}, {'start': '2022-02-30'}]:
+            self.assertEqual(self.client.get(url, params).status_code, 400)
+
+    def test_deep_pages_are_index_range_scans(self):
+        receipts, cursor = list_receipts(limit=2)
+
+        for retailer, index in [(None, 'receipt_date_id_idx'), ('Target', 'receipt_retailer_date_id_idx')]:
+            plan = page_queryset(retailer=retailer, cursor=cursor)[:50].explain()
+            self.assertIn(index, plan)
+            self.assertNotIn('TEMP B-TREE', plan)  # no sort, rows come in index order
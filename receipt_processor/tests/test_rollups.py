@@ -0,0 +1,159 @@
+"""
+All tests for rollups.py
+"""
+import json
+
+import ddt
+
+from django.test import TestCase
+from django.urls import reverse
+
+from receipt_processor.models import PointsRollup, Receipt, RetailerDailyRollup
+from receipt_processor.rollups import rebuild_rollups
+
+
+@ddt.ddt
+class RollupTests(TestCase):
+
+    def setUp(self):
+        self.receipts_data = [
+            # 15 points
+            {
+                'retailer': 'Walgreens',
+                'purchaseDate': '2022-01-02',
+                'purchaseTime': '08:13',
+                'total': '2.65',
+                'items': [
+                    {'shortDescription': 'Pepsi - 12-oz', 'price': '1.25'},
+                    {'shortDescription': 'Dasani', 'price': '1.40'}
+                ]
+            },
+            # 31 points
+            {
+                'retailer': 'Target',
+                'purchaseDate': '2022-01-02',
+                'purchaseTime': '13:13',
+                'total': '1.25',
+                'items': [
+                    {'shortDescription': 'Pepsi - 12-oz', 'price': '1.25'}
+                ]
+            },
+            # 28 points
+            {
+                'retailer': 'Target',
+                'purchaseDate': '2022-01-01',
+                'purchaseTime': '13:01',
+                'total': '35.35',
+                'items': [
+                    {'shortDescription': 'Mountain Dew 12PK', 'price': '6.49'},
+                    {'shortDescription': 'Emils Cheese Pizza', 'price': '12.25'},
+                    {'shortDescription': 'Knorr Creamy Chicken', 'price': '1.26'},
+                    {'shortDescription': 'Doritos Nacho Cheese', 'price': '3.35'},
+                    {'shortDescription': '   Klarbrunn 12-PK 12 FL OZ  ', 'price': '12.00'}
+                ]
+            },
+        ]
+
+    def post_receipts(self, receipts_data):
+        response = self.client.post(
+            reverse('receipt_processor.receipt_batch'),
+            json.dumps(receipts_data),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def rollup_rows(self):
+        return (
+            sorted(RetailerDailyRollup.objects.filter(receipts__gt=0).values_list('retailer', 'purchase_date', 'receipts', 'points')),
+            sorted(PointsRollup.objects.filter(receipts__gt=0).values_list('points', 'receipts')),
+        )
+
+    def test_rollups_updated_when_receipts_are_stored(self):
+        self.post_receipts(self.receipts_data)
+        # a repeat submission is not counted twice
+        self.post_receipts(self.receipts_data[:1])
+
+        daily, distribution = self.rollup_rows()
+        self.assertEqual([(retailer, str(day), receipts, points) for retailer, day, receipts, points in daily], [
+            ('Target', '2022-01-01', 1, 28),
+            ('Target', '2022-01-02', 1, 31),
+            ('Walgreens', '2022-01-02', 1, 15),
+        ])
+        self.assertEqual(distribution, [(15, 1), (28, 1), (31, 1)])
+
+    def test_rebuild_matches_incremental_rollups(self):
+        self.post_receipts(self.receipts_data)
+        incremental = self.rollup_rows()
+
+        RetailerDailyRollup.objects.update(receipts=0, points=0)
+        rebuild_rollups()
+
+        self.assertEqual(self.rollup_rows(), incremental)
+
+    def test_rollups_updated_by_async_view(self):
+        response = self.client.post(
+            reverse('receipt_processor.async_receipt'),
+            json.dumps(self.receipts_data[1]),
+            content_type='application/json'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.rollup_rows()[1], [(31, 1)])
+
+    def test_retailer_analytics(self):
+        self.post_receipts(self.receipts_data)
+
+        response = self.client.get(reverse('receipt_processor.analytics_retailers'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['retailers'], [
+            {'retailer': 'Target', 'receipts': 2, 'points': 59},
+            {'retailer': 'Walgreens', 'receipts': 1, 'points': 15},
+        ])
+
+    @ddt.data(
+        ({'start': '2022-01-02'}, [('2022-01-02', 2, 46)]),
+        ({'retailer': 'Target'}, [('2022-01-01', 1, 28), ('2022-01-02', 1, 31)]),
+        ({}, [('2022-01-01', 1, 28), ('2022-01-02', 2, 46)]),
+    )
+    @ddt.unpack
+    def test_daily_analytics(self, query, expected_days):
+        self.post_receipts(self.receipts_data)
+
+        response = self.client.get(reverse('receipt_processor.analytics_daily'), query)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(str(day['date']), day['receipts'], day['points']) for day in response.data['days']],
+            expected_days,
+        )
+
+    def test_points_distribution(self):
+        self.post_receipts(self.receipts_data)
+
+        response = self.client.get(reverse('receipt_processor.analytics_points'), {'bucket': 10})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['distribution'], [
+            {'points': 10, 'receipts': 1},
+            {'points': 20, 'receipts': 1},
+            {'points': 30, 'receipts': 1},
+        ])
+
+    @ddt.data(
+        ('receipt_processor.analytics_daily', {'start': '01/02/2022'}),
+        ('receipt_processor.analytics_points', {'bucket': 0}),
+    )
+    @ddt.unpack
+    def test_invalid_filters(self, url_name, query):
+        response = self.client.get(reverse(url_name), query)
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_analytics_use_no_receipt_scan(self):
+        self.post_receipts(self.receipts_data)
+        Receipt.objects.all().delete()
+
+        # served entirely from the rollups
+        response = self.client.get(reverse('receipt_processor.analytics_retailers'))
+        self.assertEqual(len(response.data['retailers']), 2)
@@ -0,0 +1,186 @@
+"""
+All tests for rules.py
+"""
+from datetime import date, time
+from pathlib import Path
+import json
+import os
+import random
+import shutil
+import tempfile
+
+import ddt
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from receipt_processor.models import Receipt
+from receipt_processor.rules import (
+    InvalidRules,
+    RulesRegistry,
+    compile_built_in,
+    compile_rule_set,
+    load_rules_file,
+    rule_set_definition,
+)
+from receipt_processor.scoring import LATEST_RULES, RULE_SETS, calculate_points
+
+
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+EXAMPLE_RULES = BASE_DIR / 'rules.example.yaml'
+
+DECEMBER_RECEIPT = ('Target', date(2022, 12, 2), time(13, 13), 125, [('Pepsi - 12-oz', 125)])
+
+
+@ddt.ddt
+class CompiledRulesTests(SimpleTestCase):
+
+    def test_built_in_rules_match_calculate_points(self):
+        rng = random.Random(2024)
+        for rule_set in RULE_SETS.values():
+            score = compile_built_in(rule_set).score
+            for _ in range(500):
+                receipt = (
+                    ''.join(rng.choice('Ab1 &-') for _ in range(rng.randint(1, 20))),
+                    date(2022, rng.randint(1, 12), rng.randint(1, 28)),
+                    time(rng.randint(0, 23), rng.randint(0, 59)),
+                    rng.choice([rng.randint(0, 5000), rng.randint(0, 50) * 100, rng.randint(0, 200) * 25]),
+                    [(' ' * rng.randint(0, 2) + 'x' * rng.randint(1, 12), rng.randint(0, 5000))
+                     for _ in range(rng.randint(0, 6))],
+                )
+                self.assertEqual(score(*receipt), calculate_points(*receipt, rules=rule_set), receipt)
+
+    def test_retailer_variants(self):
+        compiled = compile_rule_set(2, rule_set_definition(LATEST_RULES), {
+            'Target': [
+                {'rule': 'purchase_date_window', 'start': '2022-12-01', 'end': '2023-01-01', 'points': 100},
+                {'rule': 'description_length_multiple', 'multiple': 13, 'percent': 100},
+            ],
+        })
+        base_points = calculate_points(*DECEMBER_RECEIPT)
+
+        # 100 for the date, 1.25 for the 13 character description, rounded up
+        self.assertEqual(compiled.score(*DECEMBER_RECEIPT), base_points + 100 + 2)
+        self.assertEqual(compiled.score('Walmart', *DECEMBER_RECEIPT[1:]), calculate_points('Walmart', *DECEMBER_RECEIPT[1:]))
+        self.assertEqual(compiled.score('Target', date(2023, 1, 1), *DECEMBER_RECEIPT[2:]),
+                         calculate_points('Target', date(2023, 1, 1), *DECEMBER_RECEIPT[2:]) + 2)
+
+    def test_rules_are_compiled_to_one_function(self):
+        compiled = compile_built_in(LATEST_RULES)
+
+        self.assertIn('def score(', compiled.source)
+        self.assertNotIn('variants', compiled.source)
+        self.assertIn('total_cents % 25 == 0', compiled.source)
+
+    @ddt.data(
+        ({'rule': 'lucky_number', 'points': 7}, 'Unknown rule'),
+        ({'rule': 'odd_day'}, 'takes the parameters'),
+        ({'rule': 'odd_day', 'points': 6, 'bonus': 1}, 'takes the parameters'),
+        ({'rule': 'total_multiple', 'cents': 0, 'points': 5}, 'cents must be a positive integer'),
+        ({'rule': 'purchase_time_window', 'start': 840, 'end': '16:00', 'points': 10}, "quoted 'HH:MM' time"),
+        ({'rule': 'purchase_date_window', 'start': '2022-13-01', 'end': '2023-01-01', 'points': 10}, 'start'),
+        ('odd_day', 'must be a mapping'),
+    )
+    @ddt.unpack
+    def test_invalid_rule(self, rule, message):
+        with self.assertRaisesMessage(InvalidRules, message):
+            compile_rule_set(2, [rule])
+
+
+class RulesFileTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / 'rules.yaml'
+        shutil.copy(EXAMPLE_RULES, self.path)
+
+    def write(self, document):
+        # JSON is valid YAML; the modification time is moved on so the change is always noticed
+        self.path.write_text(json.dumps(document))
+        modified = self.path.stat().st_mtime_ns + 10 ** 9
+        os.utime(self.path, ns=(modified, modified))
+
+    def test_example_file(self):
+        state = load_rules_file(self.path)
+
+        self.assertEqual(state.current_version, 2)
+        score = state.rule_sets[2].score
+        self.assertEqual(score(*DECEMBER_RECEIPT), calculate_points(*DECEMBER_RECEIPT) + 100)
+        self.assertEqual(score('Walgreens', *DECEMBER_RECEIPT[1:]), calculate_points('Walgreens', *DECEMBER_RECEIPT[1:]))
+
+    def test_invalid_files(self):
+        documents = [
+            ({'rule_sets': [{'version': 1, 'rules': []}]}, 'defined more than once'),
+            ({'rule_sets': [{'rules': []}]}, 'needs a version'),
+            ({'current': 5, 'rule_sets': [{'version': 2, 'rules': []}]}, 'current rules version 5 is not defined'),
+            ({'rule_sets': [{'version': 2, 'rules': [{'rule': 'odd_day'}]}]}, 'Rules version 2: Rule odd_day'),
+            ({'rule_sets': {'version': 2}}, 'must hold a mapping'),
+        ]
+        for document, message in documents:
+            self.write(document)
+            with self.subTest(document=document), self.assertRaisesMessage(InvalidRules, message):
+                load_rules_file(self.path)
+
+        self.path.write_text('rule_sets: [')
+        with self.assertRaisesMessage(InvalidRules, 'Could not read the rules file'):
+            load_rules_file(self.path)
+
+    def test_registry_reloads_changed_file(self):
+        registry = RulesRegistry(self.path, reload_interval=0)
+        in_flight = registry.current()
+        self.write({'current': 3, 'rule_sets': [
+            {'version': 2, 'rules': [{'rule': 'retailer_alphanumerics', 'points': 1}]},
+            {'version': 3, 'rules': [{'rule': 'odd_day', 'points': 6}]},
+        ]})
+
+        # Version 2 may not change, so the reload is refused and the loaded rules keep serving
+        with self.assertLogs('receipt_processor.rules', 'ERROR'):
+            self.assertIs(registry.current(), in_flight)
+        self.assertEqual(registry.stats()['reload_errors'], 1)
+
+        self.write({'current': 3, 'rule_sets': [{'version': 3, 'rules': [{'rule': 'odd_day', 'points': 6}]}]})
+        with self.assertLogs('receipt_processor.rules', 'WARNING'):
+            current = registry.current()
+
+        self.assertEqual((current.version, current.score(*DECEMBER_RECEIPT)), (3, 0))
+        # Version 2 was removed from the file, but receipts scored with it may still be rescored
+        self.assertEqual(registry.versions(), [1, 2, 3])
+        self.assertIs(registry.get(2), in_flight)
+        self.assertEqual(registry.stats(), {'current_version': 3, 'file_versions': 2, 'reloads': 1, 'reload_errors': 1})
+        # Requests that picked up the previous rules finish with them
+        self.assertEqual(in_flight.score(*DECEMBER_RECEIPT), calculate_points(*DECEMBER_RECEIPT) + 100)
+
+    def test_registry_checks_at_most_every_interval(self):
+        registry = RulesRegistry(self.path, reload_interval=3600)
+        self.write({'current': 1, 'rule_sets': []})
+
+        self.assertEqual(registry.current().version, 2)
+
+    def test_unknown_version(self):
+        with self.assertRaises(ValueError):
+            RulesRegistry().get(99)
+
+
+class RulesSettingTests(TestCase):
+
+    def test_receipts_scored_with_the_rules_file(self):
+        with override_settings(RECEIPT_RULES={'PATH': EXAMPLE_RULES}):
+            response = self.client.post(
+                reverse('receipt_processor.receipt'),
+                json.dumps({
+                    'retailer': 'Target',
+                    'purchaseDate': '2022-12-02',
+                    'purchaseTime': '13:13',
+                    'total': '1.25',
+                    'items': [{'shortDescription': 'Pepsi - 12-oz', 'price': '1.25'}]
+                }),
+                content_type='application/json'
+            )
+            points = self.client.get(reverse('receipt_processor.points', args=[response.data['id']]))
+            metrics = self.client.get(reverse('receipt_processor.metrics')).content.decode()
+
+        self.assertEqual(points.data['points'], 31 + 100)
+        self.assertEqual(Receipt.objects.get(id=response.data['id']).rules_version, 2)
+        self.assertIn('receipt_rules_current_version 2', metrics)
+        self.assertIn('receipt_rules_file_versions 1', metrics)
@@ -0,0 +1,229 @@
+"""
+All tests for scoring.py
+"""
+from datetime import date, time
+from decimal import ROUND_CEILING, Decimal
+import os
+import random
+
+import ddt
+
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from receipt_processor.ingest import parse_receipt, store_receipts, warm_scoring_caches
+from receipt_processor.money import parse_cents
+from receipt_processor.scoring import (
+    RETAILER_CACHE_SIZE,
+    RULE_SETS,
+    calculate_points,
+    calculate_points_batch,
+    clear_scoring_caches,
+    description_points_batch,
+    get_rule_set,
+    retailer_points,
+    scoring_cache_stats,
+)
+
+
+@ddt.ddt
+class ScoringTests(SimpleTestCase):
+
+    # Test data = jsons in 'examples' folder & the README
+    @ddt.data(
+        ('Walgreens', date(2022, 1, 2), time(8, 13), 265, [('Pepsi - 12-oz', 125), ('Dasani', 140)], 15),
+        ('Target', date(2022, 1, 2), time(13, 13), 125, [('Pepsi - 12-oz', 125)], 31),
+        ('Target', date(2022, 1, 1), time(13, 1), 3535, [
+            ('Mountain Dew 12PK', 649),
+            ('Emils Cheese Pizza', 1225),
+            ('Knorr Creamy Chicken', 126),
+            ('Doritos Nacho Cheese', 335),
+            ('   Klarbrunn 12-PK 12 FL OZ  ', 1200),
+        ], 28),
+        ('M&M Corner Market', date(2022, 3, 20), time(14, 33), 900, [('Gatorade', 225)] * 4, 109),
+        # 35.00 * 0.2 is 7.000000000000001 in floating point, which used to round up to 8
+        ('Target', date(2022, 1, 2), time(13, 13), 3500, [('Abc', 3500)], 6 + 50 + 25 + 7),
+    )
+    @ddt.unpack
+    def test_calculate_points(self, retailer, purchase_date, purchase_time, total, items, expected_points):
+        points = calculate_points(retailer, purchase_date, purchase_time, total, items)
+        self.assertEqual(points, expected_points)
+
+    def test_batch_matches_single_receipt_scoring(self):
+        rng = random.Random(1234)
+        receipts = []
+        for _ in range(500):
+            items = [
+                (' ' * rng.randint(0, 2) + 'x' * rng.randint(1, 12), rng.randint(0, 5000))
+                for _ in range(rng.randint(1, 6))
+            ]
+            receipts.append((
+                ''.join(rng.choice('Ab1 &-') for _ in range(rng.randint(1, 20))),
+                date(2022, rng.randint(1, 12), rng.randint(1, 28)),
+                time(rng.randint(0, 23), rng.randint(0, 59)),
+                rng.choice([rng.randint(0, 5000), rng.randint(0, 50) * 100, rng.randint(0, 200) * 25]),
+                items,
+            ))
+
+        receipt_index, description_lengths, prices = [], [], []
+        for position, receipt in enumerate(receipts):
+            for short_description, price in receipt[4]:
+                receipt_index.append(position)
+                description_lengths.append(len(short_description.strip()))
+                prices.append(price)
+
+        points = calculate_points_batch(
+            [sum(ch.isalnum() for ch in receipt[0]) for receipt in receipts],
+            [receipt[3] for receipt in receipts],
+            [receipt[1].day for receipt in receipts],
+            [receipt[2].hour * 60 + receipt[2].minute for receipt in receipts],
+            [len(receipt[4]) for receipt in receipts],
+            description_points_batch(receipt_index, description_lengths, prices, len(receipts)),
+        )
+
+        self.assertEqual(list(points), [calculate_points(*receipt) for receipt in receipts])
+
+    def test_rule_set_changes_points(self):
+        receipt = ('M&M Corner Market', date(2022, 3, 20), time(16, 33), 900, [('Gatorade', 225)] * 4)
+        longer_afternoon = RULE_SETS[1]._replace(version=2, afternoon_end=time(17, 0))
+
+        self.assertEqual(calculate_points(*receipt, rules=RULE_SETS[1]), 99)
+        self.assertEqual(calculate_points(*receipt, rules=longer_afternoon), 109)
+        batch_points = calculate_points_batch([14], [900], [20], [16 * 60 + 33], [4], rules=longer_afternoon)
+        self.assertEqual(list(batch_points), [109])
+
+    def test_unknown_rule_set(self):
+        with self.assertRaises(ValueError):
+            get_rule_set(0)
+
+
+class ScoringCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        clear_scoring_caches()
+        self.addCleanup(clear_scoring_caches)
+
+    def test_repeated_retailers_are_cache_hits(self):
+        items = [('Gatorade', 225)] * 4
+        for _ in range(3):
+            self.assertEqual(calculate_points('M&M Corner Market', date(2022, 3, 20), time(14, 33), 900, items), 109)
+
+        self.assertEqual(scoring_cache_stats(), {
+            'hits': 2, 'misses': 1, 'size': 1, 'max_size': RETAILER_CACHE_SIZE, 'hit_rate': 0.6667,
+        })
+
+    def test_cache_is_bounded(self):
+        for number in range(RETAILER_CACHE_SIZE + 10):
+            retailer_points(str(number))
+
+        self.assertEqual(scoring_cache_stats()['size'], RETAILER_CACHE_SIZE)
+
+
+class ScoringCacheWarmUpTests(TestCase):
+
+    def setUp(self):
+        store_receipts([parse_receipt({
+            'retailer': retailer,
+            'purchaseDate': '2022-01-02',
+            'purchaseTime': '13:13',
+            'total': f'{number}.25',
+            'items': [{'shortDescription': 'Pepsi - 12-oz', 'price': f'{number}.25'}],
+        }) for number, retailer in enumerate(['Target', 'Target', 'Walgreens'])])
+        clear_scoring_caches()
+        self.addCleanup(clear_scoring_caches)
+
+    def test_warm_up_from_stored_receipts(self):
+        self.assertEqual(warm_scoring_caches(), 2)
+
+        calculate_points('Walgreens', date(2022, 1, 2), time(13, 13), 125, [('Pepsi - 12-oz', 125)])
+        self.assertEqual(scoring_cache_stats()['hits'], 1)
+
+    def test_metrics_report_the_cache(self):
+        body = self.client.get(reverse('receipt_processor.metrics')).content.decode()
+
+        self.assertIn('receipt_scoring_retailer_cache_size 0', body)
+        self.assertIn(f'receipt_scoring_retailer_cache_max_size {RETAILER_CACHE_SIZE}', body)
+
+
+def reference_points(retailer, purchase_date, purchase_time, total, items):
+    """
+    The README rules applied to the original amount strings with Decimal arithmetic.
+    """
+    points = sum(ch.isalnum() for ch in retailer)
+    total = Decimal(total)
+    if total == total.to_integral_value():
+        points += 50
+    if total % Decimal('0.25') == 0:
+        points += 25
+    points += (len(items) // 2) * 5
+    if purchase_date.day % 2 != 0:
+        points += 6
+    if time(14, 0) <= purchase_time < time(16, 0):
+        points += 10
+    for short_description, price in items:
+        if len(short_description.strip()) % 3 == 0:
+            points += int((Decimal(price) * Decimal('0.2')).to_integral_value(rounding=ROUND_CEILING))
+    return points
+
+
+class ReferenceScoringTests(SimpleTestCase):
+    """
+    Randomized comparison of the integer cents scorers against the Decimal reference scorer.
+
+    Set RECEIPT_SCORING_FUZZ_RECEIPTS to run more receipts, e.g. 5000000 before changing scoring.
+    """
+
+    receipts = int(os.environ.get('RECEIPT_SCORING_FUZZ_RECEIPTS', 20000))
+
+    def random_amount(self, rng):
+        cents = rng.choice([
+            rng.randint(0, 100),
+            rng.randint(0, 10000),
+            rng.randint(0, 10 ** 12),
+            rng.randint(0, 4000) * 5,     # prices where 20% is a whole number of dollars
+            rng.randint(0, 4000) * 25,    # quarter multiples
+            rng.randint(0, 400) * 100,    # round dollars
+        ])
+        return f'{cents // 100}.{cents % 100:02d}'
+
+    def test_matches_reference_scorer(self):
+        rng = random.Random(int(os.environ.get('RECEIPT_SCORING_FUZZ_SEED', 0)))
+        for start in range(0, self.receipts, 10000):
+            receipts = []
+            for _ in range(min(10000, self.receipts - start)):
+                receipts.append((
+                    ''.join(rng.choice('Ab1 &-') for _ in range(rng.randint(1, 30))),
+                    date(2022, rng.randint(1, 12), rng.randint(1, 28)),
+                    time(rng.randint(0, 23), rng.randint(0, 59)),
+                    self.random_amount(rng),
+                    [
+                        (' ' * rng.randint(0, 2) + 'x' * rng.randint(1, 12), self.random_amount(rng))
+                        for _ in range(rng.randint(1, 8))
+                    ],
+                ))
+
+            in_cents = [
+                (retailer, purchase_date, purchase_time, parse_cents(total), [
+                    (short_description, parse_cents(price)) for short_description, price in items
+                ])
+                for retailer, purchase_date, purchase_time, total, items in receipts
+            ]
+            receipt_index, description_lengths, prices = [], [], []
+            for position, receipt in enumerate(in_cents):
+                for short_description, price_cents in receipt[4]:
+                    receipt_index.append(position)
+                    description_lengths.append(len(short_description.strip()))
+                    prices.append(price_cents)
+            batch_points = calculate_points_batch(
+                [sum(ch.isalnum() for ch in receipt[0]) for receipt in in_cents],
+                [receipt[3] for receipt in in_cents],
+                [receipt[1].day for receipt in in_cents],
+                [receipt[2].hour * 60 + receipt[2].minute for receipt in in_cents],
+                [len(receipt[4]) for receipt in in_cents],
+                description_points_batch(receipt_index, description_lengths, prices, len(in_cents)),
+            )
+
+            for receipt, receipt_in_cents, batch in zip(receipts, in_cents, batch_points):
+                expected = reference_points(*receipt)
+                self.assertEqual(calculate_points(*receipt_in_cents), expected, receipt)
+                self.assertEqual(batch, expected, receipt)
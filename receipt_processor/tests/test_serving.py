@@ -0,0 +1,94 @@
+"""
+All tests for serving.py and settings_production.py
+"""
+from pathlib import Path
+from unittest import mock
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from django.test import SimpleTestCase
+
+from receipt_processor.serving import available_cpus, cgroup_cpu_limit, default_workers, env_int
+
+
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+
+PRINT_SETTINGS = '''
+import json
+from django.conf import settings
+json.dump({
+    'debug': settings.DEBUG,
+    'allowed_hosts': settings.ALLOWED_HOSTS,
+    'database': str(settings.DATABASES['default']['NAME']),
+    'journal_mode': settings.SQLITE_PRAGMAS['journal_mode'],
+}, __import__('sys').stdout)
+'''
+
+
+class CpuLimitTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def write(self, name, content):
+        path = self.directory / name
+        path.write_text(content)
+        return str(path)
+
+    def test_cgroup_v2_quota(self):
+        self.assertEqual(cgroup_cpu_limit(cpu_max=self.write('cpu.max', '150000 100000\n')), 1.5)
+        self.assertIsNone(cgroup_cpu_limit(cpu_max=self.write('cpu.max', 'max 100000\n')))
+
+    def test_cgroup_v1_quota(self):
+        missing = str(self.directory / 'missing')
+        quota, period = self.write('quota', '200000'), self.write('period', '100000')
+
+        self.assertEqual(cgroup_cpu_limit(cpu_max=missing, cpu_quota=quota, cpu_period=period), 2)
+        self.assertIsNone(cgroup_cpu_limit(cpu_max=missing, cpu_quota=self.write('unlimited', '-1'), cpu_period=period))
+        self.assertIsNone(cgroup_cpu_limit(cpu_max=missing, cpu_quota=missing, cpu_period=missing))
+
+    def test_quota_caps_the_cpus(self):
+        with mock.patch('receipt_processor.serving.cgroup_cpu_limit', return_value=0.5):
+            self.assertEqual(available_cpus(), 1)
+        with mock.patch('receipt_processor.serving.cgroup_cpu_limit', return_value=None):
+            self.assertGreaterEqual(available_cpus(), 1)
+
+    def test_worker_count(self):
+        self.assertEqual(default_workers(4), 9)
+
+    def test_env_int(self):
+        with mock.patch.dict(os.environ, {'WORKERS': '6', 'EMPTY': ''}):
+            self.assertEqual(env_int('WORKERS', 3), 6)
+            self.assertEqual(env_int('EMPTY', 3), 3)
+            self.assertEqual(env_int('UNSET', 3), 3)
+
+
+class ProductionSettingsTests(SimpleTestCase):
+
+    def load_settings(self, **environ):
+        # Settings are process wide, so the profile is loaded in a fresh interpreter
+        environ = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'receipt_processor.settings_production', **environ}
+        environ = {name: value for name, value in environ.items() if value is not None}
+        return subprocess.run([sys.executable, '-c', PRINT_SETTINGS], cwd=BASE_DIR, capture_output=True, text=True, env=environ)
+
+    def test_settings_from_the_environment(self):
+        result = self.load_settings(DJANGO_SECRET_KEY='secret', DJANGO_ALLOWED_HOSTS='receipts.example.com, localhost',
+                                    DJANGO_DATABASE_PATH='/data/receipts.sqlite3')
+
+        self.assertEqual(json.loads(result.stdout), {
+            'debug': False,
+            'allowed_hosts': ['receipts.example.com', 'localhost'],
+            'database': '/data/receipts.sqlite3',
+            'journal_mode': 'WAL',
+        })
+
+    def test_secret_key_is_required(self):
+        result = self.load_settings(DJANGO_SECRET_KEY=None)
+
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn('Set DJANGO_SECRET_KEY', result.stderr)
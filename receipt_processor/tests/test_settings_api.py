@@ -0,0 +1,67 @@
+"""
+All tests for settings_api.py and urls_api.py
+"""
+from pathlib import Path
+import json
+import os
+import subprocess
+import sys
+
+from django.test import SimpleTestCase
+
+
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+
+# Settings are process wide, so the profile is exercised in a fresh interpreter
+SMOKE_TEST = '''
+import json, sys
+UNNEEDED_MODULES = (
+    'numpy',
+    'django.contrib.auth.middleware',
+    'django.contrib.messages.middleware',
+    'django.contrib.sessions.middleware',
+)
+import django
+from django.conf import settings
+django.setup()
+settings.DATABASES['default']['NAME'] = ':memory:'
+from django.core.management import call_command
+from django.test import Client
+from django.test.utils import setup_test_environment
+setup_test_environment()
+call_command('migrate', verbosity=0)
+
+client = Client()
+receipt = {
+    'retailer': 'Target', 'purchaseDate': '2022-01-02', 'purchaseTime': '13:13', 'total': '1.25',
+    'items': [{'shortDescription': 'Pepsi - 12-oz', 'price': '1.25'}],
+}
+posted = client.post('/receipts/process', json.dumps(receipt), content_type='application/json')
+receipt_id = posted.json()['id']
+points = client.get(f'/receipts/{receipt_id}/points/')
+json.dump({
+    'post': posted.status_code,
+    'points': points.json(),
+    'admin': client.get('/admin/').status_code,
+    'invalid': client.post('/receipts/process', '{}', content_type='application/json').status_code,
+    'loaded': [name for name in UNNEEDED_MODULES if name in sys.modules],
+}, sys.stdout)
+'''
+
+
+class ApiSettingsTests(SimpleTestCase):
+
+    def test_api_profile_serves_the_endpoints(self):
+        output = subprocess.run(
+            [sys.executable, '-c', SMOKE_TEST],
+            cwd=BASE_DIR, check=True, capture_output=True, text=True,
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'receipt_processor.settings_api'},
+        ).stdout
+        result = json.loads(output)
+
+        self.assertEqual(result['post'], 200)
+        self.assertEqual(result['points'], {'points': 31})
+        self.assertEqual(result['invalid'], 400)
+        self.assertEqual(result['admin'], 404)
+        # NumPy is only needed by batch scoring, which the endpoints never use
+        self.assertEqual(result['loaded'], [])
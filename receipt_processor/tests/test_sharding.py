@@ -0,0 +1,190 @@
+"""
+All tests for sharding.py
+"""
+from datetime import date
+from unittest import skipUnless
+import json
+import uuid
+
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from receipt_processor.cache import get_points_cache
+from receipt_processor.models import IdempotencyKey, Item, Receipt
+from receipt_processor.retention import apply_retention
+from receipt_processor.sharding import (
+    ShardRouter,
+    new_receipt_id,
+    receipt_shards,
+    shard_for_content,
+    shard_for_receipt,
+)
+
+
+SHARDS = ['shard_0', 'shard_1', 'shard_2']
+
+
+@override_settings(RECEIPT_SHARDS=SHARDS)
+class ShardSelectionTests(SimpleTestCase):
+
+    def test_receipts_spread_over_all_shards(self):
+        shards = [shard_for_receipt(uuid.uuid4()) for _ in range(300)]
+
+        self.assertEqual(set(shards), set(SHARDS))
+        for shard in SHARDS:
+            self.assertGreater(shards.count(shard), 50)
+
+    def test_shard_is_stable_for_an_id(self):
+        receipt_id = uuid.uuid4()
+
+        self.assertEqual(shard_for_receipt(receipt_id), shard_for_receipt(str(receipt_id)))
+
+    def test_new_receipt_ids_live_with_their_content(self):
+        for number in range(30):
+            content_hash = f'{number:064x}'
+            self.assertEqual(shard_for_receipt(new_receipt_id(content_hash)), shard_for_content(content_hash))
+
+    def test_invalid_receipt_id(self):
+        with self.assertRaises(ValueError):
+            shard_for_receipt('not-a-uuid')
+
+    def test_router_keeps_receipt_tables_on_the_shards(self):
+        router = ShardRouter()
+
+        self.assertTrue(router.allow_migrate('shard_1', 'receipt_processor', 'receipt'))
+        self.assertFalse(router.allow_migrate('default', 'receipt_processor', 'receipt'))
+        self.assertTrue(router.allow_migrate('default', 'auth', 'user'))
+        self.assertFalse(router.allow_migrate('shard_1', 'auth', 'user'))
+        # Idempotency keys are not about one receipt, they stay in the default database
+        self.assertTrue(router.allow_migrate('default', 'receipt_processor', 'idempotencykey'))
+        self.assertFalse(router.allow_migrate('shard_1', 'receipt_processor', 'idempotencykey'))
+        self.assertEqual(router.db_for_write(IdempotencyKey), 'default')
+
+    def test_router_routes_items_with_their_receipt(self):
+        router = ShardRouter()
+        receipt = Receipt(id=uuid.uuid4())
+        item = Item(receipt_id=receipt.id)
+
+        self.assertEqual(router.db_for_write(Receipt, instance=receipt), shard_for_receipt(receipt.id))
+        self.assertEqual(router.db_for_write(Item, instance=item), shard_for_receipt(receipt.id))
+        # Django passes the related object when an item's receipt is assigned
+        self.assertEqual(router.db_for_write(Item, instance=receipt), shard_for_receipt(receipt.id))
+
+
+@override_settings(RECEIPT_SHARDS=[])
+class UnshardedTests(SimpleTestCase):
+
+    def test_everything_on_the_default_database(self):
+        self.assertEqual(receipt_shards(), ['default'])
+        self.assertEqual(shard_for_receipt(uuid.uuid4()), 'default')
+        self.assertEqual(shard_for_content('f' * 64), 'default')
+
+
+@skipUnless(
+    len(getattr(settings, 'RECEIPT_SHARDS', [])) > 1,
+    'run with DJANGO_SETTINGS_MODULE=receipt_processor.settings_sharded',
+)
+class ShardedStorageTests(TestCase):
+
+    databases = '__all__'
+
+    def setUp(self):
+        self.receipts_data = [
+            {
+                'retailer': 'Target',
+                'purchaseDate': '2022-01-02',
+                'purchaseTime': '13:13',
+                'total': f'{number}.25',
+                'items': [{'shortDescription': 'Pepsi - 12-oz', 'price': f'{number}.25'}]
+            }
+            for number in range(40)
+        ]
+
+    def test_receipts_stored_on_their_shard(self):
+        response = self.client.post(
+            reverse('receipt_processor.receipt_batch'),
+            json.dumps(self.receipts_data),
+            content_type='application/json'
+        )
+
+        self.assertEqual(response.data['processed'], 40)
+        for result in response.data['receipts']:
+            shard = shard_for_receipt(result['id'])
+            receipt = Receipt.objects.using(shard).get(id=result['id'])
+            self.assertEqual(receipt.items.count(), 1)
+            self.assertEqual(receipt.items.get().receipt_id, receipt.id)
+
+            points = self.client.get(reverse('receipt_processor.points', args=[result['id']]))
+            self.assertEqual(points.data['points'], result['points'])
+
+            get_points_cache().delete(str(result['id']))
+            points = self.client.get(reverse('receipt_processor.lean_points', args=[result['id']]))
+            self.assertEqual(points.json(), {'points': result['points']})
+
+        self.assertGreater(len({shard_for_receipt(result['id']) for result in response.data['receipts']}), 1)
+
+    def test_receipts_read_back_from_every_shard(self):
+        response = self.client.post(
+            reverse('receipt_processor.receipt_batch'),
+            json.dumps(self.receipts_data),
+            content_type='application/json'
+        )
+        ids = sorted(str(result['id']) for result in response.data['receipts'])
+
+        listed = []
+        cursor = None
+        while cursor is not None or not listed:
+            page = self.client.get(reverse('receipt_processor.receipts'), {'limit': 7, **({'cursor': cursor} if cursor else {})})
+            listed += page.data['receipts']
+            cursor = page.data['next']
+
+        self.assertEqual(sorted(receipt['id'] for receipt in listed), ids)
+        self.assertTrue(all(receipt['items'][0]['price'] == receipt['total'] for receipt in listed))
+        detail = self.client.get(reverse('receipt_processor.receipt_detail', args=[ids[0]]))
+        self.assertEqual(detail.data['id'], ids[0])
+        self.assertEqual(len(detail.data['items']), 1)
+
+    def test_repeat_submission_found_across_shards(self):
+        first = self.client.post(
+            reverse('receipt_processor.receipt'),
+            json.dumps(self.receipts_data[0]),
+            content_type='application/json'
+        )
+        second = self.client.post(
+            reverse('receipt_processor.async_receipt'),
+            json.dumps(self.receipts_data[0]),
+            content_type='application/json'
+        )
+
+        self.assertEqual(str(first.data['id']), second.json()['id'])
+        self.assertEqual(sum(Receipt.objects.using(shard).count() for shard in receipt_shards()), 1)
+
+    def test_aggregates_merge_every_shard(self):
+        self.client.post(
+            reverse('receipt_processor.receipt_batch'),
+            json.dumps(self.receipts_data),
+            content_type='application/json'
+        )
+
+        response = self.client.get(reverse('receipt_processor.analytics_retailers'))
+
+        self.assertEqual(response.data['retailers'][0]['retailer'], 'Target')
+        self.assertEqual(response.data['retailers'][0]['receipts'], 40)
+
+        export = self.client.get(reverse('receipt_processor.export_receipts'))
+        self.assertEqual(b''.join(export.streaming_content).decode().count('\r\n'), 41)
+
+    def test_retention_applied_to_every_shard(self):
+        self.receipts_data[0]['purchaseDate'] = '2021-12-31'
+        self.client.post(
+            reverse('receipt_processor.receipt_batch'),
+            json.dumps(self.receipts_data),
+            content_type='application/json'
+        )
+
+        deleted = sum(apply_retention(date(2022, 1, 2), shard, vacuum='none')['receipts'] for shard in receipt_shards())
+
+        self.assertEqual(deleted, 1)
+        self.assertEqual(sum(Receipt.objects.using(shard).count() for shard in receipt_shards()), 39)
+        self.assertEqual(sum(Item.objects.using(shard).count() for shard in receipt_shards()), 39)
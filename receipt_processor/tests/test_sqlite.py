@@ -0,0 +1,18 @@
+"""
+All tests for sqlite.py
+"""
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from receipt_processor.sqlite import apply_pragmas
+
+
+class ApplyPragmasTests(TestCase):
+
+    @override_settings(SQLITE_PRAGMAS={'cache_size': -1234, 'busy_timeout': 4321})
+    def test_pragmas_applied_to_connection(self):
+        apply_pragmas(sender=None, connection=connection)
+
+        with connection.cursor() as cursor:
+            self.assertEqual(cursor.execute('PRAGMA cache_size').fetchone()[0], -1234)
+            self.assertEqual(cursor.execute('PRAGMA busy_timeout').fetchone()[0], 4321)
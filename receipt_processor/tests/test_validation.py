@@ -0,0 +1,116 @@
+"""
+All tests for validation.py
+"""
+import copy
+import json
+
+import ddt
+
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from receipt_processor.validation import SchemaError, validate_receipt
+
+
+RECEIPT_DATA = {
+    'retailer': 'M&M Corner Market',
+    'purchaseDate': '2022-03-20',
+    'purchaseTime': '14:33',
+    'items': [
+        {'shortDescription': 'Gatorade', 'price': '2.25'},
+        {'shortDescription': 'Gatorade', 'price': '2.25'}
+    ],
+    'total': '4.50'
+}
+
+
+def with_changes(**changes):
+    receipt_data = copy.deepcopy(RECEIPT_DATA)
+    for key, value in changes.items():
+        receipt_data[key] = value
+    return receipt_data
+
+
+@ddt.ddt
+class ValidateReceiptTests(SimpleTestCase):
+
+    def test_valid_receipt(self):
+        validate_receipt(RECEIPT_DATA)
+
+    @ddt.data(
+        (with_changes(retailer='Walgreens!'), 'retailer'),
+        (with_changes(purchaseDate='2022-02-30'), 'purchaseDate'),
+        (with_changes(purchaseDate='02/01/2022'), 'purchaseDate'),
+        (with_changes(purchaseDate='20220102'), 'purchaseDate'),
+        (with_changes(purchaseDate='2022-W01-1'), 'purchaseDate'),
+        (with_changes(purchaseTime='25:00'), 'purchaseTime'),
+        (with_changes(total='4.5'), 'total'),
+        (with_changes(total=4.50), 'total'),
+        (with_changes(total='99999999999999999999999.00'), 'total'),
+        (with_changes(total='10000000000000.00'), 'total'),
+        (with_changes(items=[{'shortDescription': 'Gatorade', 'price': '9' * 5000 + '.00'}]), 'items[0].price'),
+        (with_changes(items=[]), 'items'),
+        (with_changes(items=[{'shortDescription': 'Gatorade', 'price': 'free'}]), 'items[0].price'),
+        (with_changes(items=[{'shortDescription': 'Gatorade'}]), 'items[0]'),
+        (with_changes(items=[{'shortDescription': 'Gatorade; DROP TABLE', 'price': '1.00'}]), 'items[0].shortDescription'),
+    )
+    @ddt.unpack
+    def test_invalid_receipt(self, receipt_data, path):
+        with self.assertRaises(SchemaError) as raised:
+            validate_receipt(receipt_data)
+        self.assertEqual(raised.exception.path, path)
+
+    def test_largest_amount(self):
+        validate_receipt(with_changes(total='0009999999999999.99'))
+
+    @override_settings(RECEIPT_MAX_ITEMS=1)
+    def test_item_count_limit(self):
+        with self.assertRaises(SchemaError) as raised:
+            validate_receipt(RECEIPT_DATA)
+        self.assertEqual(raised.exception.path, 'items')
+
+
+class ValidationViewTests(TestCase):
+
+    def test_invalid_receipt_rejected_before_database_work(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse('receipt_processor.receipt'),
+                json.dumps(with_changes(total='nine dollars')),
+                content_type='application/json'
+            )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(queries), 0)
+
+    def test_amount_too_large_for_storage_rejected(self):
+        receipt_data = with_changes(total='99999999999999999999999.00')
+        responses = [
+            self.client.post(reverse('receipt_processor.receipt'), json.dumps(receipt_data), content_type='application/json'),
+            self.client.post(reverse('receipt_processor.receipt'), json.dumps(receipt_data), content_type='application/json',
+                             headers={'Idempotency-Key': 'large-total'}),
+        ]
+
+        self.assertEqual([response.status_code for response in responses], [400, 400])
+        self.assertIn('amounts may not exceed 9999999999999.99', responses[0].data)
+
+    @override_settings(RECEIPT_MAX_BODY_BYTES=100)
+    def test_body_too_large(self):
+        response = self.client.post(
+            reverse('receipt_processor.receipt'),
+            json.dumps(RECEIPT_DATA),
+            content_type='application/json'
+        )
+
+        self.assertEqual(response.status_code, 413)
+
+    @override_settings(RECEIPT_BATCH_MAX_RECEIPTS=1)
+    def test_batch_too_many_receipts(self):
+        for content_type, body in (
+            ('application/json', json.dumps([RECEIPT_DATA, RECEIPT_DATA])),
+            ('application/x-ndjson', '\n'.join([json.dumps(RECEIPT_DATA)] * 2)),
+        ):
+            response = self.client.post(reverse('receipt_processor.receipt_batch'), body, content_type=content_type)
+            self.assertEqual(response.status_code, 413)
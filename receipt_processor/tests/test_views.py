@@ -1,16 +1,20 @@
 """
 All tests for views.py
 """
+from unittest import mock
 import json
 from django.conf import settings
 
 import ddt
 
 from django.contrib.auth import get_user_model
+from django.db import IntegrityError
 from django.test import TestCase
 from django.urls import reverse
 
-from receipt_processor.models import Item, ItemAssignmentToReceipt, Receipt
+from receipt_processor import ingest
+from receipt_processor.models import Item, Receipt
+from receipt_processor.money import format_cents
 
 User = get_user_model()
 
@@ -149,43 +153,93 @@ class ReceiptViewTests(TestCase):
         self.assertEqual(receipt.retailer, receipt_data['retailer'])
         self.assertEqual(receipt.purchase_date.strftime('%Y-%m-%d'), receipt_data['purchaseDate'])
         self.assertEqual(receipt.purchase_time.strftime('%H:%M'), receipt_data['purchaseTime'])
-        self.assertEqual(str(receipt.total), receipt_data['total'])
+        self.assertEqual(format_cents(receipt.total_cents), receipt_data['total'])
 
         # items created and assigned as expected
-        items = Item.objects.values_list()
+        items = Item.objects.order_by('id').values_list('receipt_id', 'short_description', 'price_cents')
         expected_items = receipt_data['items']
-        item_assignments_to_receipt = ItemAssignmentToReceipt.objects.filter(receipt=receipt_id)
-        for i in range(0, len(expected_items) - 1):
-            item = items[i]
-            expected_item = expected_items[i]
-            assignment = item_assignments_to_receipt[i]
-
+        self.assertEqual(len(items), len(expected_items))
+        for item, expected_item in zip(items, expected_items):
+            self.assertEqual(item[0], receipt.id)  # Match assignment to receipt
             self.assertEqual(item[1], expected_item['shortDescription'])  # Match item description
-            self.assertEqual(str(item[2]), expected_item['price'])  # Match item price
-            self.assertEqual(assignment.item.id, item[0])  # Match assignment to receipt
+            self.assertEqual(format_cents(item[2]), expected_item['price'])  # Match item price
 
         # Points are correct
         self.assertEqual(receipt.points, expected_points)
 
+    def test_repeat_submission_returns_original_receipt(self):
+        responses = [
+            self.client.post(
+                reverse('receipt_processor.receipt'),
+                json.dumps(self.receipt_data),
+                content_type='application/json'
+            )
+            for _ in range(2)
+        ]
+
+        self.assertEqual(responses[0].data['id'], responses[1].data['id'])
+        self.assertEqual(Receipt.objects.count(), 1)
+        self.assertEqual(Item.objects.count(), 2)
+
+    def post_receipt(self):
+        return self.client.post(
+            reverse('receipt_processor.receipt'),
+            json.dumps(self.receipt_data),
+            content_type='application/json'
+        )
+
+    def test_receipt_stored_concurrently_returns_that_receipt(self):
+        first = self.post_receipt()
+        stored = Receipt.objects.get()
+        lookups = [{}, {stored.content_hash: (stored.id, stored.points)}]
+
+        # The first lookup misses the receipt, as if it was committed just after the lookup
+        with mock.patch('receipt_processor.ingest.find_receipts_by_hash', side_effect=lookups):
+            second = self.post_receipt()
+
+        self.assertEqual(second.data['id'], first.data['id'])
+        self.assertEqual(Receipt.objects.count(), 1)
+
+    def test_conflict_that_is_not_a_duplicate_is_raised(self):
+        with mock.patch('receipt_processor.ingest.save_receipts', side_effect=IntegrityError) as save_receipts:
+            with self.assertRaises(IntegrityError):
+                self.post_receipt()
+
+        self.assertEqual(save_receipts.call_count, 3)
+
+    def test_same_header_different_items_are_different_receipts(self):
+        first = self.client.post(
+            reverse('receipt_processor.receipt'),
+            json.dumps(self.receipt_data),
+            content_type='application/json'
+        )
+        self.receipt_data['items'][1]['shortDescription'] = 'Aquafina'
+        second = self.client.post(
+            reverse('receipt_processor.receipt'),
+            json.dumps(self.receipt_data),
+            content_type='application/json'
+        )
+
+        self.assertNotEqual(first.data['id'], second.data['id'])
+        self.assertEqual(Receipt.objects.get(id=first.data['id']).items.count(), 2)
+        self.assertEqual(Receipt.objects.get(id=second.data['id']).items.count(), 2)
+
 
 @ddt.ddt
 class ReceiptPointsViewTests(TestCase):
 
     def setUp(self):
-        self.item = Item.objects.create(
-            short_description='Pepsi - 12-oz',
-            price='1.25'
-        )
         self.receipt = Receipt.objects.create(
             retailer='Walgreens',
             purchase_date='2022-01-02',
             purchase_time='13:13',
-            total='1.25',
+            total_cents=125,
             points=31,
         )
-        ItemAssignmentToReceipt.objects.create(
+        self.item = Item.objects.create(
             receipt=self.receipt,
-            item=self.item,
+            short_description='Pepsi - 12-oz',
+            price_cents=125
         )
 
     # receipt does not exist, exception
@@ -203,3 +257,127 @@ class ReceiptPointsViewTests(TestCase):
         )
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.data['points'], 31)
+
+
+@ddt.ddt
+class ReceiptBatchViewTests(TestCase):
+
+    def setUp(self):
+        self.receipts_data = [
+            {
+                'retailer': 'Walgreens',
+                'purchaseDate': '2022-01-02',
+                'purchaseTime': '08:13',
+                'total': '2.65',
+                'items': [
+                    {'shortDescription': 'Pepsi - 12-oz', 'price': '1.25'},
+                    {'shortDescription': 'Dasani', 'price': '1.40'}
+                ]
+            },
+            {
+                'retailer': 'Target',
+                'purchaseDate': '2022-01-02',
+                'purchaseTime': '13:13',
+                'total': '1.25',
+                'items': [
+                    {'shortDescription': 'Pepsi - 12-oz', 'price': '1.25'}
+                ]
+            },
+        ]
+
+    def test_batch_json_array(self):
+        response = self.client.post(
+            reverse('receipt_processor.receipt_batch'),
+            json.dumps(self.receipts_data),
+            content_type='application/json'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['processed'], 2)
+        self.assertEqual(response.data['failed'], 0)
+        self.assertEqual([result['points'] for result in response.data['receipts']], [15, 31])
+
+        # each receipt stored with its own items
+        for result, receipt_data in zip(response.data['receipts'], self.receipts_data):
+            receipt = Receipt.objects.get(id=result['id'])
+            self.assertEqual(receipt.retailer, receipt_data['retailer'])
+            self.assertEqual(receipt.points, result['points'])
+            self.assertEqual(receipt.items.count(), len(receipt_data['items']))
+
+    def test_batch_ndjson(self):
+        response = self.client.post(
+            reverse('receipt_processor.receipt_batch'),
+            '\n'.join(json.dumps(receipt_data) for receipt_data in self.receipts_data),
+            content_type='application/x-ndjson'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['processed'], 2)
+        self.assertEqual(Receipt.objects.count(), 2)
+
+    def test_batch_reports_invalid_receipts(self):
+        del self.receipts_data[0]['retailer']
+
+        response = self.client.post(
+            reverse('receipt_processor.receipt_batch'),
+            json.dumps(self.receipts_data),
+            content_type='application/json'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['processed'], 1)
+        self.assertEqual(response.data['failed'], 1)
+        self.assertIn('retailer', response.data['receipts'][0]['error'])
+        self.assertEqual(response.data['receipts'][1]['points'], 31)
+        self.assertEqual(Receipt.objects.count(), 1)
+
+    @ddt.data(
+        {'retailer': 'Walgreens'},  # body is not an array
+        'not json',
+    )
+    def test_batch_invalid_body(self, body):
+        response = self.client.post(
+            reverse('receipt_processor.receipt_batch'),
+            body if isinstance(body, str) else json.dumps(body),
+            content_type='application/json'
+        )
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_reports_unexpected_errors_per_receipt(self):
+        def parse_receipt(request_body):
+            if request_body['retailer'] == 'Walgreens':
+                raise ValueError('Exceeds the limit (4300 digits)')
+            return ingest.parse_receipt(request_body)
+
+        with mock.patch('receipt_processor.views.parse_receipt', side_effect=parse_receipt):
+            response = self.client.post(
+                reverse('receipt_processor.receipt_batch'),
+                json.dumps(self.receipts_data),
+                content_type='application/json'
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['processed'], response.data['failed']), (1, 1))
+        self.assertIn('Exceeds the limit', response.data['receipts'][0]['error'])
+        self.assertEqual(response.data['receipts'][1]['points'], 31)
+
+    def test_batch_stores_the_other_receipts_when_one_is_refused(self):
+        original_save_receipts = ingest.save_receipts
+
+        def save_receipts(parsed_receipts):
+            if any(parsed.retailer == 'Walgreens' for parsed in parsed_receipts):
+                raise OverflowError('Python int too large to convert to SQLite INTEGER')
+            return original_save_receipts(parsed_receipts)
+
+        with mock.patch('receipt_processor.ingest.save_receipts', side_effect=save_receipts):
+            response = self.client.post(
+                reverse('receipt_processor.receipt_batch'),
+                json.dumps(self.receipts_data),
+                content_type='application/json'
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['processed'], response.data['failed']), (1, 1))
+        self.assertIn('could not be stored', response.data['receipts'][0]['error'])
+        self.assertEqual(list(Receipt.objects.values_list('retailer', flat=True)), ['Target'])
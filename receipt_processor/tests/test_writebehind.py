@@ -0,0 +1,187 @@
+"""
+All tests for writebehind.py
+"""
+from unittest import mock
+import json
+import time
+
+from django.db import OperationalError
+from django.test import TestCase
+from django.urls import reverse
+
+from receipt_processor.cache import get_points_cache
+from receipt_processor.ingest import find_receipts_by_hash, parse_receipt, store_receipts
+from receipt_processor.models import Receipt, ReceiptAlias
+from receipt_processor.writebehind import QueueFull, WriteBehindQueue
+
+
+class WriteBehindQueueTests(TestCase):
+
+    def parse(self, total='1.25'):
+        return parse_receipt({
+            'retailer': 'Target',
+            'purchaseDate': '2022-01-02',
+            'purchaseTime': '13:13',
+            'total': total,
+            'items': [
+                {'shortDescription': 'Pepsi - 12-oz', 'price': '1.25'}
+            ]
+        })
+
+    def test_pending_until_flushed(self):
+        # The writer thread is not started, so nothing is written until flush()
+        write_behind_queue = WriteBehindQueue(batch_size=2)
+        receipt_ids = [write_behind_queue.submit(self.parse(total)) for total in ('1.25', '2.25', '3.25')]
+
+        self.assertEqual(write_behind_queue.pending_points(str(receipt_ids[0])), 31)
+        self.assertEqual(write_behind_queue.stats()['queue_depth'], 3)
+        self.assertFalse(Receipt.objects.exists())
+
+        write_behind_queue.flush()
+
+        self.assertIsNone(write_behind_queue.pending_points(str(receipt_ids[0])))
+        self.assertEqual(Receipt.objects.filter(id__in=receipt_ids).count(), 3)
+        self.assertEqual(Receipt.objects.get(id=receipt_ids[2]).items.count(), 1)
+        stats = write_behind_queue.stats()
+        self.assertEqual(stats['queue_depth'], 0)
+        self.assertEqual(stats['flushed'], 3)
+        self.assertEqual(stats['batches'], 2)
+        self.assertIsNotNone(stats['last_flush_seconds'])
+
+    def test_receipts_stored_meanwhile_are_skipped(self):
+        write_behind_queue = WriteBehindQueue()
+        receipt_ids = [write_behind_queue.submit(self.parse(total)) for total in ('1.25', '2.25', '3.25')]
+        # Stored by the synchronous endpoints, or another process, while still queued
+        [(stored_id, _)] = store_receipts([self.parse('2.25')])
+
+        write_behind_queue.flush()
+
+        self.assertEqual(Receipt.objects.count(), 3)
+        self.assertEqual(Receipt.objects.filter(id__in=[receipt_ids[0], receipt_ids[2], stored_id]).count(), 3)
+        self.assertEqual(get_points_cache().get(str(receipt_ids[1])), Receipt.objects.get(id=stored_id).points)
+        stats = write_behind_queue.stats()
+        self.assertEqual((stats['flushed'], stats['duplicates'], stats['failed']), (3, 1, 0))
+
+        # The queued id is kept as an alias, and answers once the points cache has dropped it
+        self.assertEqual(ReceiptAlias.objects.get(id=receipt_ids[1]).receipt_id, stored_id)
+        get_points_cache().clear()
+        for name in ('receipt_processor.points', 'receipt_processor.lean_points', 'receipt_processor.async_points'):
+            response = self.client.get(reverse(name, args=[receipt_ids[1]]))
+            self.assertEqual(json.loads(response.content), {'points': Receipt.objects.get(id=stored_id).points}, name)
+
+    def test_receipts_stored_after_the_lookup_are_skipped(self):
+        write_behind_queue = WriteBehindQueue()
+        receipt_ids = [write_behind_queue.submit(self.parse(total)) for total in ('1.25', '2.25')]
+        store_receipts([self.parse('2.25')])
+        # The first lookup misses the stored receipt, as if it was stored just after it
+        lookups = [{}]
+
+        with mock.patch('receipt_processor.writebehind.find_receipts_by_hash',
+                        side_effect=lambda hashes: lookups.pop() if lookups else find_receipts_by_hash(hashes)):
+            write_behind_queue.flush()
+
+        self.assertTrue(Receipt.objects.filter(id=receipt_ids[0]).exists())
+        self.assertEqual(Receipt.objects.count(), 2)
+        stats = write_behind_queue.stats()
+        self.assertEqual((stats['flushed'], stats['duplicates'], stats['failed']), (2, 1, 0))
+
+    def test_lookup_errors_are_retried(self):
+        write_behind_queue = WriteBehindQueue(flush_interval=0)
+        write_behind_queue.submit(self.parse())
+        lookups = [OperationalError('database is locked')]
+
+        def lookup(hashes):
+            if lookups:
+                raise lookups.pop()
+            return find_receipts_by_hash(hashes)
+
+        with mock.patch('receipt_processor.writebehind.find_receipts_by_hash', side_effect=lookup):
+            write_behind_queue.flush()
+
+        self.assertEqual(Receipt.objects.count(), 1)
+        stats = write_behind_queue.stats()
+        self.assertEqual((stats['flushed'], stats['failed'], stats['pending']), (1, 0, 0))
+
+    def test_writer_thread_survives_a_failed_batch(self):
+        write_behind_queue = WriteBehindQueue(batch_size=1, flush_interval=0.01)
+        write_behind_queue.submit(self.parse('1.25'))
+        write_behind_queue.submit(self.parse('2.25'))
+
+        with mock.patch.object(write_behind_queue, '_save', side_effect=[RuntimeError('boom'), []]) as save, \
+                self.assertLogs('receipt_processor.writebehind', 'ERROR'):
+            write_behind_queue.start()
+            deadline = time.monotonic() + 5
+            while save.call_count < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            write_behind_queue.stop()
+
+        self.assertEqual(save.call_count, 2)
+        self.assertEqual(write_behind_queue.stats()['pending'], 0)
+
+    def test_identical_receipts_share_an_id(self):
+        write_behind_queue = WriteBehindQueue()
+        receipt_id = write_behind_queue.submit(self.parse())
+
+        self.assertEqual(write_behind_queue.submit(self.parse()), receipt_id)
+        self.assertEqual(write_behind_queue.stats()['queue_depth'], 1)
+
+    def test_back_pressure_when_full(self):
+        write_behind_queue = WriteBehindQueue(max_queue_size=1, put_timeout=0)
+        write_behind_queue.submit(self.parse('1.25'))
+
+        with self.assertRaises(QueueFull):
+            write_behind_queue.submit(self.parse('2.25'))
+        self.assertEqual(write_behind_queue.stats()['rejected'], 1)
+        self.assertEqual(write_behind_queue.stats()['pending'], 1)
+
+
+class WriteBehindViewTests(TestCase):
+
+    receipt_data = {
+        'retailer': 'Target',
+        'purchaseDate': '2022-01-02',
+        'purchaseTime': '13:13',
+        'total': '1.25',
+        'items': [
+            {'shortDescription': 'Pepsi - 12-oz', 'price': '1.25'}
+        ]
+    }
+
+    def setUp(self):
+        self.write_behind_queue = WriteBehindQueue()
+        patchers = [
+            mock.patch('receipt_processor.views.write_behind_enabled', return_value=True),
+            mock.patch('receipt_processor.views.get_write_behind_queue', return_value=self.write_behind_queue),
+            mock.patch('receipt_processor.views.pending_points', self.write_behind_queue.pending_points),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_points_answered_before_flush(self):
+        response = self.client.post(
+            reverse('receipt_processor.receipt'),
+            json.dumps(self.receipt_data),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        receipt_id = str(response.data['id'])
+        self.assertFalse(Receipt.objects.exists())
+
+        # Even if the points cache has forgotten the receipt, the queue still knows it
+        get_points_cache().delete(receipt_id)
+        response = self.client.get(reverse('receipt_processor.points', args=[receipt_id]))
+        self.assertEqual(response.data['points'], 31)
+
+        self.write_behind_queue.flush()
+        self.assertEqual(Receipt.objects.get(id=receipt_id).points, 31)
+
+    def test_queue_full(self):
+        with mock.patch.object(self.write_behind_queue, 'submit', side_effect=QueueFull('Receipt queue is full')):
+            response = self.client.post(
+                reverse('receipt_processor.receipt'),
+                json.dumps(self.receipt_data),
+                content_type='application/json'
+            )
+
+        self.assertEqual(response.status_code, 503)
@@ -3,7 +3,7 @@ URL mappings for receipt_processor.
 """
 
 from django.urls import path
-from receipt_processor.views import ReceiptView, ReceiptPointsView
+from receipt_processor.urls_api import urlpatterns as api_urlpatterns
 
 app_name = 'receipt-processor-challenge'
 
@@ -11,10 +11,4 @@ from django.contrib import admin
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('receipts/process', ReceiptView.as_view(),
-         name='receipt_processor.receipt'
-        ),
-    path('receipts/<str:receipt_id>/points/', ReceiptPointsView.as_view(),
-         name='receipt_processor.points'
-        ),
-]
+] + api_urlpatterns
@@ -0,0 +1,69 @@
+"""
+URL mappings for the receipt_processor API, without the admin.
+
+The ROOT_URLCONF of the api-only settings profile (settings_api.py); urls.py adds the admin on top.
+"""
+
+from django.urls import path
+from receipt_processor.async_views import AsyncReceiptView, AsyncReceiptPointsView
+from receipt_processor.lean_views import lean_points
+from receipt_processor.views import (
+    DailyAnalyticsView,
+    ExportView,
+    MetricsView,
+    PointsDistributionView,
+    ReceiptBatchView,
+    ReceiptDetailView,
+    ReceiptListView,
+    ReceiptView,
+    ReceiptPointsView,
+    RetailerAnalyticsView,
+)
+
+
+urlpatterns = [
+    path('receipts/process', ReceiptView.as_view(),
+         name='receipt_processor.receipt'
+        ),
+    path('receipts/process/batch', ReceiptBatchView.as_view(),
+         name='receipt_processor.receipt_batch'
+        ),
+    path('receipts', ReceiptListView.as_view(),
+         name='receipt_processor.receipts'
+        ),
+    path('receipts/<str:receipt_id>', ReceiptDetailView.as_view(),
+         name='receipt_processor.receipt_detail'
+        ),
+    path('receipts/<str:receipt_id>/points/', ReceiptPointsView.as_view(),
+         name='receipt_processor.points'
+        ),
+    # Async variants of the endpoints above, for ASGI deployments
+    path('async/receipts/process', AsyncReceiptView.as_view(),
+         name='receipt_processor.async_receipt'
+        ),
+    path('async/receipts/<str:receipt_id>/points/', AsyncReceiptPointsView.as_view(),
+         name='receipt_processor.async_points'
+        ),
+    # Lean variant of the points endpoint, without DRF or the ORM
+    path('lean/receipts/<str:receipt_id>/points/', lean_points,
+         name='receipt_processor.lean_points'
+        ),
+    path('analytics/retailers', RetailerAnalyticsView.as_view(),
+         name='receipt_processor.analytics_retailers'
+        ),
+    path('analytics/daily', DailyAnalyticsView.as_view(),
+         name='receipt_processor.analytics_daily'
+        ),
+    path('analytics/points', PointsDistributionView.as_view(),
+         name='receipt_processor.analytics_points'
+        ),
+    path('export/receipts', ExportView.as_view(table='receipts'),
+         name='receipt_processor.export_receipts'
+        ),
+    path('export/items', ExportView.as_view(table='items'),
+         name='receipt_processor.export_items'
+        ),
+    path('metrics', MetricsView.as_view(),
+         name='receipt_processor.metrics'
+        ),
+]
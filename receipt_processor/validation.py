@@ -0,0 +1,242 @@
+"""
+Request validation for receipts, driven by the Receipt and Item schemas in api.yml.
+
+The schemas are compiled once, on first use, into validator objects (regex patterns included), so
+a payload is checked against the published API before any conversion or database work. Size and
+item-count limits come from settings:
+
+    RECEIPT_MAX_BODY_BYTES        largest POST /receipts/process body accepted
+    RECEIPT_MAX_ITEMS             most items accepted on one receipt
+    RECEIPT_BATCH_MAX_BODY_BYTES  largest POST /receipts/process/batch body accepted
+    RECEIPT_BATCH_MAX_RECEIPTS    most receipts accepted in one batch
+
+api.yml puts no bound on amounts, so they are also checked against money.MAX_CENTS.
+"""
+from datetime import date
+from pathlib import Path
+import functools
+import json
+import re
+
+from django.conf import settings
+
+from receipt_processor.money import MAX_CENTS, format_cents, parse_cents
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+API_SCHEMA_PATH = Path(__file__).resolve().parent.parent / 'api.yml'
+
+DEFAULT_LIMITS = {
+    'RECEIPT_MAX_BODY_BYTES': 64 * 1024,
+    'RECEIPT_MAX_ITEMS': 500,
+    'RECEIPT_BATCH_MAX_BODY_BYTES': 64 * 1024 * 1024,
+    'RECEIPT_BATCH_MAX_RECEIPTS': 50000,
+}
+
+# date.fromisoformat also accepts the basic (20220102) and week (2022-W01-1) forms of ISO 8601
+DATE_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}$', re.ASCII)
+TIME_PATTERN = re.compile(r'^([01]\d|2[0-3]):[0-5]\d$')
+
+
+class SchemaError(ValueError):
+    """
+    Raised when a value does not match the api.yml schema. `path` locates the offending value.
+    """
+
+    def __init__(self, message, path=''):
+        super().__init__(message)
+        self.message = message
+        self.path = path
+
+
+class PayloadTooLarge(ValueError):
+    """
+    Raised when a request body or batch exceeds the configured limits.
+    """
+
+
+def limit(name):
+    return getattr(settings, name, DEFAULT_LIMITS[name])
+
+
+def decode_json(body):
+    """
+    Decode a JSON request body, with orjson when it is installed.
+    """
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def check_content_length(request, max_bytes):
+    """
+    Refuse a request whose declared body size exceeds `max_bytes`, before any of it is read.
+    """
+    content_length = request.META.get('CONTENT_LENGTH')
+    if content_length and int(content_length) > max_bytes:
+        raise PayloadTooLarge(f'Request body of {content_length} bytes exceeds the limit of {max_bytes} bytes')
+
+
+def read_json_body(request, max_bytes):
+    """
+    Decode the JSON body of `request`, refusing bodies larger than `max_bytes`.
+    """
+    check_content_length(request, max_bytes)
+    return decode_json(request.body)
+
+
+def read_stream(stream, max_bytes):
+    """
+    Read a whole request stream, refusing it as soon as it grows past `max_bytes`.
+    """
+    if stream is None:
+        return b''
+    body = stream.read(max_bytes + 1)
+    if len(body) > max_bytes:
+        raise PayloadTooLarge(f'Request body exceeds the limit of {max_bytes} bytes')
+    return body
+
+
+def iter_ndjson(stream, max_bytes, max_records):
+    """
+    Decode newline-delimited JSON from a request stream one line at a time, so a body that is too
+    large, has too many records or is malformed fails at the offending line.
+    """
+    if stream is None:
+        return
+    read = 0
+    records = 0
+    for line in stream:
+        read += len(line)
+        if read > max_bytes:
+            raise PayloadTooLarge(f'Request body exceeds the limit of {max_bytes} bytes')
+        if not line.strip():
+            continue
+        records += 1
+        if records > max_records:
+            raise PayloadTooLarge(f'Batch exceeds the limit of {max_records} receipts')
+        yield decode_json(line)
+
+
+class ObjectValidator:
+
+    def __init__(self, required, properties):
+        self.required = required
+        self.properties = properties
+
+    def validate(self, value, path):
+        if not isinstance(value, dict):
+            raise SchemaError('expected an object', path)
+        for name in self.required:
+            if name not in value:
+                raise SchemaError(f'missing data for the following attribute: {name!r}', path)
+        for name, validator in self.properties.items():
+            if name in value:
+                validator.validate(value[name], f'{path}.{name}' if path else name)
+
+
+class ArrayValidator:
+
+    def __init__(self, items, min_items=None, max_items=None):
+        self.items = items
+        self.min_items = min_items
+        self.max_items = max_items
+
+    def validate(self, value, path):
+        if not isinstance(value, list):
+            raise SchemaError('expected an array', path)
+        if self.min_items is not None and len(value) < self.min_items:
+            raise SchemaError(f'expected at least {self.min_items} entries', path)
+        max_items = self.max_items() if callable(self.max_items) else self.max_items
+        if max_items is not None and len(value) > max_items:
+            raise SchemaError(f'expected at most {max_items} entries', path)
+        for position, entry in enumerate(value):
+            self.items.validate(entry, f'{path}[{position}]')
+
+
+class StringValidator:
+
+    def __init__(self, pattern=None, format=None):
+        self.pattern = re.compile(pattern) if pattern else None
+        self.format = format
+
+    def validate(self, value, path):
+        if not isinstance(value, str):
+            raise SchemaError('expected a string', path)
+        if self.pattern is not None and not self.pattern.fullmatch(value):
+            raise SchemaError(f'{value!r} does not match {self.pattern.pattern}', path)
+        if self.format == 'date':
+            try:
+                if not DATE_PATTERN.fullmatch(value):
+                    raise ValueError(value)
+                date.fromisoformat(value)
+            except ValueError:
+                raise SchemaError(f'{value!r} is not a YYYY-MM-DD date', path)
+        elif self.format == 'time' and not TIME_PATTERN.fullmatch(value):
+            raise SchemaError(f'{value!r} is not a 24-hour HH:MM time', path)
+
+
+def compile_schema(schema, schemas, max_items=None):
+    """
+    Build a validator for an OpenAPI `schema`, resolving $refs against `schemas`.
+
+    `max_items` bounds every array in the schema, as a number or a callable returning one.
+    """
+    if '$ref' in schema:
+        return compile_schema(schemas[schema['$ref'].rsplit('/', 1)[-1]], schemas, max_items)
+    schema_type = schema.get('type')
+    if schema_type == 'object':
+        return ObjectValidator(
+            required=schema.get('required', []),
+            properties={
+                name: compile_schema(property_schema, schemas, max_items)
+                for name, property_schema in schema.get('properties', {}).items()
+            },
+        )
+    if schema_type == 'array':
+        return ArrayValidator(
+            compile_schema(schema['items'], schemas, max_items),
+            min_items=schema.get('minItems'),
+            max_items=schema.get('maxItems', max_items),
+        )
+    if schema_type == 'string':
+        return StringValidator(pattern=schema.get('pattern'), format=schema.get('format'))
+    raise ValueError(f'Unsupported schema type: {schema_type}')
+
+
+def load_receipt_validator(path=API_SCHEMA_PATH):
+    import yaml
+
+    # libyaml's loader, when PyYAML was built with it, parses api.yml several times faster
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    with open(path) as api_file:
+        schemas = yaml.load(api_file, Loader=loader)['components']['schemas']
+    return compile_schema(schemas['Receipt'], schemas, max_items=lambda: limit('RECEIPT_MAX_ITEMS'))
+
+
+@functools.cache
+def get_receipt_validator():
+    """
+    The compiled Receipt validator, loaded on first use so importing this module stays cheap.
+    """
+    return load_receipt_validator()
+
+
+def validate_receipt(request_body):
+    """
+    Check a decoded receipt payload against the api.yml Receipt schema, raising SchemaError.
+    """
+    get_receipt_validator().validate(request_body, '')
+    _validate_amount(request_body['total'], 'total')
+    for position, item in enumerate(request_body['items']):
+        _validate_amount(item['price'], f'items[{position}].price')
+
+
+def _validate_amount(amount, path):
+    # The digits are counted before parse_cents, as int() refuses strings over 4300 digits
+    if len(amount[:-3].lstrip('0')) > len(str(MAX_CENTS // 100)) or parse_cents(amount) > MAX_CENTS:
+        raise SchemaError(f'amounts may not exceed {format_cents(MAX_CENTS)}', path)
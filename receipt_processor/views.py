@@ -1,20 +1,67 @@
 """
 Views for receipt_processor
 """
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views import View
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from receipt_processor.models import Item, ItemAssignmentToReceipt, Receipt
+from receipt_processor.cache import get_points_cache
+from receipt_processor.export import (
+    CONTENT_TYPES,
+    STREAMING_FORMATS,
+    TABLES,
+    arrow_stream_chunks,
+    available_formats,
+    csv_chunks,
+    export_batches,
+)
+from receipt_processor.idempotency import IDEMPOTENCY_HEADER, MAX_KEY_LENGTH, get_idempotency_store, request_fingerprint
+from receipt_processor.ingest import InvalidReceipt, find_receipts_by_hash, parse_receipt, store_receipts
+from receipt_processor.metrics import format_gauges, phase, registry
+from receipt_processor.models import Receipt
+from receipt_processor.retrieval import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    etag_matches,
+    get_receipt,
+    list_receipts,
+    prefetch_items,
+    receipt_document,
+    receipt_etag,
+)
+from receipt_processor.rollups import daily_totals, points_distribution, retailer_totals
+from receipt_processor.rules import get_rules_registry
+from receipt_processor.scoring import scoring_cache_stats
+from receipt_processor.sharding import shard_for_receipt
+from receipt_processor.validation import (
+    PayloadTooLarge,
+    check_content_length,
+    decode_json,
+    iter_ndjson,
+    limit,
+    read_json_body,
+    read_stream,
+)
+from receipt_processor.writebehind import (
+    QueueFull,
+    aliased_points,
+    get_write_behind_queue,
+    pending_points,
+    write_behind_enabled,
+)
 
-from datetime import date, time
-import json
-import math
+from datetime import date
+import time
 
 
 class ReceiptView(APIView):
     """
     Endpoint for storing the data for a receipt.
 
+    A request carrying an Idempotency-Key header that was already answered is replayed from the
+    idempotency store, without the receipt being processed again.
+
     Supports:
         HTTP POST:
             Creates a new Receipt
@@ -24,92 +71,152 @@ class ReceiptView(APIView):
     http_method_names = ['post', 'head']
 
     def post(self, request):
+        idempotency_key = request.headers.get(IDEMPOTENCY_HEADER)
+        if idempotency_key is None:
+            return self.process(request)
+        if not 0 < len(idempotency_key) <= MAX_KEY_LENGTH:
+            return Response(f'{IDEMPOTENCY_HEADER} must be between 1 and {MAX_KEY_LENGTH} characters long', status=400)
+        try:
+            check_content_length(request, limit('RECEIPT_MAX_BODY_BYTES'))
+        except PayloadTooLarge as e:
+            return Response(str(e), status=413)
+
+        store = get_idempotency_store()
+        with phase('idempotency'):
+            fingerprint = request_fingerprint(request.body)
+            stored = store.get(idempotency_key)
+        if stored is not None:
+            if stored.fingerprint != fingerprint:
+                return Response(f'{IDEMPOTENCY_HEADER} {idempotency_key} was already used with a different receipt', status=422)
+            response = Response(data=stored.data, status=stored.status)
+            response['Idempotent-Replayed'] = 'true'
+            return response
+
+        response = self.process(request)
+        # Only successes are kept, a rejected receipt is cheap to reject again
+        if response.status_code == 200:
+            with phase('idempotency'):
+                store.set(idempotency_key, fingerprint, response.status_code, response.data)
+        return response
+
+    def process(self, request):
         try:
-            request_body = json.loads(request.body)
-            retailer = request_body['retailer']
-            purchase_date = request_body['purchaseDate']
-            purchase_time = request_body['purchaseTime']
-            total = request_body['total']
-            items = request_body['items']
-        except KeyError as e:
-            return Response(f'Request receipt data invalid, missing data for the following attribute: {e}', status=400)
+            with phase('parse'):
+                request_body = read_json_body(request, limit('RECEIPT_MAX_BODY_BYTES'))
+            parsed = parse_receipt(request_body)
+        except PayloadTooLarge as e:
+            return Response(str(e), status=413)
+        except InvalidReceipt as e:
+            return Response(str(e), status=400)
         except Exception as e:
             return Response(f'Request receipt data invalid, threw the following exception: {e}', status=400)
 
-        # Data cleaning
-        year, month, day = [int(x) for x in purchase_date.split('-')]
-        hour, minute = [int(x) for x in purchase_time.split(':')]
-
-        purchase_date = date(year=year, month=month, day=day)
-        purchase_time = time(hour=hour, minute=minute)
-        total = float(total)
-
-        # Create a Receipt, (or get if it already exists), extract the id.
-        receipt, _ = Receipt.objects.get_or_create(
-            retailer=retailer,
-            purchase_date=purchase_date,
-            purchase_time=purchase_time,
-            total=total,
-        )
-
-        # Start counting points
-        points = 0
-
-        # One point for every alphanumeric character in the retailer name.
-        numbers = sum(ch.isdigit() for ch in retailer)
-        letters = sum(ch.isalpha() for ch in retailer)
-        points += numbers + letters
-
-        # 50 points if the total is a round dollar amount with no cents.
-        if total.is_integer():
-            points += 50
-
-        # 25 points if the total is a multiple of 0.25.
-        if total % 0.25 == 0:
-            points += 25
-
-        # 5 points for every two items on the receipt.
-        amount_item_pairs = math.floor(len(items) / 2)
-        points += amount_item_pairs * 5
-
-        # 6 points if the day in the purchase date is odd.
-        if day % 2 != 0:
-            points += 6
-
-        # 10 points if the time of purchase is after 2:00pm and before 4:00pm.
-        two_pm = time(hour=14, minute=0, second=0, microsecond=0, tzinfo=None, fold=0)
-        four_pm = time(hour=16, minute=0, second=0, microsecond=0, tzinfo=None, fold=0)
-        purchase_between_two_and_four = two_pm <= purchase_time < four_pm
-        if purchase_between_two_and_four:
-            points += 10
-
-        # Get or create the items
-        # Also count the points for the item descriptions
-        for item in items:
-            short_description = item.get('shortDescription')
-            price = item.get('price')
-            price = float(price)
-            # Note: we need a unique item object for each item to get the counts right
-            item_object = Item.objects.create(
-                    short_description=short_description,
-                    price=price,
-                )
+        if write_behind_enabled():
+            # Hand the receipt to the background writer and answer with its id straight away
+            with phase('persist'):
+                existing = find_receipts_by_hash([parsed.content_hash]).get(parsed.content_hash)
+            if existing is not None:
+                return Response(data={'id': existing[0]}, status=200)
+            try:
+                with phase('enqueue'):
+                    receipt_id = get_write_behind_queue().submit(parsed)
+            except QueueFull as e:
+                return Response(f'Receipt could not be accepted, {e}, try again later', status=503)
+            get_points_cache().set(str(receipt_id), parsed.points)
+            return Response(data={'id': receipt_id}, status=200)
+
+        # Create a Receipt, (or get the id of an identical one if it already exists)
+        with phase('persist'):
+            [(receipt_id, points)] = store_receipts([parsed])
+
+        # Populate the points cache, so the first read of the id is a hit
+        get_points_cache().set(str(receipt_id), points)
+
+        return Response(data={'id': receipt_id}, status=200)
+
+
+class ReceiptBatchView(APIView):
+    """
+    Endpoint for storing many receipts at once.
+
+    Accepts either a JSON array of receipts, or newline-delimited JSON (one receipt per line)
+    when sent with the `application/x-ndjson` content type. All valid receipts are stored in a
+    single transaction; invalid receipts are reported individually and do not stop the batch.
+
+    Supports:
+        HTTP POST:
+            Creates a new Receipt for each valid receipt in the batch
+    """
+
+    permission_classes = (AllowAny,)
+    http_method_names = ['post', 'head']
 
-            # If the trimmed length of the item description is a multiple of 3, multiply the price by 0.2 and round up to the nearest integer.
-            # The result is the number of points earned.
-            trimmed_item_description = short_description.strip()
-            if len(trimmed_item_description) % 3 == 0:
-                points += math.ceil(price * 0.2)
+    def post(self, request):
+        started = time.perf_counter()
 
-            ItemAssignmentToReceipt.objects.create(
-                item=item_object,
-                receipt=receipt,
-            )
+        max_bytes = limit('RECEIPT_BATCH_MAX_BODY_BYTES')
+        max_receipts = limit('RECEIPT_BATCH_MAX_RECEIPTS')
+        try:
+            # The body is read from the stream with our own limits, batches are expected to be
+            # larger than DATA_UPLOAD_MAX_MEMORY_SIZE.
+            check_content_length(request, max_bytes)
+            with phase('parse'):
+                if request.content_type.split(';')[0].strip() == 'application/x-ndjson':
+                    request_bodies = list(iter_ndjson(request.stream, max_bytes, max_receipts))
+                else:
+                    request_bodies = decode_json(read_stream(request.stream, max_bytes))
+                    if not isinstance(request_bodies, list):
+                        raise ValueError('expected an array of receipts')
+                    if len(request_bodies) > max_receipts:
+                        raise PayloadTooLarge(f'Batch exceeds the limit of {max_receipts} receipts')
+        except PayloadTooLarge as e:
+            return Response(str(e), status=413)
+        except Exception as e:
+            return Response(f'Request batch data invalid, threw the following exception: {e}', status=400)
 
-        receipt.points = points
-        receipt.save()
+        results = [None] * len(request_bodies)
+        parsed_receipts = []
+        positions = []
+        for position, request_body in enumerate(request_bodies):
+            try:
+                parsed_receipts.append(parse_receipt(request_body))
+                positions.append(position)
+            except InvalidReceipt as e:
+                results[position] = {'error': str(e)}
+            except Exception as e:
+                results[position] = {'error': f'Request receipt data invalid, threw the following exception: {e}'}
 
-        return Response(data={'id': receipt.id}, status=200)
+        with phase('persist'):
+            try:
+                stored = store_receipts(parsed_receipts)
+            except Exception:
+                # The batch is one transaction per shard; store the receipts one by one so a
+                # receipt the database refuses fails alone
+                stored = []
+                for parsed in parsed_receipts:
+                    try:
+                        stored.extend(store_receipts([parsed]))
+                    except Exception as e:
+                        stored.append(e)
+        processed = 0
+        points_cache = get_points_cache()
+        for position, result in zip(positions, stored):
+            if isinstance(result, Exception):
+                results[position] = {'error': f'Receipt could not be stored, threw the following exception: {result}'}
+                continue
+            receipt_id, points = result
+            points_cache.set(str(receipt_id), points)
+            results[position] = {'id': receipt_id, 'points': points}
+            processed += 1
+
+        elapsed = time.perf_counter() - started
+        return Response(data={
+            'receipts': results,
+            'processed': processed,
+            'failed': len(results) - processed,
+            'elapsed_seconds': round(elapsed, 6),
+            'receipts_per_second': round(processed / elapsed, 2) if elapsed else None,
+        }, status=200)
 
 
 class ReceiptPointsView(APIView):
@@ -124,11 +231,237 @@ class ReceiptPointsView(APIView):
     permission_classes = (AllowAny,)
     http_method_names = ['get', 'head']
 
+    def get(self, request, receipt_id):
+        points_cache = get_points_cache()
+        with phase('cache'):
+            points = points_cache.get(receipt_id)
+            if points is None:
+                points = pending_points(receipt_id)
+        if points is None:
+            # Only the points column is needed, so skip building a Receipt instance
+            try:
+                with phase('lookup'):
+                    receipts = Receipt.objects.using(shard_for_receipt(receipt_id))
+                    points = receipts.filter(id=receipt_id).values_list('points', flat=True).first()
+                    if points is None:
+                        points = aliased_points(receipt_id)
+            except Exception as e:
+                return Response(f'Receipt could not be found for id {receipt_id}, threw the following exception: {e}', status=404)
+            if points is None:
+                return Response(f'Receipt could not be found for id {receipt_id}', status=404)
+            points_cache.set(receipt_id, points)
+
+        return Response(data={'points': points}, status=200)
+
+
+class ReceiptDetailView(APIView):
+    """
+    Endpoint for reading a stored receipt back, with its items.
+
+    Supports:
+        HTTP GET:
+            Get a Receipt, answered with 304 Not Modified when If-None-Match names its ETag
+    """
+
+    permission_classes = (AllowAny,)
+    http_method_names = ['get', 'head']
+
     def get(self, request, receipt_id):
         try:
-            receipt = Receipt.objects.get(id=receipt_id)
+            with phase('lookup'):
+                receipt = get_receipt(receipt_id)
         except Exception as e:
             return Response(f'Receipt could not be found for id {receipt_id}, threw the following exception: {e}', status=404)
+        if receipt is None:
+            return Response(f'Receipt could not be found for id {receipt_id}', status=404)
 
-        points = receipt.points
-        return Response(data={'points': points}, status=200)
+        etag = receipt_etag([receipt])
+        if etag_matches(request.headers.get('If-None-Match'), etag):
+            return Response(status=304, headers={'ETag': etag})
+        with phase('lookup'):
+            prefetch_items([receipt])
+        return Response(data=receipt_document(receipt), status=200, headers={'ETag': etag})
+
+
+class ReceiptListView(APIView):
+    """
+    Endpoint for browsing stored receipts, newest purchase date first, a page at a time.
+
+    Supports:
+        HTTP GET:
+            Get up to `limit` receipts with their items, optionally filtered by `start`/`end` purchase
+            date and `retailer`. The response carries the `next` cursor, passed back as `cursor` for
+            the following page
+    """
+
+    permission_classes = (AllowAny,)
+    http_method_names = ['get', 'head']
+
+    def get(self, request):
+        try:
+            filters = analytics_filters(request.query_params)
+            page_size = int(request.query_params.get('limit', DEFAULT_PAGE_SIZE))
+            if not 0 < page_size <= MAX_PAGE_SIZE:
+                raise ValueError(f'limit must be between 1 and {MAX_PAGE_SIZE}')
+            with phase('lookup'):
+                receipts, next_cursor = list_receipts(
+                    **filters, cursor=request.query_params.get('cursor'), limit=page_size,
+                )
+        except ValueError as e:
+            return Response(f'Request filters invalid, threw the following exception: {e}', status=400)
+
+        etag = receipt_etag(receipts, next_cursor)
+        if etag_matches(request.headers.get('If-None-Match'), etag):
+            return Response(status=304, headers={'ETag': etag})
+        with phase('lookup'):
+            prefetch_items(receipts)
+        return Response(data={
+            'receipts': [receipt_document(receipt) for receipt in receipts],
+            'next': next_cursor,
+        }, status=200, headers={'ETag': etag})
+
+
+def analytics_filters(query_params):
+    """
+    The start, end and retailer filters of an analytics request. Raises ValueError on a malformed date.
+    """
+    start = query_params.get('start')
+    end = query_params.get('end')
+    return {
+        'start': date.fromisoformat(start) if start else None,
+        'end': date.fromisoformat(end) if end else None,
+        'retailer': query_params.get('retailer') or None,
+    }
+
+
+class RetailerAnalyticsView(APIView):
+    """
+    Endpoint for receipt counts and points per retailer, served from the rollup tables.
+
+    Supports:
+        HTTP GET:
+            Get the totals per retailer, optionally filtered by `start`/`end` purchase date and `retailer`
+    """
+
+    permission_classes = (AllowAny,)
+    http_method_names = ['get', 'head']
+
+    def get(self, request):
+        try:
+            filters = analytics_filters(request.query_params)
+        except ValueError as e:
+            return Response(f'Request filters invalid, threw the following exception: {e}', status=400)
+
+        with phase('lookup'):
+            rows = retailer_totals(**filters)
+        return Response(data={'retailers': [
+            {'retailer': retailer, 'receipts': receipts, 'points': points}
+            for retailer, receipts, points in rows
+        ]}, status=200)
+
+
+class DailyAnalyticsView(APIView):
+    """
+    Endpoint for receipt counts and points per purchase date, served from the rollup tables.
+
+    Supports:
+        HTTP GET:
+            Get the totals per day, optionally filtered by `start`/`end` purchase date and `retailer`
+    """
+
+    permission_classes = (AllowAny,)
+    http_method_names = ['get', 'head']
+
+    def get(self, request):
+        try:
+            filters = analytics_filters(request.query_params)
+        except ValueError as e:
+            return Response(f'Request filters invalid, threw the following exception: {e}', status=400)
+
+        with phase('lookup'):
+            rows = daily_totals(**filters)
+        return Response(data={'days': [
+            {'date': purchase_date, 'receipts': receipts, 'points': points}
+            for purchase_date, receipts, points in rows
+        ]}, status=200)
+
+
+class PointsDistributionView(APIView):
+    """
+    Endpoint for the distribution of points over receipts, served from the rollup tables.
+
+    Supports:
+        HTTP GET:
+            Get the number of receipts per points range, `bucket` points wide (default 1)
+    """
+
+    permission_classes = (AllowAny,)
+    http_method_names = ['get', 'head']
+
+    def get(self, request):
+        try:
+            bucket_size = int(request.query_params.get('bucket', 1))
+            if bucket_size < 1:
+                raise ValueError('bucket must be a positive integer')
+        except ValueError as e:
+            return Response(f'Request filters invalid, threw the following exception: {e}', status=400)
+
+        with phase('lookup'):
+            rows = points_distribution(bucket_size)
+        return Response(data={'bucket_size': bucket_size, 'distribution': [
+            {'points': points, 'receipts': receipts}
+            for points, receipts in rows
+        ]}, status=200)
+
+
+class ExportView(View):
+    """
+    Endpoint streaming every stored receipt, or their items, as CSV or an Arrow IPC stream.
+
+    Supports:
+        HTTP GET:
+            Stream the rows, optionally filtered by `start`/`end` purchase date and `retailer`, in the
+            `format` given (csv by default, arrow if pyarrow is installed)
+    """
+
+    http_method_names = ['get', 'head']
+    table = 'receipts'
+
+    def get(self, request):
+        try:
+            filters = analytics_filters(request.GET)
+        except ValueError as e:
+            return HttpResponse(f'Request filters invalid, threw the following exception: {e}', status=400)
+        export_format = request.GET.get('format', 'csv')
+        if export_format not in STREAMING_FORMATS or export_format not in available_formats():
+            return HttpResponse(f'Export format {export_format} is not available', status=400)
+
+        columns = TABLES[self.table][1]
+        batches = export_batches(self.table, **filters)
+        chunks = csv_chunks(columns, batches) if export_format == 'csv' else arrow_stream_chunks(columns, batches)
+        response = StreamingHttpResponse(chunks, content_type=CONTENT_TYPES[export_format])
+        response['Content-Disposition'] = f'attachment; filename="{self.table}.{export_format}"'
+        return response
+
+
+class MetricsView(View):
+    """
+    Endpoint exposing request metrics in the Prometheus text format.
+
+    Supports:
+        HTTP GET:
+            Get the request histograms, points cache, idempotency store, retailer points cache, point
+            rules and write-behind queue statistics
+    """
+
+    http_method_names = ['get', 'head']
+
+    def get(self, request):
+        lines = [registry.render().rstrip('\n')]
+        lines += format_gauges('receipt_points_cache', 'Points cache', get_points_cache().stats())
+        lines += format_gauges('receipt_idempotency', 'Idempotency store', get_idempotency_store().stats())
+        lines += format_gauges('receipt_scoring_retailer_cache', 'Retailer points cache', scoring_cache_stats())
+        lines += format_gauges('receipt_rules', 'Point rules', get_rules_registry().stats())
+        if write_behind_enabled():
+            lines += format_gauges('receipt_write_behind', 'Write-behind queue', get_write_behind_queue().stats())
+        return HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,324 @@
+"""
+Write-behind persistence for POST /receipts/process.
+
+When RECEIPT_WRITE_BEHIND['ENABLED'] is set, ReceiptView validates and scores a receipt in
+memory, assigns its id and responds straight away. A background thread drains the queued
+receipts into the database in batched transactions.
+
+    RECEIPT_WRITE_BEHIND = {
+        'ENABLED': False,
+        'MAX_QUEUE_SIZE': 10000,  # receipts waiting to be written before submit() pushes back
+        'BATCH_SIZE': 500,        # receipts written per transaction
+        'FLUSH_INTERVAL': 0.05,   # seconds the writer waits to fill a batch
+        'PUT_TIMEOUT': 1.0,       # seconds submit() blocks on a full queue before raising QueueFull
+        'MAX_RETRIES': 3,         # attempts per batch before it is dropped and logged
+    }
+
+The queue lives in the process that accepted the receipt, so accepted but unflushed receipts are
+only visible to that process.
+
+A queued receipt can be stored meanwhile by the synchronous endpoints or another process. The
+writer skips those and stores the queued id as a ReceiptAlias of the stored receipt, which the
+points endpoints fall back to (see aliased_points), so the id the client holds keeps answering.
+"""
+from queue import Empty, Full, Queue
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import IntegrityError, connections
+from django.dispatch import receiver
+
+from receipt_processor.cache import get_points_cache
+from receipt_processor.ingest import find_receipts_by_hash, save_receipts
+from receipt_processor.models import ReceiptAlias
+from receipt_processor.sharding import new_receipt_id, shard_for_receipt
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    'MAX_QUEUE_SIZE': 10000,
+    'BATCH_SIZE': 500,
+    'FLUSH_INTERVAL': 0.05,
+    'PUT_TIMEOUT': 1.0,
+    'MAX_RETRIES': 3,
+}
+
+
+class QueueFull(Exception):
+    """
+    Raised by WriteBehindQueue.submit when the writer has fallen too far behind.
+    """
+
+
+class WriteBehindQueue:
+    """
+    Bounded queue of scored receipts, drained into the database by a single writer thread.
+    """
+
+    def __init__(self, max_queue_size=10000, batch_size=500, flush_interval=0.05, put_timeout=1.0, max_retries=3):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.max_retries = max_retries
+        self._queue = Queue(maxsize=max_queue_size)
+        self._pending = {}  # receipt id -> points, for receipts accepted but not yet written
+        self._pending_hashes = {}  # content hash -> receipt id, for the same receipts
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+        self.accepted = 0
+        self.rejected = 0
+        self.flushed = 0
+        self.failed = 0
+        self.duplicates = 0
+        self.batches = 0
+        self.last_flush_seconds = None
+        self.max_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='receipt-write-behind', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """
+        Stop the writer thread, writing out everything still queued.
+        """
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def submit(self, parsed):
+        """
+        Queue a ParsedReceipt for writing and return its newly assigned id.
+
+        A receipt identical to one that is still queued gets that receipt's id instead. Blocks for
+        up to `put_timeout` seconds when the queue is full, then raises QueueFull.
+        """
+        with self._pending_lock:
+            receipt_id = self._pending_hashes.get(parsed.content_hash)
+            if receipt_id is not None:
+                return receipt_id
+            receipt_id = new_receipt_id(parsed.content_hash)
+            self._pending[str(receipt_id)] = parsed.points
+            self._pending_hashes[parsed.content_hash] = receipt_id
+        try:
+            self._queue.put((receipt_id, parsed), timeout=self.put_timeout)
+        except Full:
+            with self._pending_lock:
+                del self._pending[str(receipt_id)]
+                del self._pending_hashes[parsed.content_hash]
+            self.rejected += 1
+            raise QueueFull('Receipt queue is full')
+        self.accepted += 1
+        return receipt_id
+
+    def pending_points(self, receipt_id):
+        """
+        Points for a receipt that has been accepted but not written yet, or None.
+        """
+        with self._pending_lock:
+            return self._pending.get(receipt_id)
+
+    def flush(self):
+        """
+        Write everything currently queued, in batches, from the calling thread.
+        """
+        while self._write_batch(block=False):
+            pass
+
+    def stats(self):
+        return {
+            'queue_depth': self._queue.qsize(),
+            'queue_max_size': self._queue.maxsize,
+            'pending': len(self._pending),
+            'accepted': self.accepted,
+            'rejected': self.rejected,
+            'flushed': self.flushed,
+            'failed': self.failed,
+            'duplicates': self.duplicates,
+            'batches': self.batches,
+            'last_flush_seconds': self.last_flush_seconds,
+            'max_flush_seconds': self.max_flush_seconds,
+            'mean_flush_seconds': self.total_flush_seconds / self.batches if self.batches else None,
+        }
+
+    def _run(self):
+        try:
+            while not self._stopping.is_set():
+                try:
+                    self._write_batch(block=True)
+                except Exception:
+                    # _save drops what it cannot write, anything else must not stop the writer
+                    logger.exception('Write-behind batch failed')
+        finally:
+            connections.close_all()
+
+    def _write_batch(self, block):
+        """
+        Take up to `batch_size` receipts off the queue and write them. Returns the number taken.
+        """
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=self.flush_interval) if block else self._queue.get_nowait())
+            while len(batch) < self.batch_size:
+                batch.append(self._queue.get_nowait())
+        except Empty:
+            pass
+        if not batch:
+            return 0
+
+        try:
+            with self._flush_lock:
+                started = time.perf_counter()
+                written = self._save(batch)
+                elapsed = time.perf_counter() - started
+
+            points_cache = get_points_cache()
+            for receipt_id, points in written:
+                points_cache.set(str(receipt_id), points)
+        finally:
+            with self._pending_lock:
+                for receipt_id, parsed in batch:
+                    self._pending.pop(str(receipt_id), None)
+                    self._pending_hashes.pop(parsed.content_hash, None)
+
+        self.flushed += len(written)
+        self.batches += 1
+        self.last_flush_seconds = elapsed
+        self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+        self.total_flush_seconds += elapsed
+        return len(batch)
+
+    def _save(self, batch):
+        """
+        Store a list of (receipt id, ParsedReceipt), skipping receipts whose content is already
+        stored. Returns the (queued receipt id, points) of every receipt written or found stored.
+
+        The lookup and the insert are retried together, up to `max_retries` times, after which the
+        batch is dropped and logged.
+        """
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                return self._save_once(batch)
+            except IntegrityError as e:
+                if len(batch) > 1:
+                    # Stored concurrently since the lookup, write the receipts one at a time so
+                    # only the conflicting ones are retried
+                    return [entry for receipt in batch for entry in self._save([receipt])]
+                error = e
+            except Exception as e:
+                error = e
+            if attempt == self.max_retries:
+                logger.error('Dropping %d queued receipts after %d failed writes', len(batch), attempt, exc_info=error)
+                self.failed += len(batch)
+                return []
+            time.sleep(self.flush_interval * attempt)
+
+    def _save_once(self, batch):
+        existing = find_receipts_by_hash([parsed.content_hash for _, parsed in batch])
+        found = [(receipt_id, existing[parsed.content_hash]) for receipt_id, parsed in batch if parsed.content_hash in existing]
+        new = [(receipt_id, parsed) for receipt_id, parsed in batch if parsed.content_hash not in existing]
+        if found:
+            save_aliases([(receipt_id, stored_id) for receipt_id, (stored_id, _) in found])
+        if new:
+            save_receipts([parsed for _, parsed in new], receipt_ids=[receipt_id for receipt_id, _ in new])
+        self.duplicates += len(found)
+        return (
+            [(receipt_id, points) for receipt_id, (_, points) in found]
+            + [(receipt_id, parsed.points) for receipt_id, parsed in new]
+        )
+
+
+def save_aliases(aliases):
+    """
+    Store (alias id, receipt id) pairs. An alias lives on its receipt's shard, as both ids were
+    drawn for the same content (see sharding.new_receipt_id).
+    """
+    by_shard = {}
+    for alias_id, receipt_id in aliases:
+        by_shard.setdefault(shard_for_receipt(receipt_id), []).append(ReceiptAlias(id=alias_id, receipt_id=receipt_id))
+    for shard, shard_aliases in by_shard.items():
+        ReceiptAlias.objects.using(shard).bulk_create(shard_aliases, ignore_conflicts=True)
+
+
+def aliased_points(receipt_id):
+    """
+    Points of the stored receipt `receipt_id` is an alias of, or None.
+    """
+    aliases = ReceiptAlias.objects.using(shard_for_receipt(receipt_id))
+    return aliases.filter(id=receipt_id).values_list('receipt__points', flat=True).first()
+
+
+_write_behind_queue = None
+_write_behind_queue_lock = threading.Lock()
+
+
+def write_behind_config():
+    return {**DEFAULTS, **getattr(settings, 'RECEIPT_WRITE_BEHIND', {})}
+
+
+def write_behind_enabled():
+    return write_behind_config()['ENABLED']
+
+
+def get_write_behind_queue():
+    """
+    Return the process wide write-behind queue, starting its writer thread on first use.
+
+    The queue is flushed when the interpreter exits.
+    """
+    global _write_behind_queue
+    if _write_behind_queue is None:
+        with _write_behind_queue_lock:
+            if _write_behind_queue is None:
+                config = write_behind_config()
+                write_behind_queue = WriteBehindQueue(
+                    max_queue_size=config['MAX_QUEUE_SIZE'],
+                    batch_size=config['BATCH_SIZE'],
+                    flush_interval=config['FLUSH_INTERVAL'],
+                    put_timeout=config['PUT_TIMEOUT'],
+                    max_retries=config['MAX_RETRIES'],
+                )
+                write_behind_queue.start()
+                atexit.register(write_behind_queue.stop)
+                _write_behind_queue = write_behind_queue
+    return _write_behind_queue
+
+
+def pending_points(receipt_id):
+    """
+    Points for an accepted but unflushed receipt in this process, or None.
+    """
+    if _write_behind_queue is None:
+        return None
+    return _write_behind_queue.pending_points(receipt_id)
+
+
+def reset_write_behind_queue():
+    """
+    Stop and drop the process wide queue, so the next get_write_behind_queue() rebuilds it from settings.
+    """
+    global _write_behind_queue
+    with _write_behind_queue_lock:
+        if _write_behind_queue is not None:
+            _write_behind_queue.stop()
+            atexit.unregister(_write_behind_queue.stop)
+        _write_behind_queue = None
+
+
+@receiver(setting_changed)
+def _reset_write_behind_queue_on_setting_changed(setting, **kwargs):
+    if setting == 'RECEIPT_WRITE_BEHIND':
+        reset_write_behind_queue()
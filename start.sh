@@ -1 +1,9 @@
-pip install -r requirements.txt
\ No newline at end of file
+#!/bin/sh
+# Entry point of the container: apply migrations, then serve with gunicorn (see gunicorn.conf.py).
+# For local development, `python manage.py runserver` is still the quickest way to run the app.
+set -e
+
+python manage.py migrate --noinput
+
+# exec, so gunicorn is PID 1 and receives the SIGTERM (graceful shutdown) and SIGHUP (reload) sent to the container
+exec gunicorn "${GUNICORN_APP:-receipt_processor.wsgi}"